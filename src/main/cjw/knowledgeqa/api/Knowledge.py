@@ -1,3 +1,40 @@
+import logging
+import os
+from typing import Optional
+
+from cjw.knowledgeqa.bots.Bot import Bot
+from cjw.knowledgeqa.bots.GptBot import GptBot
+
+
 class Knowledge:
-    def __init__(self):
-        ...
+    """The knowledge served by the API: a bot answering the questions."""
+
+    logger = logging.getLogger(__qualname__)
+
+    def __init__(self, bot: Bot = None):
+        """ The constructor
+
+        Args:
+            bot (Bot): The bot answering the questions.  (default a GptBot of the model in the environment variable
+                KNOWLEDGE_MODEL, created on the first question)
+        """
+        self.__bot: Optional[Bot] = bot
+
+    @property
+    def bot(self) -> Bot:
+        if not self.__bot:
+            self.__bot = GptBot.of(os.environ.get("KNOWLEDGE_MODEL"))
+        return self.__bot
+
+    def warmup(self):
+        """Loads the models of the bot given, e.g. its embedding, so that the first question is answered fast.
+        It blocks.  The default bot has no local models, and is not created by it."""
+        if not self.__bot:
+            return
+
+        try:
+            self.__bot.warmup()
+            self.logger.info("Warmed up")
+        except Exception as e:
+            # The models will be loaded again at the first question
+            self.logger.warning(f"Warming up failed: {e}")
@@ -1,9 +1,16 @@
+import asyncio
+import json
+
 import uvicorn
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 
 from cjw.knowledgeqa.api.Knowledge import Knowledge
+from cjw.knowledgeqa.bots.Answer import Answer
+from cjw.utilities.llm.GptPortal import GptPortal
 
 app = FastAPI()
+knowledge = Knowledge()
 
 
 @app.get("/knowledge")
@@ -11,6 +18,38 @@ async def ask():
     return {"message": "Hello there"}
 
 
+@app.get("/knowledge/stream")
+async def stream(question: str):
+    """Answers a question as server-sent events, a "delta" event for every piece of the answer as it is generated,
+    then a "done" event with the whole answer and its citations."""
+    pieces = await knowledge.bot.ask(question, stream=True)
+
+    async def events():
+        text = ""
+        try:
+            async for piece in pieces:
+                text += piece
+                yield f"event: delta\ndata: {json.dumps({'content': piece})}\n\n"
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+            return
+
+        answer = Answer.of(text)
+        yield f"event: done\ndata: {json.dumps({'content': answer.content, 'citations': answer.citations})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.on_event("startup")
+async def startup():
+    # Models are loaded in the background, while the server already accepts connections
+    asyncio.get_running_loop().run_in_executor(None, knowledge.warmup)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await GptPortal.closeAll()
+
+
 if __name__ == '__main__':
-    knowledge = Knowledge()
     uvicorn.run(app, host="0.0.0.0", port=8000)
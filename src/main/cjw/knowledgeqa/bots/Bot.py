@@ -30,6 +30,12 @@ class Bot(ABC):
         self._indexerArgs = kwargs
         return self
 
+    def warmup(self):
+        """Loads the models of the known facts, if any, so that the first question is answered without waiting for
+        them.  It blocks."""
+        if self._indexer:
+            self._indexer.warmup()
+
     @abstractmethod
     async def ask(self, question: str, **kwargs) -> Answer:
         """  Ask the bot a question.
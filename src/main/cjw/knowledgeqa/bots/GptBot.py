@@ -1,11 +1,12 @@
 import logging
 import os
-from typing import TypeVar, Optional
+from typing import TypeVar, Optional, AsyncIterator
 
 from cjw.knowledgeqa.bots.Answer import Answer
 from cjw.knowledgeqa.bots.Bot import Bot
 from cjw.utilities.llm.ChatPrompt import ChatPrompt
 from cjw.utilities.llm.GptPortal import GptPortal
+from cjw.utilities.llm.TokenCounter import TokenCounter
 
 
 class GptBot(Bot):
@@ -123,35 +124,27 @@ class GptBot(Bot):
         self._portal = GptPortal.of(accessKey)
         return self
 
-    async def ask(self, question: str, **kwargs) -> Answer:
-        """ Ask GptBot a question.
+    async def _prompt(self, question: str, restricted: bool = True) -> ChatPrompt:
+        """ Constructs the prompt of a question, with the facts found for it if RAG is used.
 
         Args:
             question (str): The question
-            **kwargs:
-                - restricted (bool): True if the bot shall answer strictly from the given fact. (default True)
-                - idField (str): Which field of the indexed facts is used for citation. (default "_id")
-                - contentFields (List[str]): Which fields of the indexed facts are used to construct the prompt.  (default ["text"])
-                - maxToken (int): Max number of tokens for the prompt. (default DEFAULT_MAX_TOKENS)
-                - temperature (float): How creative the Bot should be. (default DEFAULT_TEMPERATURE)
+            restricted (bool): True if the bot shall answer strictly from the given fact.
 
         Returns:
-            The :class:`Answer`.
+            The prompt
         """
-        if not self._portal:
-            self.withKey()
-
         prompt = ChatPrompt(bot="assistant")    # GPT uses "assistant" to identify the AI
 
         # Construct the instruction prompt
-        restricted = kwargs.pop("restricted", True)
         if self._indexer:
             instruction = self.__INSTRUCTION_WITH_FACTS_ONLY if restricted else self.__INSTRUCTION_WITH_UPDATES
         else:
             instruction = self.__INSTRUCTION
 
         prompt.system(instruction)
-        numTokens = self._portal.estimateTokens(instruction)
+        counter = TokenCounter.of(self.model if self.model != "default" else None)
+        numTokens = counter.count(instruction)
 
         # If RAG is used, construct the prompt with known facts.
         if self._indexer:
@@ -165,9 +158,9 @@ class GptBot(Bot):
 
             # Put the facts together into a prompt.  The result of the search shall be sorted by their similarities.
             facts = dict()
-            for f in found:
-                content = " -- ".join([f.get(c, "") for c in contentFields])    # Join all content fields together
-                numTokens += self._portal.estimateTokens(content)   # Count the token
+            contents = [" -- ".join([f.get(c, "") for c in contentFields]) for f in found]   # Join all content fields
+            for f, content, tokens in zip(found, contents, counter.countBatch(contents)):
+                numTokens += tokens     # Count the token
                 if numTokens > maxTokens:
                     # Too many tokens.  Ignore some low-score facts
                     break
@@ -181,16 +174,40 @@ class GptBot(Bot):
 
         # Add user question to the prompt
         prompt.user(question)
+        return prompt
+
+    async def ask(self, question: str, stream: bool = False, **kwargs) -> Answer | AsyncIterator[str]:
+        """ Ask GptBot a question.
+
+        Args:
+            question (str): The question
+            stream (bool): True to get the answer as it is generated, as an async iterator of the pieces of its text.
+                The citations are left in the text.  Join the pieces with :meth:`Answer.of` for the Answer.
+                (default False)
+            **kwargs:
+                - restricted (bool): True if the bot shall answer strictly from the given fact. (default True)
+                - idField (str): Which field of the indexed facts is used for citation. (default "_id")
+                - contentFields (List[str]): Which fields of the indexed facts are used to construct the prompt.  (default ["text"])
+                - maxToken (int): Max number of tokens for the prompt. (default DEFAULT_MAX_TOKENS)
+                - temperature (float): How creative the Bot should be. (default DEFAULT_TEMPERATURE)
+
+        Returns:
+            The :class:`Answer`, or the pieces of its text if streamed.
+        """
+        if not self._portal:
+            self.withKey()
+
+        prompt = await self._prompt(question, kwargs.pop("restricted", True))
 
         # Invoke chat_completion API of GPT
         if "temperature" not in kwargs:
             kwargs["temperature"] = self.DEFAULT_TEMPERATURE
 
         self.logger.info(f"Question:\n{question}")
+        if stream:
+            return self._portal.streamChatCompletion(prompt.messages, **kwargs)
+
         responses = await self._portal.chatCompletion(prompt.messages, **kwargs)
         self.logger.info(f"Answer:\n{responses['content']}")
 
         return Answer.of(responses["content"])
-
-
-
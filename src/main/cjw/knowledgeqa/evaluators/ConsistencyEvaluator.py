@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import random
 from typing import List
@@ -13,8 +12,13 @@ class ConsistencyEvaluator(Evaluator):
 
     logger = logging.getLogger(__qualname__)
 
-    def __init__(self, sampleQuestions: List[str], embedding: Embedding):
-        super().__init__()
+    def __init__(
+            self,
+            sampleQuestions: List[str],
+            embedding: Embedding,
+            concurrency: int = Evaluator.DEFAULT_CONCURRENCY
+    ):
+        super().__init__(concurrency)
         self.__sampleQuestions = sampleQuestions
         self.__embedding = embedding
 
@@ -29,12 +33,6 @@ class ConsistencyEvaluator(Evaluator):
         pairs = np.stack(np.triu_indices(len(vectors), k=1), axis=1)
         return np.array([cls._similarity(t[0], t[1]) for t in vectors[pairs]])
 
-    async def _question2embedding(self, question: str) -> np.ndarray:
-        # Ask the bot a question, and then embed its answer
-        answer = await self._bot.ask(question)
-        self.logger.info(f"Answer: {answer}")
-        return await self.__embedding.embed(answer.content)
-
     async def evaluate(self, sampleSize: int = 0, tries: int = 3) -> float:
         """Evaluate the :class:`Bot`
 
@@ -54,13 +52,19 @@ class ConsistencyEvaluator(Evaluator):
         # Pick the questions
         questions = random.sample(self.__sampleQuestions, sampleSize) if sampleSize else self.__sampleQuestions
 
-        score = 0.0
-        for q in questions:
-            # For each question, ask the bot many times in parallel, and gather all the results
-            embeddings = asyncio.gather(*[self._question2embedding(q) for _ in range(tries)])
+        # Ask the bot each question many times, a few at a time, and gather all the results
+        answers = await self._askAll([q for q in questions for _ in range(tries)])
+        for answer in answers:
+            self.logger.info(f"Answer: {answer}")
 
+        # Embed all the answers in a batch, and then group them by the questions
+        vectors = await self.__embedding.embedBatch([answer.content for answer in answers])
+        embeddings = [vectors[i:i + tries] for i in range(0, len(vectors), tries)]
+
+        score = 0.0
+        for e in embeddings:
             # Get the pairwise similarities.  Then, take the mean as the score.
-            similarity = self._pairwiseSimilarity(np.array(await embeddings))
+            similarity = self._pairwiseSimilarity(np.array(e))
             score += np.mean(similarity)
 
         # Calculate the final score
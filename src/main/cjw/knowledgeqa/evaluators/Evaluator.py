@@ -1,14 +1,25 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, List
 
+from cjw.knowledgeqa.bots.Answer import Answer
 from cjw.knowledgeqa.bots.Bot import Bot
 
 
 class Evaluator(ABC):
     """Base class for evaluators that evaluates the performance of :class:`Bot` objects."""
-    def __init__(self):
+
+    DEFAULT_CONCURRENCY = 4     # Questions asked to the bot at a time, within the rate limits of the LLM APIs
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY):
+        """ The constructor
+
+        Args:
+            concurrency (int): Max number of questions asked to the bot at a time (default 4)
+        """
         self._bot: Optional[Bot] = None
         self._botArgs = dict()
+        self.concurrency = concurrency
 
     def forBot(self, bot: Bot, **kwarg) -> "Evaluator":
         """Attaches a Bot to evaluate
@@ -24,6 +35,24 @@ class Evaluator(ABC):
         self._botArgs = kwarg
         return self
 
+    async def _askAll(self, questions: List[str], **kwargs) -> List[Answer]:
+        """ Asks the bot questions, a few at a time
+
+        Args:
+            questions (List[str]): The questions
+            **kwargs: Arguments when asking the questions
+
+        Returns:
+            The answers, in the order of the questions
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def ask(question: str) -> Answer:
+            async with semaphore:
+                return await self._bot.ask(question, **kwargs)
+
+        return list(await asyncio.gather(*[ask(q) for q in questions]))
+
     @abstractmethod
     async def evaluate(self, sampleSize: int = 0, **kwargs) -> float:
         """ Evaluate the :class:`Bot`
@@ -13,13 +13,14 @@ class ProximityEvaluator(Evaluator):
 
     __DEFAULT_SCORE_WEIGHTS = [1.0, 0.5, 0.2]  # Default weights of the top-proximity standard answers
 
-    def __init__(self, scores: List[float] = None):
+    def __init__(self, scores: List[float] = None, concurrency: int = Evaluator.DEFAULT_CONCURRENCY):
         """ The constructor.
 
         Args:
             scores (List[float]): Scores assigned to the answer from the :class:Bot if the standard answer is among the top searches using the answer.  For example, the default is [1.0, 0.5, 0.2], meaning if the standard answer is the 2nd closest to the answer, it is scored 0.5.
+            concurrency (int): Max number of questions asked to the bot at a time (default 4)
         """
-        super().__init__()
+        super().__init__(concurrency)
         self.__testSet: Optional[QAData] = None
         self.__indexer: Optional[Indexer] = None
         self.__scoreWeights: List[float] = scores if scores else self.__DEFAULT_SCORE_WEIGHTS
@@ -65,23 +66,27 @@ class ProximityEvaluator(Evaluator):
         # Select test data
         data = self.__testSet.sample(sampleSize) if sampleSize else self.__testSet
 
-        # Iterate over the test data
-        positives = 0.0
-        for qa in data.records():
-            question = qa['question']
-            self.logger.info(f"Question: {question}")
-
-            # Ask the bot a question
-            answer = await self._bot.ask(question, **self._botArgs)
-            self.logger.info(f"Answer: {answer}")
+        # Ask the bot the questions, a few at a time
+        questions = [qa['question'] for qa in data.records()]
+        answers = await self._askAll(questions, **self._botArgs)
 
-            if answer.citations[0] == "--":  # The bot doesn't know, so no score
+        # The bot doesn't know some of them, so no score
+        known = []
+        for question, answer in zip(questions, answers):
+            self.logger.info(f"Question: {question}\nAnswer: {answer}")
+            if answer.citations[0] == "--":
                 if showFailedQuestions:
                     print(f"Failed question: {question} ({answer})")
-                continue
+            else:
+                known.append((question, answer))
 
-            # Search the index for similar answers
-            proximity = await self.__indexer.search(answer.content, top=len(self.__scoreWeights))
+        # Search the index for answers similar to the bot's, all in one batch
+        proximities = await self.__indexer.searchMany(
+            [answer.content for _, answer in known], top=len(self.__scoreWeights)
+        )
+
+        positives = 0.0
+        for (question, answer), proximity in zip(known, proximities):
             self.logger.info(
                 "".join([f"\n[{p['_id']}] {p['answer']}" for p in proximity])
             )
@@ -0,0 +1,110 @@
+from typing import Dict, List, Any
+
+import numpy as np
+
+
+class AttributeColumns:
+    """Document fields stored by column, so that filters are evaluated on arrays instead of document by document.
+
+    A column is built when a field is first filtered on, and is then kept in step with the rows of the index.  Each
+    column has the raw values, for the equalities, and their numeric values (NaN for non-numbers), for the ranges.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, np.ndarray] = dict()    # Field -> values of the rows
+        self._numbers: Dict[str, np.ndarray] = dict()   # Field -> numeric values of the rows
+
+    @classmethod
+    def _number(cls, value: Any) -> float:
+        return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+    def clear(self):
+        self._values = dict()
+        self._numbers = dict()
+
+    def _build(self, field: str, documents: List[dict]):
+        values = np.empty(len(documents), dtype=object)
+        for row, document in enumerate(documents):
+            values[row] = document.get(field)
+        self._values[field] = values
+        self._numbers[field] = np.array([self._number(v) for v in values], dtype=np.float64)
+
+    def set(self, row: int, document: dict):
+        """Updates a row with a new or replaced document."""
+        for field, values in self._values.items():
+            if row >= len(values):
+                capacity = max(2 * len(values), row + 1)
+                grown = np.empty(capacity, dtype=object)
+                grown[:len(values)] = values
+                numbers = np.full(capacity, np.nan)
+                numbers[:len(values)] = self._numbers[field]
+                self._values[field] = values = grown
+                self._numbers[field] = numbers
+
+            values[row] = document.get(field)
+            self._numbers[field][row] = self._number(values[row])
+
+    def move(self, source: int, target: int):
+        """Copies a row to another."""
+        for field, values in self._values.items():
+            values[target] = values[source]
+            self._numbers[field][target] = self._numbers[field][source]
+
+    def take(self, rows: np.ndarray):
+        """Keeps only the given rows, in that order."""
+        for field in self._values:
+            self._values[field] = self._values[field][rows]
+            self._numbers[field] = self._numbers[field][rows]
+
+    def mask(self, field: str, operator: str, value: Any, documents: List[dict]) -> np.ndarray:
+        """ Evaluates a condition of a :class:`Filter` on all the rows
+
+        Args:
+            field (str): The field
+            operator (str): The filter operator, like "$eq" or "$gte"
+            value (Any): The operand
+            documents (List[dict]): The documents of the rows, to build the column if it is not there yet
+
+        Returns:
+            Boolean mask of the rows satisfying the condition
+        """
+        if field not in self._values:
+            self._build(field, documents)
+
+        count = len(documents)
+        values = self._values[field][:count]
+        numbers = self._numbers[field][:count]
+
+        if operator in ["$eq", "$ne"]:
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                equal = numbers == value
+            elif isinstance(value, str):
+                equal = np.asarray(values == value, dtype=bool)
+            else:
+                equal = np.array([v == value and type(v) is type(value) for v in values], dtype=bool)
+            return equal if operator == "$eq" else ~equal
+
+        if operator in ["$in", "$nin"]:
+            # Booleans apart from numbers, so that True is not taken for 1
+            booleans = {c for c in value if isinstance(c, bool)}
+            others = {c for c in value if not isinstance(c, bool)}
+            found = np.array([
+                self._contains(booleans if isinstance(v, bool) else others, v) for v in values
+            ], dtype=bool)
+            return found if operator == "$in" else ~found
+
+        with np.errstate(invalid="ignore"):
+            if operator == "$gt":
+                return numbers > value
+            if operator == "$gte":
+                return numbers >= value
+            if operator == "$lt":
+                return numbers < value
+            return numbers <= value
+
+    @classmethod
+    def _contains(cls, candidates: set, value: Any) -> bool:
+        try:
+            return value in candidates
+        except TypeError:
+            return False    # Unhashable values, like lists, are never equal to the scalar candidates
@@ -0,0 +1,95 @@
+import heapq
+import math
+from collections import Counter
+from typing import Dict, List, Tuple, Optional
+
+from cjw.utilities.Languages import Languages
+
+
+class Bm25Index:
+    """An in-memory inverted index ranking documents by Okapi BM25.
+
+    Words are taken with :meth:`Languages.words`, so English terms are matched whole and Chinese by characters and
+    character pairs.  It complements the embedding search for exact terms, like names and numbers, that embeddings
+    tend to blur.
+    """
+
+    DEFAULT_K1 = 1.2    # Saturation of the term frequency
+    DEFAULT_B = 0.75    # Normalization by the document length
+
+    def __init__(self, k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        self.k1 = k1
+        self.b = b
+
+        self._postings: Dict[str, Dict[str, int]] = dict()  # Word -> document ID -> frequency in the document
+        self._lengths: Dict[str, int] = dict()              # Document ID -> number of words
+        self._words: Dict[str, List[str]] = dict()          # Document ID -> distinct words
+        self._totalLength = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, docId: str, text: str):
+        """Indexes a document.  An existing document of the same ID is replaced."""
+        self.remove(docId)
+
+        words = Languages.words(text)
+        frequencies = Counter(words)
+        for w, f in frequencies.items():
+            self._postings.setdefault(w, dict())[docId] = f
+
+        self._lengths[docId] = len(words)
+        self._words[docId] = list(frequencies.keys())
+        self._totalLength += len(words)
+
+    def remove(self, docId: str):
+        """Removes a document from the index, if it is there."""
+        if docId not in self._lengths:
+            return
+
+        for w in self._words.pop(docId):
+            postings = self._postings[w]
+            del postings[docId]
+            if not postings:
+                del self._postings[w]
+
+        self._totalLength -= self._lengths.pop(docId)
+
+    def clear(self):
+        self._postings = dict()
+        self._lengths = dict()
+        self._words = dict()
+        self._totalLength = 0
+
+    def search(self, query: str, top: int, allowed: Optional[set] = None) -> List[Tuple[str, float]]:
+        """ Finds the documents best matching the words of the query
+
+        Args:
+            query (str): The query
+            top (int): Max number of documents to find
+            allowed (set): Only consider these document IDs.  (default None for all documents)
+
+        Returns:
+            The document IDs and their BM25 scores, by descending scores.  Documents sharing no words with the query
+            are not included.
+        """
+        if not self._lengths or top <= 0:
+            return []
+
+        n = len(self._lengths)
+        averageLength = self._totalLength / n
+
+        scores: Dict[str, float] = dict()
+        for w in set(Languages.words(query)):
+            postings = self._postings.get(w)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for docId, f in postings.items():
+                if allowed is not None and docId not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[docId] / averageLength)
+                scores[docId] = scores.get(docId, 0.0) + idf * f * (self.k1 + 1) / (f + norm)
+
+        return heapq.nlargest(top, scores.items(), key=lambda s: s[1])
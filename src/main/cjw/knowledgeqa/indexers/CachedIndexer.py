@@ -0,0 +1,168 @@
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import List, Any, Tuple, Iterable, AsyncIterable
+
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+from cjw.knowledgeqa.indexers.Ingestion import IngestReport
+
+
+class CachedIndexer(Indexer):
+    """Caches the search results of another :class:`Indexer`.
+
+    Results are kept in an LRU cache for a limited time, keyed by the query text with its spaces normalized, the
+    number of results and the other search arguments.  Any change to the wrapped index through this object empties the cache.
+    Other attributes are passed through to the wrapped index.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    __DEFAULT_CAPACITY = 1024   # Number of search results cached
+    __DEFAULT_TTL = 300         # Seconds a search result stays in the cache
+
+    __spaces = re.compile(r"\s+")
+
+    def __init__(
+            self,
+            indexer: Indexer,
+            capacity: int = __DEFAULT_CAPACITY,
+            ttl: float = __DEFAULT_TTL,
+            ignoreCase: bool = False,
+    ):
+        """ The constructor
+
+        Args:
+            indexer (Indexer): The index to cache
+            capacity (int): Max number of search results cached (default 1024)
+            ttl (float): Seconds a search result stays in the cache.  None for no expiration. (default 300)
+            ignoreCase (bool): Queries differing only in case share their results.  Only for embeddings ignoring the
+                case. (default False)
+        """
+        self.indexer = indexer
+        self.capacity = capacity
+        self.ttl = ttl
+        self.ignoreCase = ignoreCase
+
+        self.hits = 0           # Number of searches answered from the cache
+        self.misses = 0         # Number of searches passed to the wrapped index
+
+        self.__cache: OrderedDict[Tuple, Tuple[float, List[dict]]] = OrderedDict()  # Key -> (expiry, results)
+        self.__generation = 0   # Incremented at every invalidation, so that outdated results are not cached
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "indexer":
+            raise AttributeError(name)
+        return getattr(self.indexer, name)
+
+    def _key(self, query: str, top: int, kwargs: dict) -> Tuple:
+        normalized = self.__spaces.sub(" ", query.strip())
+        if self.ignoreCase:
+            normalized = normalized.lower()
+        return normalized, top, json.dumps(kwargs, sort_keys=True, default=str)
+
+    def _lookup(self, key: Tuple) -> List[dict] | None:
+        entry = self.__cache.get(key)
+        if entry is None:
+            return None
+
+        expiry, results = entry
+        if expiry < time.monotonic():
+            del self.__cache[key]
+            return None
+
+        self.__cache.move_to_end(key)
+        return [dict(r) for r in results]   # Copies, so that the caller cannot modify the cache
+
+    def _store(self, key: Tuple, results: List[dict], generation: int):
+        if generation != self.__generation:
+            return  # The index was changed during the search
+
+        expiry = time.monotonic() + self.ttl if self.ttl is not None else float("inf")
+        self.__cache[key] = (expiry, [dict(r) for r in results])
+        self.__cache.move_to_end(key)
+        while len(self.__cache) > self.capacity:
+            self.__cache.popitem(last=False)
+
+    def invalidate(self):
+        """Empties the cache."""
+        self.__cache.clear()
+        self.__generation += 1
+
+    def stats(self) -> dict:
+        """Returns the cache counters for tuning."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / total if total else 0.0,
+            "size": len(self.__cache),
+            "capacity": self.capacity,
+        }
+
+    async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
+        return (await self.searchMany([query], top, **kwargs))[0]
+
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        keys = [self._key(q, top, kwargs) for q in queries]
+        results = [self._lookup(k) for k in keys]
+
+        # Search the missed ones in a batch
+        missed = [i for i, r in enumerate(results) if r is None]
+        self.hits += len(queries) - len(missed)
+        self.misses += len(missed)
+
+        if missed:
+            generation = self.__generation
+            found = await self.indexer.searchMany([queries[i] for i in missed], top, **kwargs)
+            for i, f in zip(missed, found):
+                self._store(keys[i], f, generation)
+                results[i] = f
+
+        return results
+
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> Any:
+        try:
+            return await self.indexer.add(data, keyFields, idField, **kwargs)
+        finally:
+            self.invalidate()
+
+    async def ingest(
+            self,
+            documents: Iterable[dict] | AsyncIterable[dict],
+            keyFields: List[str],
+            idField: str = None,
+            **kwargs
+    ) -> IngestReport:
+        try:
+            return await self.indexer.ingest(documents, keyFields, idField, **kwargs)
+        finally:
+            self.invalidate()
+
+    def warmup(self):
+        self.indexer.warmup()
+
+    async def refresh(self) -> Any:
+        try:
+            return await self.indexer.refresh()
+        finally:
+            self.invalidate()
+
+    async def get(self, ids: str | List[str]) -> List[dict]:
+        return await self.indexer.get(ids)
+
+    async def delete(self, ids: str | List[str]) -> Any:
+        try:
+            return await self.indexer.delete(ids)
+        finally:
+            self.invalidate()
+
+    async def kill(self) -> Any:
+        try:
+            return await self.indexer.kill()
+        finally:
+            self.invalidate()
+
+    async def size(self) -> Any:
+        return await self.indexer.size()
@@ -0,0 +1,117 @@
+import math
+from typing import List, Callable, Tuple
+
+from cjw.utilities.Languages import Languages
+
+
+class Chunker:
+    """Splits long documents into passages of whole sentences, for indexing.
+
+    Passages are limited in tokens, and each one starts with the last sentences of the previous one, so that a fact
+    spread across the boundary is still found in one piece.  A passage is a copy of its document with the text
+    replaced by the passage, and with these fields added:
+
+    - "_id": The ID of the document, "#", and the passage number, like "7751000#2"
+    - "_parent": The ID of the document
+    - "_chunk": The passage number, from 0
+    - "_offset": Where the passage starts in the text of the document
+    """
+
+    DEFAULT_MAX_TOKENS = 200
+    DEFAULT_OVERLAP = 40
+
+    SEPARATOR = "#"
+
+    def __init__(
+            self,
+            maxTokens: int = DEFAULT_MAX_TOKENS,
+            overlap: int = DEFAULT_OVERLAP,
+            countTokens: Callable[[str], int] = None,
+    ):
+        """ The constructor
+
+        Args:
+            maxTokens (int): Max tokens of a passage.  A sentence longer than that is a passage by itself. (default 200)
+            overlap (int): Max tokens of the sentences repeated from the previous passage.  (default 40)
+            countTokens (Callable[[str], int]): Counts the tokens of a text.  (default a rough estimate by words)
+        """
+        if overlap >= maxTokens:
+            raise ValueError(f"The overlap {overlap} shall be less than the passage size {maxTokens}")
+
+        self.maxTokens = maxTokens
+        self.overlap = overlap
+        self.countTokens = countTokens or self.estimateTokens
+
+    @classmethod
+    def estimateTokens(cls, text: str) -> int:
+        """Estimates the tokens of a text without a tokenizer: a token per Hanzi, and about 4 tokens per 3 words."""
+        ideographic, alphabetical = Languages.separateIdeograph(text)
+        hanzi = sum([Languages.isIdeography(c) for c in ideographic])
+        return hanzi + math.ceil(len(alphabetical.split()) * 4 / 3)
+
+    @classmethod
+    def chunkId(cls, parentId: str, chunk: int) -> str:
+        return f"{parentId}{cls.SEPARATOR}{chunk}"
+
+    def spans(self, text: str) -> List[Tuple[int, int]]:
+        """ Finds where the passages of a text are
+
+        Args:
+            text (str): The text
+
+        Returns:
+            The start and end offsets of each passage in the text
+        """
+        sentences = [(begin, begin + len(s), self.countTokens(s)) for begin, s in Languages.sentences(text or "")]
+
+        spans = []
+        first = 0
+        while first < len(sentences):
+            # Take sentences until the passage is full
+            last = first
+            tokens = sentences[first][2]
+            while last + 1 < len(sentences) and tokens + sentences[last + 1][2] <= self.maxTokens:
+                last += 1
+                tokens += sentences[last][2]
+
+            spans.append((sentences[first][0], sentences[last][1]))
+            if last + 1 >= len(sentences):
+                break
+
+            # The next passage starts with as many of the last sentences as the overlap allows, but moves on by one
+            # sentence at least
+            following = last + 1
+            tokens = 0
+            while following - 1 > first and tokens + sentences[following - 1][2] <= self.overlap:
+                following -= 1
+                tokens += sentences[following][2]
+            first = following
+
+        return spans
+
+    def split(self, document: dict, textField: str = "text", idField: str = "_id") -> List[dict]:
+        """ Splits a document into passages
+
+        Args:
+            document (dict): The document
+            textField (str): The field of the text to split (default "text")
+            idField (str): The field of the document ID (default "_id")
+
+        Returns:
+            The passages.  A document without text is a passage by itself.
+        """
+        parentId = str(document[idField])
+        text = document.get(textField) or ""
+        spans = self.spans(text) or [(0, len(text))]
+
+        passages = []
+        for chunk, (start, end) in enumerate(spans):
+            passage = {k: v for k, v in document.items() if k != "_id"}
+            passage[textField] = text[start:end]
+            passage["_id"] = self.chunkId(parentId, chunk)
+            passage["_parent"] = parentId
+            passage["_chunk"] = chunk
+            passage["_offset"] = start
+            passages.append(passage)
+
+        return passages
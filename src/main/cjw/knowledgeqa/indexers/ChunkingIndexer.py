@@ -0,0 +1,191 @@
+import logging
+from typing import List, Any, Dict
+from uuid import uuid4
+
+from cjw.knowledgeqa.indexers.Chunker import Chunker
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+
+
+class ChunkingIndexer(Indexer):
+    """Indexes documents of another :class:`Indexer` as passages split by a :class:`Chunker`.
+
+    Searches find the passages, so only the relevant part of a long document goes to the prompt.  By default, the
+    hits are collapsed to their documents: a document is found once, by its best passage, with the document ID as
+    "_id".  Documents are got, replaced and deleted by their IDs as usual, with all their passages.
+    Other attributes are passed through to the wrapped index.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    __OVERFETCH = 4         # Passages searched for each document asked, to make up for passages of the same document
+    __PROBE_WINDOW = 16     # Passage IDs tried at a time when looking for the passages of a document
+
+    def __init__(self, indexer: Indexer, chunker: Chunker = None, textField: str = "text"):
+        """ The constructor
+
+        Args:
+            indexer (Indexer): The index of the passages
+            chunker (Chunker): Splits the documents.  (default a :class:`Chunker` with its defaults)
+            textField (str): The field of the text to split (default "text")
+        """
+        self.indexer = indexer
+        self.chunker = chunker or Chunker()
+        self.textField = textField
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "indexer":
+            raise AttributeError(name)
+        return getattr(self.indexer, name)
+
+    async def _passagesOf(self, firsts: Dict[str, int]) -> Dict[str, List[dict]]:
+        """ Finds the passages of documents
+
+        Args:
+            firsts (Dict[str, int]): The documents, and the first passage number to look for
+
+        Returns:
+            The passages of each document, in order
+        """
+        found = {parent: [] for parent in firsts}
+        pending = dict(firsts)
+        while pending:
+            ids = [
+                Chunker.chunkId(parent, chunk)
+                for parent, first in pending.items() for chunk in range(first, first + self.__PROBE_WINDOW)
+            ]
+            passages = iter(await self.indexer.get(ids))
+
+            for parent in list(pending):
+                window = [next(passages) for _ in range(self.__PROBE_WINDOW)]
+                found[parent] += [p for p in window if p.get("_found", True)]
+                if all([p.get("_found", True) for p in window]):
+                    pending[parent] += self.__PROBE_WINDOW  # There may be more
+                else:
+                    del pending[parent]
+
+        return found
+
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> dict:
+        """ Splits documents into passages, and adds the passages to the index.  See :meth:`Indexer.add`.
+        Passages left over from earlier versions of the documents are deleted.
+
+        Returns:
+            The status of the passages added, as of the wrapped index
+        """
+        passages = []
+        counts = dict()
+        for document in data:
+            if not idField and "_id" not in document:
+                document = {**document, "_id": str(uuid4())}
+            split = self.chunker.split(document, self.textField, idField or "_id")
+            counts[split[0]["_parent"]] = len(split)
+            passages += split
+
+        status = await self.indexer.add(passages, keyFields, **kwargs)
+
+        stale = await self._passagesOf(counts)
+        staleIds = [p["_id"] for passagesOfParent in stale.values() for p in passagesOfParent]
+        if staleIds:
+            await self.indexer.delete(staleIds)
+
+        return status
+
+    def warmup(self):
+        self.indexer.warmup()
+
+    async def refresh(self) -> Any:
+        return await self.indexer.refresh()
+
+    async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
+        """ Searches for the passages nearest to the query.  See :meth:`Indexer.search`.
+
+        Args:
+            query (str): The text to fish out relevant documents in the database
+            top (int): Number of documents, or passages if not collapsed, to get
+            **kwargs:
+                - collapse (bool): One hit per document, by its best passage.  (default True)
+                - Other arguments to the wrapped index
+
+        Returns:
+            The passages with their scores.  Collapsed, the "_id" is that of the document, and "_chunks" lists the
+            IDs of the passages found, the best first.
+        """
+        return (await self.searchMany([query], top, **kwargs))[0]
+
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        if not kwargs.pop("collapse", True):
+            return await self.indexer.searchMany(queries, top, **kwargs)
+
+        found = await self.indexer.searchMany(queries, top * self.__OVERFETCH, **kwargs)
+
+        results = []
+        for hits in found:
+            # The hits are in descending scores, so the first passage of a document is its best
+            documents: Dict[str, dict] = dict()
+            for hit in hits:
+                parent = hit.get("_parent", hit["_id"])
+                if parent in documents:
+                    documents[parent]["_chunks"].append(hit["_id"])
+                else:
+                    documents[parent] = {**hit, "_id": parent, "_chunks": [hit["_id"]]}
+            results.append(list(documents.values())[:top])
+
+        return results
+
+    async def get(self, ids: str | List[str]) -> List[dict]:
+        """ Gets documents by their IDs, put together from their passages.  See :meth:`Indexer.get`.
+
+        Returns:
+            The documents
+        """
+        if isinstance(ids, str):
+            ids = [ids]
+
+        found = await self._passagesOf({docId: 0 for docId in dict.fromkeys(ids)})
+
+        documents = []
+        for docId in ids:
+            passages = found[docId]
+            if not passages:
+                documents.append({"_id": docId, "_found": False})
+                continue
+
+            # Passages overlap.  Each one adds what is beyond the end of the text so far.
+            text = ""
+            for p in passages:
+                passage = p.get(self.textField) or ""
+                offset = p.get("_offset", len(text))
+                text = text[:offset] + " " * (offset - len(text)) + passage
+
+            document = {k: v for k, v in passages[0].items() if k not in ["_parent", "_chunk", "_offset"]}
+            document.update({self.textField: text, "_id": docId, "_found": True})
+            documents.append(document)
+
+        return documents
+
+    async def delete(self, ids: str | List[str]) -> dict:
+        """ Deletes documents with all their passages.  See :meth:`Indexer.delete`.
+
+        Returns:
+            The status of each document, "deleted" or "not_found"
+        """
+        if isinstance(ids, str):
+            ids = [ids]
+
+        found = await self._passagesOf({docId: 0 for docId in dict.fromkeys(ids)})
+        passageIds = [p["_id"] for passages in found.values() for p in passages]
+        if passageIds:
+            await self.indexer.delete(passageIds)
+
+        return {"items": [
+            {"_id": docId, "status": 200, "result": "deleted"} if found[docId] else
+            {"_id": docId, "status": 404, "result": "not_found"}
+            for docId in ids
+        ]}
+
+    async def kill(self) -> Any:
+        return await self.indexer.kill()
+
+    async def size(self) -> Any:
+        """Returns the number of passages in the index."""
+        return await self.indexer.size()
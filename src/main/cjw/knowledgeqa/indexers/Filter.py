@@ -0,0 +1,152 @@
+import re
+from typing import List, Tuple, Any, Optional
+
+
+class Filter:
+    """A structured filter on the document fields, given to :meth:`Indexer.search` as the "filter" argument.
+
+    The filter is a dict from field names to conditions, all of which must hold, e.g.
+    ``{"category": "park", "year": {"$gte": 1950, "$lt": 2000}, "_id": {"$in": ["7751000", "7751062"]}}``.
+    A plain value is an equality.  The operators are those of Pinecone metadata filters: "$eq", "$ne", "$gt",
+    "$gte", "$lt", "$lte", "$in" and "$nin".  The field "_id" filters by the document IDs.
+    """
+
+    EQUALITIES = ["$eq", "$ne", "$in", "$nin"]
+    RANGES = ["$gt", "$gte", "$lt", "$lte"]
+    OPERATORS = EQUALITIES + RANGES
+
+    __marqoSpecial = re.compile(r"([+\-&|!(){}\[\]^\"~*?:\\/\s])")
+
+    def __init__(self, spec: dict):
+        """ Parses a filter
+
+        Args:
+            spec (dict): The filter.  See the class description.
+
+        Raises:
+            ValueError if the filter is malformed
+        """
+        self.spec = spec
+        self.conditions: List[Tuple[str, str, Any]] = []    # (field, operator, value)
+
+        if not isinstance(spec, dict):
+            raise ValueError(f"A filter shall be a dict, not {type(spec).__name__}")
+
+        for field, condition in spec.items():
+            if field.startswith("$"):
+                raise ValueError(f"Unsupported filter operator {field}.  Conditions of different fields are ANDed.")
+
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+
+            for operator, value in condition.items():
+                if operator not in self.OPERATORS:
+                    raise ValueError(f"Unknown filter operator {operator} on {field}")
+                if operator in ["$in", "$nin"]:
+                    if not isinstance(value, (list, tuple, set)):
+                        raise ValueError(f"{operator} on {field} takes a list")
+                    value = list(value)
+                    if not all([self._isScalar(v) for v in value]):
+                        raise ValueError(f"{operator} on {field} takes a list of strings, numbers or booleans")
+                elif operator in self.RANGES:
+                    if isinstance(value, bool) or not isinstance(value, (int, float)):
+                        raise ValueError(f"{operator} on {field} takes a number")
+                elif not self._isScalar(value):
+                    raise ValueError(f"{operator} on {field} takes a string, number or boolean")
+
+                self.conditions.append((field, operator, value))
+
+    @classmethod
+    def of(cls, spec: "Filter | dict | None") -> Optional["Filter"]:
+        """Makes a filter from its spec, or None if there is nothing to filter."""
+        if spec is None or isinstance(spec, Filter):
+            return spec
+        return Filter(spec) if spec else None
+
+    def __repr__(self) -> str:
+        return f"Filter({self.spec!r})"
+
+    @classmethod
+    def _isScalar(cls, value: Any) -> bool:
+        return isinstance(value, (str, int, float, bool))
+
+    @classmethod
+    def _equal(cls, a: Any, b: Any) -> bool:
+        """Equality as of Pinecone, where booleans are not numbers, so True is not 1."""
+        return a == b and isinstance(a, bool) == isinstance(b, bool)
+
+    @property
+    def void(self) -> bool:
+        """True if the filter can match nothing, because of an empty "$in"."""
+        return any([op == "$in" and not value for _, op, value in self.conditions])
+
+    def matches(self, document: dict) -> bool:
+        """ Tests a document against the filter, one at a time.
+
+        Args:
+            document (dict): The document, with its "_id"
+
+        Returns:
+            True if the document satisfies all the conditions
+        """
+        for field, operator, value in self.conditions:
+            v = document.get(field)
+            if operator == "$eq":
+                ok = self._equal(v, value)
+            elif operator == "$ne":
+                ok = not self._equal(v, value)
+            elif operator == "$in":
+                ok = any([self._equal(v, c) for c in value])
+            elif operator == "$nin":
+                ok = not any([self._equal(v, c) for c in value])
+            elif isinstance(v, bool) or not isinstance(v, (int, float)):
+                ok = False
+            elif operator == "$gt":
+                ok = v > value
+            elif operator == "$gte":
+                ok = v >= value
+            elif operator == "$lt":
+                ok = v < value
+            else:
+                ok = v <= value
+
+            if not ok:
+                return False
+
+        return True
+
+    @classmethod
+    def _marqoValue(cls, value: Any) -> str:
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        return cls.__marqoSpecial.sub(r"\\\1", str(value))
+
+    def toMarqo(self) -> str:
+        """ Translates the filter to a Marqo filter string.  Marqo ranges are inclusive, so exclusive bounds also
+        exclude the bound value.
+
+        Returns:
+            The filter string
+        """
+        terms = []
+        for field, operator, value in self.conditions:
+            name = self._marqoValue(field)
+            if operator == "$eq":
+                terms.append(f"{name}:{self._marqoValue(value)}")
+            elif operator == "$ne":
+                terms.append(f"NOT {name}:{self._marqoValue(value)}")
+            elif operator in ["$in", "$nin"]:
+                if not value:
+                    continue    # Nothing excluded.  An empty "$in" is void, and not searched at all.
+                either = " OR ".join([f"{name}:{self._marqoValue(v)}" for v in value])
+                terms.append(f"({either})" if operator == "$in" else f"NOT ({either})")
+            elif operator in ["$gt", "$gte"]:
+                terms.append(f"{name}:[{value} TO *]")
+                if operator == "$gt":
+                    terms.append(f"NOT {name}:{value}")
+            else:
+                terms.append(f"{name}:[* TO {value}]")
+                if operator == "$lt":
+                    terms.append(f"NOT {name}:{value}")
+
+        return " AND ".join(terms)
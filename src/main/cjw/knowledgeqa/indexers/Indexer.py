@@ -1,11 +1,25 @@
+import asyncio
+import logging
+import time
 from abc import ABC, abstractmethod
-from typing import List, Any
+from typing import List, Any, Iterable, AsyncIterable, Callable, Optional
+
+from cjw.knowledgeqa.indexers.Ingestion import IngestReport, SyncReport, iterate
+from cjw.knowledgeqa.indexers.Manifest import Manifest
 
 
 class Indexer(ABC):
     """The base class of an Indexer, which utilizes vector database to search for relevant articles in the embedding
     space."""
 
+    logger = logging.getLogger(__qualname__)
+
+    __DEFAULT_INGEST_BATCH_SIZE = 64
+    __MAX_INGEST_BATCH_SIZE = 1024
+    __DEFAULT_INGEST_CONCURRENCY = 4
+    __DEFAULT_INGEST_LATENCY = 2.0     # Seconds a batch shall take.  Batches are resized toward it.
+    __SYNC_DELETE_BATCH_SIZE = 1000
+
     # Exceptions
     class IndexExistError(Exception):
         def __init__(self, indexName: str):
@@ -31,6 +45,175 @@ class Indexer(ABC):
         # TODO: use pandas DataFrame for data
         pass
 
+    async def ingest(
+            self,
+            documents: Iterable[dict] | AsyncIterable[dict],
+            keyFields: List[str],
+            idField: str = None,
+            batchSize: int = __DEFAULT_INGEST_BATCH_SIZE,
+            concurrency: int = __DEFAULT_INGEST_CONCURRENCY,
+            targetLatency: float = __DEFAULT_INGEST_LATENCY,
+            onProgress: Optional[Callable[[IngestReport], Any]] = None,
+            **kwargs
+    ) -> IngestReport:
+        """ Adds a stream of documents to the index in batches.
+        The documents are read only as fast as the index takes them, so the stream never needs to fit in memory.
+        Several batches are added concurrently.  The batch size adapts so that each batch takes about the target
+        latency, and shrinks after failures.  The index is refreshed once at the end.
+
+        Args:
+            documents (Iterable[dict] | AsyncIterable[dict]): The documents, for example from
+                :func:`Ingestion.readJsonl`
+            keyFields (List[str]): Filed names whose values are used in embedding
+            idField (str): The field name for the document ID.  See :meth:`add`.
+            batchSize (int): Size of the first batch (default 64)
+            concurrency (int): Number of batches being added at the same time (default 4)
+            targetLatency (float): Seconds a batch shall take (default 2.0)
+            onProgress (Callable[[IngestReport], Any]): Called with the report after each batch
+            **kwargs: Other arguments to :meth:`add`
+
+        Returns:
+            The :class:`IngestReport`
+        """
+        report = IngestReport(batchSize=batchSize)
+        slots = asyncio.Semaphore(concurrency)
+        tasks = set()
+
+        async def addBatch(batch: List[dict]):
+            start = time.monotonic()
+            try:
+                status = await self.add(batch, keyFields, idField, refresh=False, **kwargs)
+                failures = [
+                    {"_id": item.get("_id"), "error": item.get("error", item.get("message", "unknown"))}
+                    for item in (status or {}).get("items", []) if item.get("status", 200) >= 300
+                ]
+            except Exception as e:
+                self.logger.warning(f"Failed to add a batch of {len(batch)} documents: {e}")
+                failures = [{"_id": d.get(idField or "_id"), "error": str(e)} for d in batch]
+            finally:
+                slots.release()
+
+            # Grow the batches while the index keeps up.  Shrink them if it is slow or failing.
+            latency = time.monotonic() - start
+            if failures or latency > targetLatency:
+                report.batchSize = max(1, report.batchSize // 2)
+            elif latency < targetLatency / 2:
+                report.batchSize = min(self.__MAX_INGEST_BATCH_SIZE, report.batchSize * 2)
+
+            report.record(len(batch), failures, latency)
+            self.logger.info(f"Ingestion progress: {report}")
+            if onProgress:
+                onProgress(report)
+
+        batch = []
+        async for document in iterate(documents):
+            batch.append(document)
+            if len(batch) >= report.batchSize:
+                await slots.acquire()   # Wait here for a free slot, so no more documents are read in the meantime
+                task = asyncio.create_task(addBatch(batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                batch = []
+
+        if batch:
+            await slots.acquire()
+            await addBatch(batch)
+        await asyncio.gather(*tasks)
+
+        await self.refresh()
+        return report
+
+    async def sync(
+            self,
+            documents: Iterable[dict] | AsyncIterable[dict],
+            keyFields: List[str],
+            manifest: str | Manifest,
+            idField: str = None,
+            deleteMissing: bool = True,
+            **kwargs
+    ) -> SyncReport:
+        """ Brings the index up to date with a corpus, indexing only what changed since the last time.
+        The content hash of every document indexed is kept in a manifest.  Documents whose hash is in the manifest
+        are skipped, the others are ingested, and the documents in the manifest but no longer in the corpus are
+        deleted.  The manifest is saved at the end.
+
+        Args:
+            documents (Iterable[dict] | AsyncIterable[dict]): The whole corpus
+            keyFields (List[str]): Filed names whose values are used in embedding
+            manifest (str | Manifest): The manifest, or the path of its file.  A new manifest, as for an index
+                built otherwise, makes every document indexed again.
+            idField (str): The field name for the document ID.  The documents shall have IDs, or they cannot be
+                tracked.  (default "_id")
+            deleteMissing (bool): Delete the documents no longer in the corpus (default True)
+            **kwargs: Other arguments to :meth:`ingest`
+
+        Returns:
+            The :class:`SyncReport` of the changes
+        """
+        start = time.monotonic()
+        manifest = manifest if isinstance(manifest, Manifest) else Manifest(manifest)
+        idField = idField or "_id"
+        report = SyncReport()
+
+        seen = set()
+        changed: dict = dict()  # Document ID -> new content hash
+
+        async def changes():
+            async for document in iterate(documents):
+                docId = str(document[idField])
+                seen.add(docId)
+                contentHash = Manifest.hash(document, keyFields)
+                if manifest.get(docId) == contentHash:
+                    report.unchanged += 1
+                else:
+                    changed[docId] = contentHash
+                    yield document
+
+        ingested = await self.ingest(changes(), keyFields, idField, **kwargs)
+        report.failures = ingested.failures
+
+        failed = {str(f["_id"]) for f in ingested.failures}
+        for docId, contentHash in changed.items():
+            if docId in failed:
+                continue
+            if manifest.get(docId) is None:
+                report.added += 1
+            else:
+                report.updated += 1
+            manifest.set(docId, contentHash)
+
+        if deleteMissing:
+            missing = [docId for docId in manifest if docId not in seen]
+            for i in range(0, len(missing), self.__SYNC_DELETE_BATCH_SIZE):
+                batch = missing[i:i + self.__SYNC_DELETE_BATCH_SIZE]
+                await self.delete(batch)
+                for docId in batch:
+                    manifest.remove(docId)
+            report.deleted = len(missing)
+
+        if manifest.path:
+            manifest.save()
+
+        report.seconds = time.monotonic() - start
+        self.logger.info(f"Synchronized: {report}")
+        return report
+
+    def warmup(self):
+        """ Loads the model of the embedding, if any, so that the first search is not slowed down by loading it.
+        It blocks.  A server would run it in the background after binding its port.
+        """
+        embedding = getattr(self, "embedding", None)
+        if embedding is not None:
+            embedding.warmup()
+
+    async def refresh(self) -> Any:
+        """ Makes the recently added documents searchable, for databases that do not do it immediately.
+
+        Returns:
+            Subclass specific status
+        """
+        pass
+
     @abstractmethod
     async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
         """ Searches for nearest neighbors of the query in the embedding space.
@@ -38,13 +221,30 @@ class Indexer(ABC):
         Args:
             query (str): The text to fish out relevant documents in the database
             top (int): Number of documents to get
-            **kwargs: Other subclass specific parameters
+            **kwargs:
+                - filter (dict | Filter): Only search the documents passing the filter.  See :class:`Filter`.
+                - Other subclass specific parameters
 
         Returns:
             The documents with their meta data
         """
         pass
 
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        """ Searches for nearest neighbors of many queries at once.
+        Subclasses shall override it if the database can search in batches.  By default, the queries are searched
+        concurrently.
+
+        Args:
+            queries (List[str]): The texts to fish out relevant documents in the database
+            top (int): Number of documents to get for each query
+            **kwargs: Other subclass specific parameters.  See :meth:`search`
+
+        Returns:
+            The documents with their meta data for each of the queries
+        """
+        return list(await asyncio.gather(*[self.search(q, top, **kwargs) for q in queries]))
+
     @abstractmethod
     async def get(self, ids: str | List[str]) -> List[dict]:
         """ Gets specific documents by their IDs
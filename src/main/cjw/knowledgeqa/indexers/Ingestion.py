@@ -0,0 +1,88 @@
+import json
+from dataclasses import dataclass, field
+from typing import List, Iterator, Iterable, AsyncIterable, AsyncIterator
+
+
+@dataclass
+class IngestReport:
+    """Progress and outcome of a bulk ingestion.  See :meth:`Indexer.ingest`.
+
+    Attributes:
+        documents (int): Number of documents sent to the index so far
+        succeeded (int): Number of documents indexed successfully
+        batches (int): Number of batches completed
+        batchSize (int): Size of the next batch, adapted to the latency of the index
+        seconds (float): Total time spent by the batches
+        failures (List[dict]): The documents failed, each with its "_id" and "error"
+    """
+    documents: int = 0
+    succeeded: int = 0
+    batches: int = 0
+    batchSize: int = 0
+    seconds: float = 0.0
+    failures: List[dict] = field(default_factory=lambda: [])
+
+    def record(self, documents: int, failures: List[dict], seconds: float):
+        """Records the outcome of a batch."""
+        self.documents += documents
+        self.succeeded += documents - len(failures)
+        self.batches += 1
+        self.seconds += seconds
+        self.failures += failures
+
+    def __str__(self) -> str:
+        return (
+            f"{self.succeeded}/{self.documents} documents indexed in {self.batches} batches "
+            f"({len(self.failures)} failed)"
+        )
+
+
+@dataclass
+class SyncReport:
+    """The changes made by a synchronization of an index with a corpus.  See :meth:`Indexer.sync`.
+
+    Attributes:
+        added (int): Number of new documents indexed
+        updated (int): Number of modified documents indexed again
+        unchanged (int): Number of documents left as they were
+        deleted (int): Number of documents removed, as they are no longer in the corpus
+        failures (List[dict]): The documents failed to index, each with its "_id" and "error"
+        seconds (float): Time the synchronization took
+    """
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    failures: List[dict] = field(default_factory=lambda: [])
+    seconds: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.added} added, {self.updated} updated, {self.unchanged} unchanged, {self.deleted} deleted, "
+            f"{len(self.failures)} failed in {self.seconds:.1f} seconds"
+        )
+
+
+def readJsonl(path: str) -> Iterator[dict]:
+    """ Reads documents from a JSON-lines file one at a time, so that the file never needs to fit in the memory.
+
+    Args:
+        path (str): The file, one JSON object per line.  Blank lines are skipped.
+
+    Returns:
+        An iterator of the documents
+    """
+    with open(path, "r") as fd:
+        for line in fd:
+            if line.strip():
+                yield json.loads(line)
+
+
+async def iterate(documents: Iterable[dict] | AsyncIterable[dict]) -> AsyncIterator[dict]:
+    """Iterates either a synchronous or an asynchronous iterable asynchronously."""
+    if hasattr(documents, "__aiter__"):
+        async for d in documents:
+            yield d
+    else:
+        for d in documents:
+            yield d
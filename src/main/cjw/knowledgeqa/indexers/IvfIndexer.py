@@ -0,0 +1,302 @@
+import logging
+import os
+from typing import List, Optional, Tuple, Set
+
+import numpy as np
+
+from cjw.knowledgeqa.indexers.LocalIndexer import LocalIndexer
+from cjw.knowledgeqa.indexers.Quantizer import Quantizer
+from cjw.utilities.embedding.Embedding import Embedding
+
+
+class IvfIndexer(LocalIndexer):
+    """An approximate :class:`LocalIndexer` with an inverted file (IVF) of the embeddings.
+
+    The embeddings are clustered with k-means, and a search only scores the documents in the clusters whose centroids
+    are nearest to the query.  The number of clusters probed trades recall for latency.  Until enough documents are
+    added to train the clusters, searches are exact.
+
+    Deleted documents are only marked as tombstones, and are purged when they make up too much of the index.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    __DEFAULT_PROBES = 8
+    __DEFAULT_TRAINING_SIZE = 10000     # Train the clusters automatically when the index grows to this size
+    __TRAINING_SAMPLES_PER_LIST = 64    # Samples used to train each cluster
+    __TRAINING_ITERATIONS = 10
+    __COMPACTION_RATIO = 0.2            # Purge tombstones when they are more than this portion of the rows
+    __ASSIGNMENT_CHUNK = 65536          # Rows assigned to clusters at a time, to bound the memory
+    __IVF_FILE = "ivf.npz"
+
+    def __init__(
+            self,
+            embedding: Embedding,
+            indexName: str = "local",
+            path: str = None,
+            lists: int = None,
+            probes: int = __DEFAULT_PROBES,
+            trainingSize: int = __DEFAULT_TRAINING_SIZE,
+            lexical: bool = False,
+            quantizer: Quantizer = None,
+            rerank: int = LocalIndexer.DEFAULT_RERANK,
+    ):
+        """ Creates an empty in-memory index, or opens an index saved in a directory
+
+        Args:
+            embedding (Embedding): The embedding model used for both the documents and the queries
+            indexName (str): Name of the index (default "local")
+            path (str): Directory of a saved index to open.  (default None for an in-memory index)
+            lists (int): Number of clusters.  (default 4 * sqrt(number of documents) at training)
+            probes (int): Default number of clusters to search.  More is slower but more accurate. (default 8)
+            trainingSize (int): Train the clusters when this many documents are added.  (default 10000)
+            lexical (bool): Also index the words of the documents for lexical and hybrid searches.  (default False)
+            quantizer (Quantizer): Searches the embeddings compressed by this quantizer.  See :class:`LocalIndexer`.
+            rerank (int): Re-ranks this many times the number of results with the exact embeddings.  (default 4)
+
+        Raises:
+            Indexer.IndexNotFoundError
+        """
+        self.lists = lists
+        self.probes = probes
+        self.trainingSize = trainingSize
+
+        self._centroids: Optional[np.ndarray] = None    # Normalized centroids of the clusters, None if untrained
+        self._assignments: List[int] = []               # Cluster of each row
+        self._members: List[List[int]] = []             # Rows of each cluster
+        self._memberArrays: dict = dict()               # Cached rows of each cluster as arrays
+        self._tombstones: Set[int] = set()              # Rows deleted but not yet purged
+        self._alive: Optional[np.ndarray] = None        # Cached mask of rows not deleted
+
+        super().__init__(embedding, indexName, path, lexical, quantizer, rerank)
+
+    def _load(self, path: str):
+        super()._load(path)
+
+        ivfFile = os.path.join(path, self.__IVF_FILE)
+        if os.path.exists(ivfFile):
+            with np.load(ivfFile) as ivf:
+                self._centroids = ivf["centroids"]
+                self._assignments = ivf["assignments"].tolist()
+            self._group()
+        else:
+            self._assignments = [-1] * self._count     # Untrained
+
+    def save(self, path: str = None) -> str:
+        self._compact(force=True)
+        path = super().save(path)
+
+        ivfFile = os.path.join(path, self.__IVF_FILE)
+        if self._centroids is not None:
+            with open(ivfFile + ".tmp", "wb") as fd:
+                np.savez(fd, centroids=self._centroids, assignments=np.array(self._assignments, dtype=np.int32))
+            os.replace(ivfFile + ".tmp", ivfFile)
+        elif os.path.exists(ivfFile):
+            os.remove(ivfFile)
+
+        return path
+
+    def _assign(self, vectors: np.ndarray, centroids: np.ndarray = None) -> np.ndarray:
+        """Finds the nearest centroid of each vector."""
+        centroids = self._centroids if centroids is None else centroids
+        return np.concatenate([
+            np.argmax(vectors[i:i + self.__ASSIGNMENT_CHUNK] @ centroids.T, axis=1)
+            for i in range(0, len(vectors), self.__ASSIGNMENT_CHUNK)
+        ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+    def _group(self):
+        """Rebuilds the member lists of the clusters from the assignments."""
+        self._members = [[] for _ in range(len(self._centroids))]
+        for row, cluster in enumerate(self._assignments):
+            if row not in self._tombstones:
+                self._members[cluster].append(row)
+        self._memberArrays = dict()
+
+    def train(self, lists: int = None, iterations: int = __TRAINING_ITERATIONS):
+        """ Clusters the embeddings with spherical k-means, and assigns every document to its cluster.
+        It is done automatically when the index grows large enough, but can be called to retrain after the data
+        have drifted.
+
+        Args:
+            lists (int): Number of clusters.  (default the one given at the construction, or 4 * sqrt(size))
+            iterations (int): Number of k-means iterations (default 10)
+        """
+        self._compact(force=True)
+        if self._count == 0:
+            return
+
+        vectors = self._vectors[:self._count]
+        lists = min(lists or self.lists or int(4 * np.sqrt(self._count)), self._count)
+        lists = max(lists, 1)
+
+        rng = np.random.default_rng(0)
+        samples = min(self._count, lists * self.__TRAINING_SAMPLES_PER_LIST)
+        training = vectors[rng.choice(self._count, samples, replace=False)]
+        centroids = training[rng.choice(samples, lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = self._assign(training, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, training)
+            counts = np.bincount(assignments, minlength=lists)
+
+            # Empty clusters are restarted at random samples
+            empty = counts == 0
+            sums[empty] = training[rng.choice(samples, int(empty.sum()))]
+            centroids = self._normalize(sums)
+
+        self._centroids = centroids
+        self._assignments = self._assign(vectors).tolist()
+        self._group()
+        self.logger.info(f"Trained {lists} clusters with {samples} samples")
+
+    def _placed(self, rows: List[int]):
+        if self._centroids is None:
+            self._assignments += [-1] * (self._count - len(self._assignments))
+            if self._liveCount() >= self.trainingSize:
+                self.train()
+            return
+
+        clusters = self._assign(self._vectors[rows])
+        for row, cluster in zip(rows, clusters):
+            cluster = int(cluster)
+            if row < len(self._assignments):
+                # An existing document is replaced.  It may move to another cluster.
+                previous = self._assignments[row]
+                if previous == cluster:
+                    continue
+                self._members[previous].remove(row)
+                self._memberArrays.pop(previous, None)
+                self._assignments[row] = cluster
+            else:
+                self._assignments.append(cluster)
+
+            self._members[cluster].append(row)
+            self._memberArrays.pop(cluster, None)
+
+    def _topK(
+            self,
+            queries: np.ndarray,
+            top: int,
+            mask: np.ndarray = None,
+            rerank: int = None,
+            probes: int = None,
+            **kwargs
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """ Finds the approximate nearest rows of a batch of queries
+
+        Args:
+            queries (np.ndarray): Normalized query vectors, one per row
+            top (int): Number of rows to find for each query
+            mask (np.ndarray): Rows allowed by a filter.  (default None for all the rows)
+            rerank (int): Candidates re-ranked, as a multiple of top.  (default the one given at the construction)
+            probes (int): Number of nearest clusters to search.  (default the one given at the construction)
+
+        Returns:
+            For each query, the rows and their cosine similarities, sorted by descending similarity
+        """
+        if mask is not None and self._tombstones:
+            mask = mask & self._aliveMask()
+
+        if self._centroids is None:
+            # Not trained yet.  Search exhaustively.
+            if mask is not None:
+                return super()._topK(queries, top, mask, rerank)
+            scores = self._scores(queries)
+            if self._tombstones:
+                scores[:, ~self._aliveMask()] = -np.inf
+            return self._best(queries, scores, top, rerank=rerank)
+
+        probes = min(probes or self.probes, len(self._centroids))
+        if mask is not None and np.count_nonzero(mask) <= self._liveCount() * probes / len(self._centroids):
+            # The filter is more selective than the clusters.  Scoring what passes it is cheaper, and exact.
+            return super()._topK(queries, top, mask, rerank)
+
+        nearest = self._select(queries @ self._centroids.T, probes)
+
+        results = []
+        for query, (clusters, _) in zip(queries, nearest):
+            rows = np.concatenate([self._memberArray(c) for c in clusters])
+            if mask is not None:
+                rows = rows[mask[rows]]
+            query = query[np.newaxis, :]
+            results += self._best(query, self._scores(query, rows), top, rows, rerank)
+
+        return results
+
+    def _memberArray(self, cluster: int) -> np.ndarray:
+        if cluster not in self._memberArrays:
+            self._memberArrays[cluster] = np.array(self._members[cluster], dtype=np.int64)
+        return self._memberArrays[cluster]
+
+    def _aliveMask(self) -> np.ndarray:
+        if self._alive is None or len(self._alive) != self._count:
+            self._alive = np.ones(self._count, dtype=bool)
+            self._alive[list(self._tombstones)] = False
+        return self._alive
+
+    def _compact(self, force: bool = False):
+        """Purges the tombstones, if there are too many of them or if forced to."""
+        if not self._tombstones:
+            return
+        if not force and len(self._tombstones) <= self.__COMPACTION_RATIO * self._count:
+            return
+
+        alive = np.flatnonzero(self._aliveMask())
+        self._pack(alive)
+        self._ids = [self._ids[r] for r in alive]
+        self._documents = [self._documents[r] for r in alive]
+        self._assignments = [self._assignments[r] for r in alive]
+        self._columns.take(alive)
+        if self._codes is not None:
+            self._codes = self._codes[alive]
+        self._rows = {docId: row for row, docId in enumerate(self._ids)}
+        self._count = len(alive)
+        self._tombstones = set()
+        self._alive = None
+
+        if self._centroids is not None:
+            self._group()
+
+    async def delete(self, ids: str | List[str]) -> dict:
+        if isinstance(ids, str):
+            ids = [ids]
+
+        items = []
+        for docId in ids:
+            row = self._rows.pop(docId, None)
+            if row is None:
+                items.append({"_id": docId, "status": 404, "result": "not_found"})
+                continue
+
+            self._tombstones.add(row)
+            if self._lexicon is not None:
+                self._lexicon.remove(docId)
+            if self._centroids is not None:
+                cluster = self._assignments[row]
+                self._members[cluster].remove(row)
+                self._memberArrays.pop(cluster, None)
+            items.append({"_id": docId, "status": 200, "result": "deleted"})
+
+        self._alive = None
+        self._compact()
+        return {"items": items}
+
+    async def kill(self) -> dict:
+        status = await super().kill()
+        if self.path and os.path.exists(os.path.join(self.path, self.__IVF_FILE)):
+            os.remove(os.path.join(self.path, self.__IVF_FILE))
+
+        self._centroids = None
+        self._assignments = []
+        self._members = []
+        self._memberArrays = dict()
+        self._tombstones = set()
+        self._alive = None
+        return status
+
+    def _liveCount(self) -> int:
+        return self._count - len(self._tombstones)
+
+    async def size(self) -> int:
+        return self._liveCount()
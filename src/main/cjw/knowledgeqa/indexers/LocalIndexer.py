@@ -0,0 +1,621 @@
+import heapq
+import json
+import logging
+import os
+import tempfile
+from typing import List, Dict, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from cjw.knowledgeqa.indexers.AttributeColumns import AttributeColumns
+from cjw.knowledgeqa.indexers.Bm25Index import Bm25Index
+from cjw.knowledgeqa.indexers.Filter import Filter
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+from cjw.knowledgeqa.indexers.Quantizer import Quantizer
+from cjw.utilities.embedding.Embedding import Embedding
+
+
+class LocalIndexer(Indexer):
+    """Indexes the documents in memory with NumPy.
+
+    The embeddings are normalized and kept in a contiguous float32 matrix, so a search is a single matrix-vector
+    product followed by a top-k selection.  No database server is needed.
+
+    An index can be saved to a directory, holding the embedding matrix as an ``.npy`` file and the IDs and documents
+    in a JSON sidecar.  Opening a saved index memory-maps the matrix copy-on-write, so the pages are loaded lazily
+    and shared by processes forked from the same parent until they are modified.  Adding to an opened index moves
+    the matrix to a temporary file next to the saved one, rather than into the memory, and grows it there.
+
+    Optionally, the key fields are also indexed by words with BM25, for lexical or hybrid (lexical + embedding)
+    searches.
+
+    With a :class:`Quantizer`, the embeddings are also kept as short codes which the searches score instead, and the
+    best candidates are re-ranked with the exact embeddings.  Saved and opened again, only the codes are loaded in the
+    memory; the exact embeddings are read from the memory-mapped file for the few rows re-ranked.
+
+    Searches can be restricted by a :class:`Filter` on the document fields.  The filter is evaluated on columns of
+    the fields before scoring, so only the documents passing it are scored and all the top-k results are relevant.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    DEFAULT_RERANK = 4          # Candidates re-ranked with the exact embeddings, as a multiple of the results
+
+    __INITIAL_CAPACITY = 1024
+    __COPY_CHUNK = 65536        # Rows copied at a time between mapped matrices
+    __FUSION_DEPTH = 50         # Results of each ranking considered in a hybrid search
+    __FUSION_K = 60             # Constant of the reciprocal rank fusion.  Larger values flatten the rank differences.
+    __QUANTIZER_SAMPLES = 65536 # Max embeddings used to train a quantizer
+    __VECTOR_FILE = "vectors.npy"
+    __CODE_FILE = "codes.npy"
+    __QUANTIZER_FILE = "quantizer.npz"
+    __DOCUMENT_FILE = "documents.json"
+
+    @classmethod
+    def new(cls, embedding: Embedding, path: str, indexName: str = "local", **kwargs) -> "LocalIndexer":
+        """ Creates a new index to be saved at the given directory.
+
+        Args:
+            embedding (Embedding): The embedding model used for both the documents and the queries
+            path (str): Directory where the index is saved
+            indexName (str): Name of the index (default "local")
+            **kwargs: Subclass specific arguments
+
+        Returns:
+            The new, empty index
+
+        Raises:
+            Indexer.IndexExistError
+        """
+        if os.path.exists(os.path.join(path, cls.__DOCUMENT_FILE)):
+            raise Indexer.IndexExistError(path)
+
+        index = cls(embedding, indexName, **kwargs)
+        index.path = path
+        return index
+
+    def __init__(
+            self,
+            embedding: Embedding,
+            indexName: str = "local",
+            path: str = None,
+            lexical: bool = False,
+            quantizer: Quantizer = None,
+            rerank: int = DEFAULT_RERANK,
+    ):
+        """ Creates an empty in-memory index, or opens an index saved in a directory
+
+        Args:
+            embedding (Embedding): The embedding model used for both the documents and the queries
+            indexName (str): Name of the index (default "local")
+            path (str): Directory of a saved index to open.  (default None for an in-memory index)
+            lexical (bool): Also index the words of the documents for lexical and hybrid searches.  (default False)
+            quantizer (Quantizer): Searches the embeddings compressed by this quantizer, once there are enough of them
+                to train it.  (default None for exact searches.  Taken from the saved index if it has one.)
+            rerank (int): Re-ranks this many times the number of results requested with the exact embeddings, if
+                quantized.  0 not to re-rank. (default 4)
+
+        Raises:
+            Indexer.IndexNotFoundError
+        """
+        self.indexName = indexName
+        self.embedding = embedding
+        self.path = path
+        self.quantizer = quantizer
+        self.rerank = rerank
+
+        self._vectors: Optional[np.ndarray] = None  # Normalized embeddings.  Rows beyond _count are spare capacity.
+        self._count = 0                             # Number of rows in use
+        self._ids: List[str] = []                   # Document ID of each row
+        self._documents: List[dict] = []            # Document of each row
+        self._rows: Dict[str, int] = dict()         # Row of each document ID
+        self._columns = AttributeColumns()          # Fields filtered on, by row
+        self._codes: Optional[np.ndarray] = None    # Quantized embeddings, once the quantizer is trained
+        self._scratch = None                        # Temporary file of the matrix of an opened index, once added to
+
+        self.keyFields: List[str] = []              # Fields ever used as key fields
+        self._lexicon: Optional[Bm25Index] = Bm25Index() if lexical else None
+
+        if path:
+            self._load(path)
+
+    def _load(self, path: str):
+        documentFile = os.path.join(path, self.__DOCUMENT_FILE)
+        if not os.path.exists(documentFile):
+            raise Indexer.IndexNotFoundError(path)
+
+        with open(documentFile, "r") as fd:
+            sidecar = json.load(fd)
+
+        self.indexName = sidecar.get("indexName", self.indexName)
+        self._ids = sidecar["ids"]
+        self._documents = sidecar["documents"]
+        self._rows = {docId: row for row, docId in enumerate(self._ids)}
+        self._count = len(self._ids)
+        self._columns.clear()
+        self.keyFields = sidecar.get("keyFields", [])
+
+        if self._lexicon is not None:
+            for docId, document in zip(self._ids, self._documents):
+                self._lexicon.add(docId, self._text(document, self.keyFields))
+
+        if self._count:
+            # Copy-on-write mapping: pages are read on demand, and modifications never reach the file
+            self._vectors = np.load(os.path.join(path, self.__VECTOR_FILE), mmap_mode="c")
+            self._scratch = None
+
+        if os.path.exists(os.path.join(path, self.__QUANTIZER_FILE)):
+            self.quantizer = Quantizer.load(os.path.join(path, self.__QUANTIZER_FILE))
+            if os.path.exists(os.path.join(path, self.__CODE_FILE)):
+                self._codes = np.load(os.path.join(path, self.__CODE_FILE))
+
+        self.logger.info(f"Opened index {self.indexName} of {self._count} documents from {path}")
+
+    def save(self, path: str = None) -> str:
+        """ Saves the index to a directory.  Files are replaced atomically, so readers of an earlier save are not
+        disturbed.
+
+        Args:
+            path (str): The directory.  (default the one the index was opened from or created for)
+
+        Returns:
+            The directory
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the index")
+
+        os.makedirs(path, exist_ok=True)
+
+        vectorFile = os.path.join(path, self.__VECTOR_FILE)
+        with open(vectorFile + ".tmp", "wb") as fd:
+            vectors = self._vectors[:self._count] if self._count else np.zeros((0, 0), dtype=np.float32)
+            np.save(fd, np.ascontiguousarray(vectors))
+        os.replace(vectorFile + ".tmp", vectorFile)
+
+        documentFile = os.path.join(path, self.__DOCUMENT_FILE)
+        with open(documentFile + ".tmp", "w") as fd:
+            json.dump(
+                {
+                    "indexName": self.indexName,
+                    "keyFields": self.keyFields,
+                    "ids": self._ids,
+                    "documents": self._documents
+                },
+                fd, separators=(",", ":"), ensure_ascii=False, default=str
+            )
+        os.replace(documentFile + ".tmp", documentFile)
+
+        quantizerFile = os.path.join(path, self.__QUANTIZER_FILE)
+        codeFile = os.path.join(path, self.__CODE_FILE)
+        if self.quantizer is not None and self.quantizer.trained:
+            self.quantizer.save(quantizerFile + ".tmp")
+            os.replace(quantizerFile + ".tmp", quantizerFile)
+        elif os.path.exists(quantizerFile):
+            os.remove(quantizerFile)
+
+        if self._quantized():
+            with open(codeFile + ".tmp", "wb") as fd:
+                np.save(fd, np.ascontiguousarray(self._codes[:self._count]))
+            os.replace(codeFile + ".tmp", codeFile)
+        elif os.path.exists(codeFile):
+            os.remove(codeFile)
+
+        self.path = path
+        return path
+
+    @classmethod
+    def _text(cls, document: dict, keyFields: List[str]) -> str:
+        return "\n".join([str(document[f]) for f in keyFields if document.get(f)])
+
+    @classmethod
+    def _normalize(cls, vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32, copy=False)
+
+    def _reserve(self, rows: int, dimension: int):
+        """Makes sure the matrix has room for this many rows."""
+        if self._vectors is None:
+            capacity = max(self.__INITIAL_CAPACITY, rows)
+            self._vectors = np.zeros((capacity, dimension), dtype=np.float32)
+
+        elif isinstance(self._vectors, np.memmap):
+            if self._scratch is None or rows > len(self._vectors):
+                self._spill(max(2 * len(self._vectors), rows) if rows > len(self._vectors) else len(self._vectors))
+
+        elif rows > len(self._vectors):
+            capacity = max(2 * len(self._vectors), rows)
+            grown = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+            grown[:self._count] = self._vectors[:self._count]
+            self._vectors = grown
+
+    def _spill(self, capacity: int):
+        """ Maps the matrix of an opened index from a temporary file with room for this many rows.  The file is
+        created in the index directory at the first call, with a copy of the saved matrix, and extended in place
+        afterward.  So the matrix is never copied into the memory, and the saved file is left unchanged.
+
+        Args:
+            capacity (int): Rows of the matrix
+        """
+        dimension = self._vectors.shape[1]
+        size = capacity * dimension * np.dtype(np.float32).itemsize
+
+        if self._scratch is None:
+            scratch = tempfile.TemporaryFile(dir=self.path)
+            scratch.truncate(size)
+            vectors = np.memmap(scratch, dtype=np.float32, mode="r+", shape=(capacity, dimension))
+            for start in range(0, self._count, self.__COPY_CHUNK):
+                end = min(start + self.__COPY_CHUNK, self._count)
+                vectors[start:end] = self._vectors[start:end]
+            self._scratch = scratch
+
+        else:
+            self._vectors.flush()
+            self._scratch.truncate(size)
+            vectors = np.memmap(self._scratch, dtype=np.float32, mode="r+", shape=(capacity, dimension))
+
+        self._vectors = vectors
+
+    def _pack(self, rows: np.ndarray):
+        """ Moves rows of the matrix to its front in place, in chunks, e.g. to purge deleted rows.  A mapped matrix
+        is not copied into the memory.
+
+        Args:
+            rows (np.ndarray): The rows, in increasing order
+        """
+        self._reserve(self._count, self._vectors.shape[1])     # Writable without copying on write
+
+        # Row i is moved from rows[i] >= i, so the rows yet to move are never overwritten
+        for start in range(0, len(rows), self.__COPY_CHUNK):
+            chunk = rows[start:start + self.__COPY_CHUNK]
+            self._vectors[start:start + len(chunk)] = self._vectors[chunk]
+
+    async def _embedQueries(self, queries: List[str]) -> np.ndarray:
+        """Embeds the queries into a normalized matrix.  Empty queries get zero vectors."""
+        vectors = await self.embedding.embedBatch(queries)
+        dimension = self._vectors.shape[1]
+        return self._normalize(np.array([
+            v if v is not None else np.zeros(dimension, dtype=np.float32) for v in vectors
+        ], dtype=np.float32))
+
+    @classmethod
+    def _select(cls, scores: np.ndarray, top: int, rows: np.ndarray = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """ Selects the top scores of each query
+
+        Args:
+            scores (np.ndarray): Similarities of each query (in rows) to the candidates (in columns)
+            top (int): Number of candidates to select for each query
+            rows (np.ndarray): Row of each candidate in the matrix.  (default None if candidates are all the rows)
+
+        Returns:
+            For each query, the selected rows and their similarities, sorted by descending similarity
+        """
+        candidates = scores.shape[1]
+        top = min(top, candidates)
+
+        if top < candidates:
+            selected = np.argpartition(-scores, top - 1, axis=1)[:, :top]
+        else:
+            selected = np.tile(np.arange(candidates), (len(scores), 1))
+
+        topScores = np.take_along_axis(scores, selected, axis=1)
+        order = np.argsort(-topScores, axis=1, kind="stable")
+        selected = np.take_along_axis(selected, order, axis=1)
+        topScores = np.take_along_axis(topScores, order, axis=1)
+
+        if rows is not None:
+            selected = rows[selected]
+
+        # Candidates masked out with -inf are never results
+        return [(r[s > -np.inf], s[s > -np.inf]) for r, s in zip(selected, topScores)]
+
+    def _quantized(self) -> bool:
+        return self._codes is not None and self.quantizer is not None and self.quantizer.trained
+
+    def quantize(self):
+        """ Trains the quantizer on a sample of the embeddings, and encodes them all.  It is done automatically when
+        the index grows large enough for the quantizer, but can be called to retrain after the data have drifted.
+        """
+        if self.quantizer is None:
+            raise ValueError(f"Index {self.indexName} has no quantizer")
+        if self._count == 0:
+            return
+
+        rng = np.random.default_rng(0)
+        samples = min(self._count, self.__QUANTIZER_SAMPLES)
+        self.quantizer.train(self._vectors[np.sort(rng.choice(self._count, samples, replace=False))])
+        self._codes = self.quantizer.encode(self._vectors[:self._count])
+        self.logger.info(f"Quantized {self._count} embeddings into {self._codes.nbytes} bytes")
+
+    def _encode(self, rows: List[int]):
+        """Encodes the embeddings written to the rows, or trains the quantizer when there are enough of them."""
+        if self.quantizer is None or not rows:
+            return
+
+        if not self._quantized():
+            if self._count >= self.quantizer.trainingSize:
+                self.quantize()
+            return
+
+        if self._count > len(self._codes):
+            grown = np.zeros((max(2 * len(self._codes), self._count), self._codes.shape[1]), dtype=self._codes.dtype)
+            grown[:len(self._codes)] = self._codes
+            self._codes = grown
+
+        self._codes[rows] = self.quantizer.encode(self._vectors[rows])
+
+    def _scores(self, queries: np.ndarray, rows: np.ndarray = None) -> np.ndarray:
+        """ Scores queries against the rows, approximately from the codes if quantized
+
+        Args:
+            queries (np.ndarray): Normalized query vectors, one per row
+            rows (np.ndarray): The rows to score.  (default None for all the rows)
+
+        Returns:
+            The similarities of each query (in rows) to each row (in columns)
+        """
+        if self._quantized():
+            return self.quantizer.scores(queries, self._codes[:self._count] if rows is None else self._codes[rows])
+        return queries @ (self._vectors[:self._count] if rows is None else self._vectors[rows]).T
+
+    def _best(
+            self, queries: np.ndarray, scores: np.ndarray, top: int, rows: np.ndarray = None, rerank: int = None
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Selects the top rows by the scores.  Approximate scores of the best candidates are made exact."""
+        rerank = self.rerank if rerank is None else rerank
+        if not self._quantized() or not rerank:
+            return self._select(scores, top, rows)
+
+        results = []
+        for query, (candidates, _) in zip(queries, self._select(scores, top * rerank, rows)):
+            candidates = np.sort(candidates)    # Read the memory-mapped embeddings in order
+            results += self._select((self._vectors[candidates] @ query)[np.newaxis, :], top, candidates)
+        return results
+
+    def _topK(
+            self, queries: np.ndarray, top: int, mask: np.ndarray = None, rerank: int = None, **kwargs
+    ) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """ Finds the nearest rows of a batch of queries with a single matrix multiplication
+
+        Args:
+            queries (np.ndarray): Normalized query vectors, one per row
+            top (int): Number of rows to find for each query
+            mask (np.ndarray): Rows allowed by a filter.  (default None for all the rows)
+            rerank (int): Candidates re-ranked, as a multiple of top.  (default the one given at the construction)
+            **kwargs: Subclass specific search parameters
+
+        Returns:
+            For each query, the rows and their cosine similarities, sorted by descending similarity
+        """
+        if mask is None:
+            return self._best(queries, self._scores(queries), top, rerank=rerank)
+
+        rows = np.flatnonzero(mask)
+        return self._best(queries, self._scores(queries, rows), top, rows, rerank)
+
+    def _filterMask(self, filter: Filter) -> np.ndarray:
+        """Evaluates a filter on the columns of the fields, giving the mask of the rows passing it."""
+        mask = np.ones(self._count, dtype=bool)
+        for field, operator, value in filter.conditions:
+            if field == "_id":
+                ids = [value] if operator in ["$eq", "$ne"] else value
+                found = np.zeros(self._count, dtype=bool)
+                found[[self._rows[str(i)] for i in ids if str(i) in self._rows]] = True
+                mask &= found if operator in ["$eq", "$in"] else ~found
+            else:
+                mask &= self._columns.mask(field, operator, value, self._documents[:self._count])
+        return mask
+
+    def _placed(self, rows: List[int]):
+        """Called after embeddings are written to the rows, for subclasses to keep their structures up to date."""
+        pass
+
+    def _hit(self, row: int, score: float) -> dict:
+        return {**self._documents[row], "_id": self._ids[row], "_score": float(score)}
+
+    def _removeRow(self, row: int):
+        """Removes a row by moving the last row into its place, so the matrix stays contiguous."""
+        last = self._count - 1
+        del self._rows[self._ids[row]]
+
+        if row != last:
+            self._vectors[row] = self._vectors[last]
+            self._ids[row] = self._ids[last]
+            self._documents[row] = self._documents[last]
+            self._columns.move(last, row)
+            if self._codes is not None:
+                self._codes[row] = self._codes[last]
+            self._rows[self._ids[row]] = row
+
+        self._ids.pop()
+        self._documents.pop()
+        self._count -= 1
+
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> dict:
+        # Work on copies so that the caller's data are left intact
+        documents = []
+        for item in data:
+            document = dict(item)
+            if idField:
+                document["_id"] = str(item[idField])
+            elif "_id" not in document:
+                document["_id"] = str(uuid4())
+            documents.append(document)
+
+        # Embed the key fields of all the documents in a batch
+        self.keyFields = list(dict.fromkeys(self.keyFields + keyFields))
+        texts = [self._text(d, keyFields) for d in documents]
+        vectors = await self.embedding.embedBatch(texts)
+
+        items = []
+        placed = []
+        for document, text, vector in zip(documents, texts, vectors):
+            docId = document.pop("_id")
+            if vector is None:
+                items.append({"_id": docId, "status": 400, "error": "Nothing to embed in the key fields"})
+                continue
+
+            self._reserve(self._count + 1, len(vector))
+            row = self._rows.get(docId)
+            if row is None:
+                # A new document goes to the end of the matrix
+                row = self._count
+                self._count += 1
+                self._ids.append(docId)
+                self._documents.append(document)
+                self._rows[docId] = row
+            else:
+                # Existing IDs are replaced
+                self._documents[row] = document
+
+            self._columns.set(row, document)
+            self._vectors[row] = self._normalize(np.asarray(vector, dtype=np.float32))
+            if self._lexicon is not None:
+                self._lexicon.add(docId, text)
+            placed.append(row)
+            items.append({"_id": docId, "status": 200})
+
+        self._encode(placed)
+        self._placed(placed)
+
+        errors = any([item["status"] != 200 for item in items])
+        if errors:
+            self.logger.warning(f"Failed to index {sum([item['status'] != 200 for item in items])} documents")
+
+        return {"errors": errors, "items": items}
+
+    def _lexicalTopK(self, query: str, top: int, allowed: set = None) -> Tuple[np.ndarray, np.ndarray]:
+        found = self._lexicon.search(query, top, allowed)
+        return (
+            np.array([self._rows[docId] for docId, _ in found], dtype=np.int64),
+            np.array([score for _, score in found], dtype=np.float32)
+        )
+
+    @classmethod
+    def _fuse(cls, rankings: List[np.ndarray], top: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Merges rankings of rows by reciprocal rank fusion."""
+        fused: Dict[int, float] = dict()
+        for ranking in rankings:
+            for rank, row in enumerate(ranking):
+                fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (cls.__FUSION_K + rank + 1)
+
+        best = heapq.nlargest(top, fused.items(), key=lambda f: f[1])
+        return np.array([r for r, _ in best], dtype=np.int64), np.array([s for _, s in best], dtype=np.float32)
+
+    async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
+        """ Searches for nearest neighbors of the query in the embedding space, or by words.
+
+        Args:
+            query (str): The text to fish out relevant documents in the database
+            top (int): Number of documents to get
+            **kwargs:
+                - mode (str): "vector" for the embedding search, "lexical" for BM25 on the words, or "hybrid" for
+                  both merged by reciprocal rank fusion.  The latter two need a lexical index. (default "vector")
+                - prefilter (int): Only score the embeddings of this many best lexical matches.  (default None)
+                - filter (dict | Filter): Only search the documents passing the filter.  (default None)
+                - rerank (int): Candidates re-ranked, if quantized.  (default the one given at the construction)
+                - Other subclass specific parameters
+
+        Returns:
+            The documents with their "_id" and "_score"
+        """
+        return (await self.searchMany([query], top, **kwargs))[0]
+
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        mode = kwargs.pop("mode", "vector")
+        prefilter = kwargs.pop("prefilter", None)
+        filter = Filter.of(kwargs.pop("filter", None))
+
+        if mode not in ["vector", "lexical", "hybrid"]:
+            raise ValueError(f"Unknown search mode {mode}")
+        if (mode != "vector" or prefilter) and self._lexicon is None:
+            raise ValueError(f"Index {self.indexName} has no lexical index.  Create it with lexical=True.")
+
+        if self._count == 0 or top <= 0 or (filter and filter.void):
+            return [[] for _ in queries]
+
+        mask = self._filterMask(filter) if filter else None
+        allowed = {self._ids[r] for r in np.flatnonzero(mask)} if mask is not None and (mode != "vector" or prefilter) else None
+
+        if mode == "lexical":
+            rankings = [self._lexicalTopK(q, top, allowed) for q in queries]
+
+        else:
+            depth = max(top, self.__FUSION_DEPTH) if mode == "hybrid" else top
+            vectors = await self._embedQueries(queries)
+
+            if prefilter:
+                # Only the embeddings of the lexical candidates are scored
+                rankings = []
+                for query, vector in zip(queries, vectors):
+                    rows, _ = self._lexicalTopK(query, prefilter, allowed)
+                    rankings += self._select((self._vectors[rows] @ vector)[np.newaxis, :], depth, rows)
+            else:
+                # All the queries are scored with a single matrix multiplication
+                rankings = self._topK(vectors, depth, mask=mask, **kwargs)
+
+            # Nothing matches empty queries
+            empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+            rankings = [r if v.any() else empty for v, r in zip(vectors, rankings)]
+
+            if mode == "hybrid":
+                rankings = [
+                    self._fuse([rows, self._lexicalTopK(query, depth, allowed)[0]], top)
+                    for query, (rows, _) in zip(queries, rankings)
+                ]
+
+        return [[self._hit(r, s) for r, s in zip(rows, scores)] for rows, scores in rankings]
+
+    async def get(self, ids: str | List[str]) -> List[dict]:
+        if isinstance(ids, str):
+            ids = [ids]
+
+        results = []
+        for docId in ids:
+            row = self._rows.get(docId)
+            if row is None:
+                results.append({"_id": docId, "_found": False})
+            else:
+                results.append({**self._documents[row], "_id": docId, "_found": True})
+
+        return results
+
+    async def delete(self, ids: str | List[str]) -> dict:
+        if isinstance(ids, str):
+            ids = [ids]
+
+        items = []
+        for docId in ids:
+            row = self._rows.get(docId)
+            if row is None:
+                items.append({"_id": docId, "status": 404, "result": "not_found"})
+            else:
+                self._removeRow(row)
+                if self._lexicon is not None:
+                    self._lexicon.remove(docId)
+                items.append({"_id": docId, "status": 200, "result": "deleted"})
+
+        return {"items": items}
+
+    async def kill(self) -> dict:
+        if self.path:
+            for file in [self.__VECTOR_FILE, self.__DOCUMENT_FILE, self.__CODE_FILE, self.__QUANTIZER_FILE]:
+                if os.path.exists(os.path.join(self.path, file)):
+                    os.remove(os.path.join(self.path, file))
+
+        self._vectors = None
+        self._scratch = None
+        self._codes = None
+        self._count = 0
+        self._ids = []
+        self._documents = []
+        self._rows = dict()
+        self._columns.clear()
+        if self._lexicon is not None:
+            self._lexicon.clear()
+        return {"acknowledged": True}
+
+    async def size(self) -> int:
+        return self._count
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional, Iterator
+
+
+class Manifest:
+    """Content hashes of the documents in an index, to tell which documents changed since they were indexed.
+
+    The manifest is kept in a JSON file next to the data, as it is for the index as a whole rather than any database.
+    See :meth:`Indexer.sync`.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    def __init__(self, path: str = None):
+        """ Opens a manifest, or starts an empty one if the file does not exist
+
+        Args:
+            path (str): The JSON file.  (default None for a manifest only in the memory)
+        """
+        self.path = path
+        self.hashes: Dict[str, str] = dict()    # Document ID -> content hash
+
+        if path and os.path.exists(path):
+            with open(path, "r") as fd:
+                self.hashes = json.load(fd)
+            self.logger.info(f"Loaded manifest of {len(self.hashes)} documents from {path}")
+
+    @classmethod
+    def hash(cls, document: dict, keyFields: List[str]) -> str:
+        """ Hashes the content of a document.  The key fields are part of it, as changing them changes the embedding.
+
+        Args:
+            document (dict): The document
+            keyFields (List[str]): Filed names whose values are used in embedding
+
+        Returns:
+            The hash
+        """
+        content = json.dumps([keyFields, document], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.hashes)
+
+    def get(self, docId: str) -> Optional[str]:
+        return self.hashes.get(docId)
+
+    def set(self, docId: str, contentHash: str):
+        self.hashes[docId] = contentHash
+
+    def remove(self, docId: str):
+        self.hashes.pop(docId, None)
+
+    def save(self, path: str = None):
+        """ Writes the manifest.  The file is replaced atomically.
+
+        Args:
+            path (str): The JSON file.  (default the one it was opened from)
+        """
+        path = path or self.path
+        if not path:
+            raise ValueError("No path to save the manifest")
+
+        with open(path + ".tmp", "w") as fd:
+            json.dump(self.hashes, fd, separators=(",", ":"))
+        os.replace(path + ".tmp", path)
+        self.path = path
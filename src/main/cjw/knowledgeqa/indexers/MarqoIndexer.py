@@ -1,14 +1,39 @@
-from typing import List
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Callable, Any
 from uuid import uuid4
 
 import marqo
 
+from cjw.knowledgeqa.indexers.Filter import Filter
 from cjw.knowledgeqa.indexers.Indexer import Indexer
 
 
 class MarqoIndexer(Indexer):
-    """Indexes the documents with Marqo"""
+    """Indexes the documents with Marqo.
+
+    The Marqo client is synchronous, so its calls run in a bounded thread pool and the event loop is free to serve
+    other requests in the meantime.  Each call is given a timeout.
+    """
+    logger = logging.getLogger(__qualname__)
+
     __DEFAULT_BATCH_SIZE = 20
+    __DEFAULT_WORKERS = 8       # Marqo calls of an index running at the same time
+    __DEFAULT_TIMEOUT = 60      # Seconds allowed for a Marqo call
+
+    # Search arguments of the Python client, and their names in the bulk search API
+    __BULK_SEARCH_ARGS = {
+        "searchable_attributes": "searchableAttributes",
+        "search_method": "searchMethod",
+        "show_highlights": "showHighlights",
+        "filter_string": "filter",
+        "attributes_to_retrieve": "attributesToRetrieve",
+        "score_modifiers": "scoreModifiers",
+        "model_auth": "modelAuth",
+        "text_query_prefix": "textQueryPrefix",
+    }
 
     @classmethod
     def new(cls, serverUrl: str, indexName: str, **kwargs) -> "MarqoIndexer":
@@ -34,68 +59,182 @@ class MarqoIndexer(Indexer):
 
         return MarqoIndexer(serverUrl, indexName)
 
-    def __init__(self, serverUrl: str, indexName: str):
+    def __init__(
+            self,
+            serverUrl: str,
+            indexName: str,
+            workers: int = __DEFAULT_WORKERS,
+            timeout: float = __DEFAULT_TIMEOUT
+    ):
         """ Get an existing index
 
         Args:
             serverUrl (str): URL to the Marqo server
             indexName (str): Name of the index
+            workers (int): Max number of Marqo calls running at the same time (default 8)
+            timeout (float): Default seconds allowed for a Marqo call.  Can be overridden by the "timeout" argument
+                of :meth:`add` and :meth:`search`. (default 60)
 
         Raises:
             Indexer.IndexNotFoundError
         """
         self.indexName = indexName
         self.server = marqo.Client(serverUrl)
+        self.server.config.timeout = timeout    # Also stop the HTTP request in the worker thread
+        self.timeout = timeout
+        self.bulkSearch = True     # False if the server does not support bulk search
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"marqo-{indexName}")
 
         try:
             self.index = self.server.get_index(self.indexName)
         except marqo.errors.MarqoWebError:
+            self.__executor.shutdown(wait=False)
             raise Indexer.IndexNotFoundError(self.indexName)
 
+    async def _call(self, function: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """ Runs a blocking Marqo client call in the thread pool without blocking the event loop
+
+        Args:
+            function (Callable): The Marqo client function
+            *args: Arguments of the function
+            timeout (float): Seconds to wait for the function (default the one given at the construction)
+            **kwargs: Keyword arguments of the function
+
+        Returns:
+            The return of the function
+
+        Raises:
+            asyncio.TimeoutError
+        """
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.__executor, functools.partial(function, *args, **kwargs)),
+            timeout or self.timeout
+        )
+
     async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> dict:
+        """ Adds data to the index.  See :meth:`Indexer.add`.
 
-        # Make sure there is an ID field
-        if not idField:
-            for item in data:
-                if "_id" not in item:
-                    item["_id"] = uuid4()
+        Args:
+            data (List[dict]): The data
+            keyFields (List[str]): Filed names whose values are used in embedding
+            idField (str): The field name for the document ID.  (default "_id", or generated if missing)
+            **kwargs:
+                - refresh (bool): Refresh the index after adding.  (default True)
+                - timeout (float): Seconds allowed for the call
+                - Other arguments to the Marqo add_documents()
 
+        Returns:
+            The Marqo statuses of the batches merged
+        """
+        # Make sure there is an ID field.  Work on copies so that the caller's data are left intact.
+        if not idField:
+            data = [item if "_id" in item else {**item, "_id": str(uuid4())} for item in data]
         elif idField != "_id":
-            for item in data:
-                item["_id"] = item[idField]
+            data = [{**item, "_id": item[idField]} for item in data]
 
         # Add the documents
-        status = self.index.add_documents(
+        batches = await self._call(
+            self.index.add_documents,
             data,
+            timeout=kwargs.pop("timeout", None),
             tensor_fields=keyFields,
-            auto_refresh=True,
+            auto_refresh=kwargs.pop("refresh", True),
             client_batch_size=self.__DEFAULT_BATCH_SIZE,
             **kwargs
         )
-        return status[0]
+        if isinstance(batches, dict):
+            batches = [batches]
+
+        return {
+            "errors": any([b.get("errors", False) for b in batches]),
+            "items": [item for b in batches for item in b.get("items", [])],
+        }
+
+    async def refresh(self) -> dict:
+        return await self._call(self.index.refresh)
+
+    @classmethod
+    def _filterString(cls, kwargs: dict) -> Filter | None:
+        """Replaces a structured "filter" in the search arguments with its Marqo filter string."""
+        filter = Filter.of(kwargs.pop("filter", None))
+        translated = filter.toMarqo() if filter else None
+        if translated:
+            given = kwargs.get("filter_string")
+            kwargs["filter_string"] = f"({given}) AND {translated}" if given else translated
+        return filter
 
     async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
-        results = self.index.search(q=query, limit=top, **kwargs)
+        """ Searches for nearest neighbors of the query.  See :meth:`Indexer.search`.
+
+        Args:
+            query (str): The text to fish out relevant documents in the database
+            top (int): Number of documents to get
+            **kwargs:
+                - filter (dict | Filter): Only search the documents passing the filter.  (default None)
+                - timeout (float): Seconds allowed for the call
+                - Other arguments to the Marqo search()
+
+        Returns:
+            The Marqo hits
+        """
+        kwargs = dict(kwargs)
+        filter = self._filterString(kwargs)
+        if filter and filter.void:
+            return []
+
+        timeout = kwargs.pop("timeout", None)
+        results = await self._call(self.index.search, q=query, limit=top, timeout=timeout, **kwargs)
         return results["hits"]
 
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        if not self.bulkSearch or not queries:
+            return await super().searchMany(queries, top, **kwargs)
+
+        kwargs = dict(kwargs)
+        filter = self._filterString(kwargs)
+        if filter and filter.void:
+            return [[] for _ in queries]
+
+        timeout = kwargs.get("timeout", None)
+        body = {self.__BULK_SEARCH_ARGS.get(k, k): v for k, v in kwargs.items() if k != "timeout"}
+        try:
+            results = await self._call(self.server.bulk_search, [
+                {"index": self.indexName, "q": q, "limit": top, **body} for q in queries
+            ], timeout=timeout)
+        except marqo.errors.MarqoWebError as e:
+            if e.status_code not in [404, 405]:
+                raise
+
+            # Bulk search is not available in all Marqo versions.  Search one by one from now on.
+            self.logger.warning(f"Bulk search failed, falling back to individual searches: {e}")
+            self.bulkSearch = False
+            return await super().searchMany(queries, top, **kwargs)
+
+        return [r["hits"] for r in results["result"]]
+
     async def get(self, ids: str | List[str]) -> List[dict]:
         if isinstance(ids, str):
             ids = [ids]
 
-        results = self.index.get_documents(document_ids=ids)
+        results = await self._call(self.index.get_documents, document_ids=ids)
         return results["results"]
 
     async def delete(self, ids: str | List[str]) -> dict:
         if isinstance(ids, str):
             ids = [ids]
 
-        status = self.index.delete_documents(ids=ids)
+        status = await self._call(self.index.delete_documents, ids=ids)
         return status
 
     async def kill(self) -> dict:
-        status = self.server.delete_index(self.indexName)
+        status = await self._call(self.server.delete_index, self.indexName)
         return status
 
     async def size(self) -> int:
-        stats = self.index.get_stats()
+        stats = await self._call(self.index.get_stats)
         return stats['numberOfDocuments']
+
+    async def close(self):
+        """Stops the worker threads.  The calls running are let finish."""
+        self.__executor.shutdown(wait=False)
@@ -1,30 +1,297 @@
-from typing import List, Any
+import asyncio
+import logging
+from typing import List, Any, Optional
+from uuid import uuid4
 
+import numpy as np
+
+from cjw.knowledgeqa.indexers.Filter import Filter
 from cjw.knowledgeqa.indexers.Indexer import Indexer
+from cjw.utilities.HttpSession import HttpSession
+from cjw.utilities.embedding.Embedding import Embedding
 
 
 class PineconeIndexer(Indexer):
+    """Indexes the documents with Pinecone through its HTTP API.
+
+    Pinecone stores vectors only, so the documents are embedded locally with an :class:`Embedding`, and their fields
+    are kept as Pinecone metadata.  All the requests go through a pooled keep-alive session, and uploads are sent in
+    batches, several of them in parallel.
+
+    The index host is looked up from the control plane on first use.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    DEFAULT_SERVER_URL = "https://api.pinecone.io"
+
+    __DEFAULT_BATCH_SIZE = 100      # Vectors per upsert request.  Pinecone recommends up to 100.
+    __DEFAULT_CONCURRENCY = 4       # Upsert requests in flight at the same time
+    __FETCH_BATCH_SIZE = 100        # IDs per fetch request, to keep the URLs short
+    __DELETE_BATCH_SIZE = 1000      # IDs per delete request, the most Pinecone accepts
+    __DEFAULT_SPEC = {"serverless": {"cloud": "aws", "region": "us-east-1"}}
+
+    @classmethod
+    def new(cls, serverUrl: str, indexName: str, embedding: Embedding, **kwargs) -> "PineconeIndexer":
+        """ Creates a new index.  The index is created in Pinecone on first use if it does not exist.
+
+        Args:
+            serverUrl (str): URL of the Pinecone control plane (e.g. DEFAULT_SERVER_URL)
+            indexName (str): Name of the index
+            embedding (Embedding): The embedding model used for both the documents and the queries
+            **kwargs: Other arguments.  See the constructor.
+
+        Returns:
+            The new index in the Pinecone server
+        """
+        return PineconeIndexer(serverUrl, indexName, embedding, create=True, **kwargs)
+
+    def __init__(
+            self,
+            serverUrl: str,
+            indexName: str,
+            embedding: Embedding,
+            apiKey: str = None,
+            namespace: str = "",
+            host: str = None,
+            create: bool = False,
+            dimension: int = None,
+            metric: str = "cosine",
+            spec: dict = None,
+            batchSize: int = __DEFAULT_BATCH_SIZE,
+            concurrency: int = __DEFAULT_CONCURRENCY,
+            **kwargs
+    ):
+        """ Gets an existing index
+
+        Args:
+            serverUrl (str): URL of the Pinecone control plane (e.g. DEFAULT_SERVER_URL)
+            indexName (str): Name of the index
+            embedding (Embedding): The embedding model used for both the documents and the queries
+            apiKey (str): The Pinecone API key
+            namespace (str): Namespace within the index holding the documents (default "", the default namespace)
+            host (str): URL of the index.  (default None to look it up from the control plane)
+            create (bool): Creates the index if it does not exist (default False)
+            dimension (int): Dimension of the vectors when creating the index.  (default the embedding's)
+            metric (str): Similarity metric when creating the index.  (default "cosine")
+            spec (dict): Deployment spec when creating the index.  (default serverless on AWS)
+            batchSize (int): Vectors uploaded in a request (default 100)
+            concurrency (int): Upload requests sent in parallel (default 4)
+            **kwargs: Connection pool arguments.  See :class:`HttpSession`.
+
+        Raises:
+            Indexer.IndexNotFoundError (on first use)
+        """
+        self.serverUrl = serverUrl.rstrip("/")
+        self.indexName = indexName
+        self.embedding = embedding
+        self.namespace = namespace
+        self.host = host.rstrip("/") if host else None
+        self.create = create
+        self.dimension = dimension
+        self.metric = metric
+        self.spec = spec or self.__DEFAULT_SPEC
+        self.batchSize = batchSize
+        self.concurrency = concurrency
+
+        self.http = HttpSession(headers={"Api-Key": apiKey or "", "Content-Type": "application/json"}, **kwargs)
+        self.__hostLock: Optional[asyncio.Lock] = None
+
+    async def _request(self, method: str, url: str, **kwargs) -> Any:
+        async with self.http.session().request(method, url, **kwargs) as response:
+            if response.status == 404:
+                raise Indexer.IndexNotFoundError(self.indexName)
+            response.raise_for_status()
+            return await response.json(content_type=None) if response.content_length != 0 else None
+
+    async def _host(self) -> str:
+        """Looks up the URL of the index from the control plane, creating the index if asked to."""
+        if self.host:
+            return self.host
+
+        if not self.__hostLock:
+            self.__hostLock = asyncio.Lock()
+
+        async with self.__hostLock:
+            if self.host:
+                return self.host
+
+            try:
+                description = await self._request("GET", f"{self.serverUrl}/indexes/{self.indexName}")
+
+            except Indexer.IndexNotFoundError:
+                if not self.create:
+                    raise
+
+                dimension = self.dimension or len(await self.embedding.embed("dimension"))
+                description = await self._request("POST", f"{self.serverUrl}/indexes", json={
+                    "name": self.indexName,
+                    "dimension": dimension,
+                    "metric": self.metric,
+                    "spec": self.spec,
+                })
+                self.logger.info(f"Created Pinecone index {self.indexName} of dimension {dimension}")
+
+            host = description["host"]
+            self.host = (host if "://" in host else f"https://{host}").rstrip("/")
+            return self.host
+
     @classmethod
-    def new(cls, serverUrl: str, indexName: str, **kwargs) -> "PineconeIndexer":
-        ...
+    def _metadata(cls, document: dict) -> dict:
+        """Pinecone metadata only take strings, numbers, booleans, and lists of strings."""
+        metadata = dict()
+        for k, v in document.items():
+            if v is None:
+                continue
+            elif isinstance(v, (str, int, float, bool)):
+                metadata[k] = v
+            elif isinstance(v, list) and all([isinstance(i, str) for i in v]):
+                metadata[k] = v
+            else:
+                metadata[k] = str(v)
+        return metadata
 
-    def __init__(self, serverUrl: str, indexName: str):
-        ...
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> dict:
+        host = await self._host()
 
-    async def add(self, data: List[dict], keyFields: List[str], idField: str = "_id", **kwargs) -> Any:
-        ...
+        # Work on copies so that the caller's data are left intact
+        documents = []
+        for item in data:
+            document = dict(item)
+            docId = str(item[idField]) if idField else str(document.get("_id", uuid4()))
+            document.pop("_id", None)
+            documents.append((docId, document))
+
+        texts = ["\n".join([str(d[f]) for f in keyFields if d.get(f)]) for _, d in documents]
+        vectors = await self.embedding.embedBatch(texts)
+
+        items = []
+        upserts = []
+        for (docId, document), vector in zip(documents, vectors):
+            if vector is None:
+                items.append({"_id": docId, "status": 400, "error": "Nothing to embed in the key fields"})
+            else:
+                upserts.append({
+                    "id": docId,
+                    "values": np.asarray(vector, dtype=np.float32).tolist(),
+                    "metadata": self._metadata(document),
+                })
+
+        # Upload the batches in parallel, but no more than the concurrency allows
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def upsert(batch: List[dict]) -> List[dict]:
+            async with semaphore:
+                try:
+                    await self._request("POST", f"{host}/vectors/upsert", json={
+                        "vectors": batch, "namespace": self.namespace
+                    })
+                    return [{"_id": v["id"], "status": 200} for v in batch]
+                except Exception as e:
+                    self.logger.warning(f"Failed to upsert {len(batch)} vectors: {e}")
+                    return [{"_id": v["id"], "status": 500, "error": str(e)} for v in batch]
+
+        batches = [upserts[i:i + self.batchSize] for i in range(0, len(upserts), self.batchSize)]
+        for result in await asyncio.gather(*[upsert(b) for b in batches]):
+            items += result
+
+        return {"errors": any([item["status"] != 200 for item in items]), "items": items}
 
     async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
-        ...
+        """ Searches for nearest neighbors of the query.  See :meth:`Indexer.search`.
+
+        Args:
+            query (str): The text to fish out relevant documents in the database
+            top (int): Number of documents to get
+            **kwargs:
+                - filter (dict | Filter): Only search the documents passing the filter.  :class:`Filter` has the
+                  syntax of Pinecone metadata filters, so it is sent as is.  IDs cannot be filtered on.
+
+        Returns:
+            The documents with their "_id" and "_score"
+        """
+        host = await self._host()
+
+        filter = Filter.of(kwargs.get("filter"))
+        if filter and any([field == "_id" for field, _, _ in filter.conditions]):
+            raise ValueError("Pinecone cannot filter by the document IDs")
+
+        vector = await self.embedding.embed(query)
+        if vector is None or top <= 0 or (filter and filter.void):
+            return []
+
+        request = {
+            "vector": np.asarray(vector, dtype=np.float32).tolist(),
+            "topK": top,
+            "includeMetadata": True,
+            "includeValues": False,
+            "namespace": self.namespace,
+        }
+        if filter:
+            request["filter"] = filter.spec
+
+        results = await self._request("POST", f"{host}/query", json=request)
+        return [{**m.get("metadata", {}), "_id": m["id"], "_score": m["score"]} for m in results["matches"]]
 
     async def get(self, ids: str | List[str]) -> List[dict]:
-        ...
+        host = await self._host()
 
-    async def delete(self, ids: str | List[str]) -> Any:
-        ...
+        if isinstance(ids, str):
+            ids = [ids]
+
+        async def fetch(batch: List[str]) -> dict:
+            params = [("ids", i) for i in batch] + [("namespace", self.namespace)]
+            return (await self._request("GET", f"{host}/vectors/fetch", params=params))["vectors"]
+
+        found = dict()
+        batches = [ids[i:i + self.__FETCH_BATCH_SIZE] for i in range(0, len(ids), self.__FETCH_BATCH_SIZE)]
+        for vectors in await asyncio.gather(*[fetch(b) for b in batches]):
+            found.update(vectors)
+
+        return [
+            {**found[i].get("metadata", {}), "_id": i, "_found": True} if i in found else {"_id": i, "_found": False}
+            for i in ids
+        ]
+
+    async def delete(self, ids: str | List[str]) -> dict:
+        host = await self._host()
+
+        if isinstance(ids, str):
+            ids = [ids]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def delete(batch: List[str]):
+            # A failure is raised, so that the callers like sync() do not take the documents as deleted
+            async with semaphore:
+                await self._request("POST", f"{host}/vectors/delete", json={"ids": batch, "namespace": self.namespace})
+
+        batches = [ids[i:i + self.__DELETE_BATCH_SIZE] for i in range(0, len(ids), self.__DELETE_BATCH_SIZE)]
+        await asyncio.gather(*[delete(b) for b in batches])
+        return {"items": [{"_id": i, "status": 200, "result": "deleted"} for i in ids]}
 
     async def kill(self) -> Any:
-        ...
+        """ Removes the index from the Pinecone server.  If the indexer works in a namespace, only the namespace is
+        cleared, leaving the other namespaces of the index intact.
+
+        Returns:
+            The server response
+        """
+        if self.namespace:
+            host = await self._host()
+            return await self._request("POST", f"{host}/vectors/delete", json={
+                "deleteAll": True, "namespace": self.namespace
+            })
+
+        status = await self._request("DELETE", f"{self.serverUrl}/indexes/{self.indexName}")
+        self.host = None
+        return status
 
     async def size(self) -> int:
-        ...
\ No newline at end of file
+        host = await self._host()
+        stats = await self._request("POST", f"{host}/describe_index_stats", json={})
+        return stats.get("namespaces", {}).get(self.namespace, {}).get("vectorCount", 0)
+
+    async def close(self):
+        """Closes the pooled connections."""
+        await self.http.close()
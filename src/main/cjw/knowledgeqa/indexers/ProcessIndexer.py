@@ -0,0 +1,99 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Any, Callable, Optional
+
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+
+# The indexer served by a worker process, and the event loop running its coroutines
+_indexer: Optional[Indexer] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _start(factory: Callable[[], Indexer]):
+    global _indexer, _loop
+    _loop = asyncio.new_event_loop()
+    _indexer = factory()
+
+
+def _run(method: str, args: tuple, kwargs: dict) -> Any:
+    result = getattr(_indexer, method)(*args, **kwargs)
+    return _loop.run_until_complete(result) if inspect.isawaitable(result) else result
+
+
+class ProcessIndexer(Indexer):
+    """Runs an indexer in a worker process of its own.
+
+    An in-memory engine like :class:`LocalIndexer` is bound to one core by the GIL.  Wrapped in worker processes,
+    several of them search in parallel, e.g. as the shards of a :class:`ShardedIndexer`.  The indexer is created in
+    the worker by a factory, so that its embedding model is loaded there rather than sent over.  Documents, queries
+    and results are sent between the processes, so they shall be picklable.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    def __init__(self, factory: Callable[[], Indexer], indexName: str = "process", context: str = None):
+        """ Starts the worker process
+
+        Args:
+            factory (Callable[[], Indexer]): Creates the indexer in the worker, e.g.
+                ``functools.partial(LocalIndexer, embedding, path=path)``.  It shall be picklable unless the process
+                is forked.
+            indexName (str): Name of the index (default "process")
+            context (str): Multiprocessing start method, "fork", "spawn" or "forkserver".  (default the platform's)
+        """
+        self.indexName = indexName
+        self.__executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context(context),
+            initializer=_start,
+            initargs=(factory,),
+        )
+
+    async def call(self, method: str, *args, **kwargs) -> Any:
+        """ Calls a method of the indexer in the worker, like "save" of a :class:`LocalIndexer`
+
+        Args:
+            method (str): Name of the method
+            *args: Arguments of the method
+            **kwargs: Keyword arguments of the method
+
+        Returns:
+            The return of the method, awaited if it is a coroutine
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, _run, method, args, kwargs)
+
+    def warmup(self):
+        """Warms up the indexer in the worker, where its model is.  It blocks until done."""
+        self.__executor.submit(_run, "warmup", (), {}).result()
+
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> Any:
+        return await self.call("add", data, keyFields, idField, **kwargs)
+
+    async def refresh(self) -> Any:
+        return await self.call("refresh")
+
+    async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
+        return await self.call("search", query, top, **kwargs)
+
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        return await self.call("searchMany", queries, top, **kwargs)
+
+    async def get(self, ids: str | List[str]) -> List[dict]:
+        return await self.call("get", ids)
+
+    async def delete(self, ids: str | List[str]) -> Any:
+        return await self.call("delete", ids)
+
+    async def kill(self) -> Any:
+        return await self.call("kill")
+
+    async def size(self) -> int:
+        return await self.call("size")
+
+    async def close(self):
+        """Stops the worker process."""
+        await asyncio.get_running_loop().run_in_executor(None, self.__executor.shutdown)
@@ -0,0 +1,96 @@
+from typing import Optional
+
+import numpy as np
+
+from cjw.knowledgeqa.indexers.Quantizer import Quantizer
+
+
+class ProductQuantizer(Quantizer):
+    """Splits the embeddings into subspaces, and encodes each part by the nearest of 256 centroids learned with
+    k-means.  An embedding becomes one byte per subspace, e.g. 96 bytes for a 768-dimensional embedding instead of
+    3 KB.
+
+    A query is scored by looking up its precomputed similarities to the centroids of each subspace, and summing them.
+    The approximation is coarser than :class:`ScalarQuantizer`, so the top candidates are best re-ranked with the
+    exact embeddings.
+    """
+
+    __CENTROIDS = 256                   # Centroids per subspace, so that a code fits in a byte
+    __DEFAULT_TRAINING_SIZE = 10000
+    __DEFAULT_DIMENSIONS_PER_SUBSPACE = 8
+    __TRAINING_ITERATIONS = 10
+
+    def __init__(self, subspaces: int = None, trainingSize: int = __DEFAULT_TRAINING_SIZE):
+        """ The constructor
+
+        Args:
+            subspaces (int): Number of subspaces, i.e. bytes per embedding.  (default a subspace per 8 dimensions)
+            trainingSize (int): Number of embeddings needed to train the quantizer (default 10000)
+        """
+        super().__init__(trainingSize)
+        self.subspaces = subspaces
+        self.codebook: Optional[np.ndarray] = None  # Centroid k of subspace m is codebook[k, bounds[m]:bounds[m+1]]
+        self.bounds: Optional[np.ndarray] = None    # Dimensions where each subspace starts, and the dimension
+
+    @property
+    def trained(self) -> bool:
+        return self.codebook is not None
+
+    def _parts(self):
+        return zip(range(len(self.bounds) - 1), self.bounds[:-1], self.bounds[1:])
+
+    @classmethod
+    def _nearest(cls, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        # Nearest by the Euclidean distance, without the norm of the vectors which does not change the order
+        return np.argmax(vectors @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+
+    def train(self, vectors: np.ndarray):
+        dimension = vectors.shape[1]
+        subspaces = min(self.subspaces or max(dimension // self.__DEFAULT_DIMENSIONS_PER_SUBSPACE, 1), dimension)
+        self.bounds = np.linspace(0, dimension, subspaces + 1).astype(np.int64)
+
+        rng = np.random.default_rng(0)
+        centroids = min(self.__CENTROIDS, len(vectors))
+        codebook = np.zeros((centroids, dimension), dtype=np.float32)
+
+        for _, start, end in self._parts():
+            part = np.ascontiguousarray(vectors[:, start:end], dtype=np.float32)
+            means = part[rng.choice(len(part), centroids, replace=False)].copy()
+
+            for _ in range(self.__TRAINING_ITERATIONS):
+                assignments = self._nearest(part, means)
+                sums = np.zeros_like(means)
+                np.add.at(sums, assignments, part)
+                counts = np.bincount(assignments, minlength=centroids)
+
+                # Empty clusters are restarted at random samples
+                empty = counts == 0
+                sums[empty] = part[rng.choice(len(part), int(empty.sum()))]
+                counts[empty] = 1
+                means = sums / counts[:, np.newaxis]
+
+            codebook[:, start:end] = means
+
+        self.codebook = codebook
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), len(self.bounds) - 1), dtype=np.uint8)
+        for m, start, end in self._parts():
+            part = np.asarray(vectors[:, start:end], dtype=np.float32)
+            codes[:, m] = self._nearest(part, self.codebook[:, start:end])
+        return codes
+
+    def _scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for m, start, end in self._parts():
+            table = queries[:, start:end] @ self.codebook[:, start:end].T     # Query to centroid similarities
+            scores += table[:, codes[:, m]]
+        return scores
+
+    def state(self) -> dict:
+        return {"codebook": self.codebook, "bounds": self.bounds}
+
+    def _restore(self, state: dict):
+        self.codebook = state["codebook"]
+        self.bounds = state["bounds"]
+        self.subspaces = len(self.bounds) - 1
@@ -0,0 +1,101 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class Quantizer(ABC):
+    """Compresses the embeddings of an index into short codes.
+
+    Queries are scored against the codes without decoding them back to vectors (asymmetric distance computation):
+    only the documents are approximated, the queries stay in full precision.  A quantizer is trained on a sample of
+    the embeddings before it can encode them.
+    """
+
+    __CHUNK = 65536     # Codes scored at a time, to bound the memory of the intermediate results
+
+    def __init__(self, trainingSize: int):
+        """ The constructor
+
+        Args:
+            trainingSize (int): Number of embeddings needed to train the quantizer
+        """
+        self.trainingSize = trainingSize
+
+    @property
+    @abstractmethod
+    def trained(self) -> bool:
+        pass
+
+    @abstractmethod
+    def train(self, vectors: np.ndarray):
+        """ Learns the encoding from a sample of the embeddings
+
+        Args:
+            vectors (np.ndarray): The normalized embeddings, one per row
+        """
+        pass
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """ Encodes embeddings
+
+        Args:
+            vectors (np.ndarray): The normalized embeddings, one per row
+
+        Returns:
+            The codes, one per row
+        """
+        pass
+
+    @abstractmethod
+    def _scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        pass
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """ Approximates the similarities of the queries to the encoded embeddings
+
+        Args:
+            queries (np.ndarray): Normalized query vectors, one per row
+            codes (np.ndarray): The codes, one per row
+
+        Returns:
+            The similarities of each query (in rows) to each code (in columns)
+        """
+        if len(codes) <= self.__CHUNK:
+            return self._scores(queries, codes)
+
+        return np.concatenate([
+            self._scores(queries, codes[i:i + self.__CHUNK]) for i in range(0, len(codes), self.__CHUNK)
+        ], axis=1)
+
+    @abstractmethod
+    def state(self) -> dict:
+        """The trained parameters, as arrays"""
+        pass
+
+    @abstractmethod
+    def _restore(self, state: dict):
+        pass
+
+    def save(self, file: str):
+        with open(file, "wb") as fd:
+            np.savez(fd, kind=type(self).__name__, trainingSize=self.trainingSize, **self.state())
+
+    @classmethod
+    def load(cls, file: str) -> "Quantizer":
+        """ Loads a quantizer saved by :meth:`save`
+
+        Args:
+            file (str): The file
+
+        Returns:
+            The quantizer, of the class it was saved from
+        """
+        from cjw.knowledgeqa.indexers.ProductQuantizer import ProductQuantizer
+        from cjw.knowledgeqa.indexers.ScalarQuantizer import ScalarQuantizer
+
+        kinds = {c.__name__: c for c in [ProductQuantizer, ScalarQuantizer]}
+        with np.load(file) as saved:
+            quantizer = kinds[str(saved["kind"])](trainingSize=int(saved["trainingSize"]))
+            quantizer._restore({k: saved[k] for k in saved.files if k not in ["kind", "trainingSize"]})
+        return quantizer
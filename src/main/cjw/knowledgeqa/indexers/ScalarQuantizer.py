@@ -0,0 +1,43 @@
+from typing import Optional
+
+import numpy as np
+
+from cjw.knowledgeqa.indexers.Quantizer import Quantizer
+
+
+class ScalarQuantizer(Quantizer):
+    """Encodes each dimension of the embeddings in a signed byte, 4 times smaller than float32.
+
+    Each dimension has its own scale, fitted to the largest magnitude seen in training.  Larger values are clipped.
+    """
+
+    __DEFAULT_TRAINING_SIZE = 1000
+
+    def __init__(self, trainingSize: int = __DEFAULT_TRAINING_SIZE):
+        """ The constructor
+
+        Args:
+            trainingSize (int): Number of embeddings needed to train the quantizer (default 1000)
+        """
+        super().__init__(trainingSize)
+        self.scale: Optional[np.ndarray] = None     # Value of a unit of each dimension
+
+    @property
+    def trained(self) -> bool:
+        return self.scale is not None
+
+    def train(self, vectors: np.ndarray):
+        self.scale = (np.maximum(np.abs(vectors).max(axis=0), 1e-6) / 127).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def _scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # Scale the queries instead of decoding the codes
+        return (queries * self.scale) @ codes.T.astype(np.float32)
+
+    def state(self) -> dict:
+        return {"scale": self.scale}
+
+    def _restore(self, state: dict):
+        self.scale = state["scale"]
@@ -0,0 +1,109 @@
+import asyncio
+import heapq
+import logging
+import zlib
+from typing import List, Any, Dict
+from uuid import uuid4
+
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+
+
+class ShardedIndexer(Indexer):
+    """Partitions the documents across several indexes, and presents them as a single one.
+
+    A document goes to the shard given by the hash of its ID, so the shards share the load evenly and a document
+    can be found again from its ID alone.  Searches are sent to all the shards concurrently, and their top results
+    merged.  The shards can be any indexers, e.g. a :class:`ProcessIndexer` per core, or Marqo indexes on several
+    servers.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    def __init__(self, shards: List[Indexer], indexName: str = "sharded"):
+        """ The constructor
+
+        Args:
+            shards (List[Indexer]): The shards.  The same shards shall be given in the same order every time, or the
+                documents will not be found.
+            indexName (str): Name of the index (default "sharded")
+        """
+        if not shards:
+            raise ValueError("A sharded index needs at least one shard")
+
+        self.shards = shards
+        self.indexName = indexName
+
+    def shardOf(self, docId: str) -> int:
+        """Finds the shard of a document ID."""
+        return zlib.crc32(str(docId).encode()) % len(self.shards)
+
+    def _route(self, ids: List[str]) -> Dict[int, List[str]]:
+        routes: Dict[int, List[str]] = dict()
+        for docId in ids:
+            routes.setdefault(self.shardOf(docId), []).append(docId)
+        return routes
+
+    @classmethod
+    def _merge(cls, statuses: List[Any]) -> dict:
+        """Merges the statuses of the shards into one like that of a single index."""
+        items = [item for s in statuses if isinstance(s, dict) for item in s.get("items", [])]
+        return {
+            "errors": any([isinstance(s, dict) and s.get("errors", False) for s in statuses]),
+            "items": items,
+        }
+
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> dict:
+        # The IDs are settled here, so that the documents can be routed by them
+        routes: Dict[int, List[dict]] = dict()
+        for item in data:
+            docId = str(item[idField]) if idField else str(item.get("_id", uuid4()))
+            routes.setdefault(self.shardOf(docId), []).append({**item, "_id": docId})
+
+        statuses = await asyncio.gather(*[
+            self.shards[shard].add(documents, keyFields, **kwargs) for shard, documents in routes.items()
+        ])
+        return self._merge(statuses)
+
+    def warmup(self):
+        for shard in self.shards:
+            shard.warmup()
+
+    async def refresh(self) -> List[Any]:
+        return list(await asyncio.gather(*[s.refresh() for s in self.shards]))
+
+    async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
+        return (await self.searchMany([query], top, **kwargs))[0]
+
+    async def searchMany(self, queries: List[str], top: int = 3, **kwargs) -> List[List[dict]]:
+        # Every shard gives its top results, of which the best overall are kept
+        found = await asyncio.gather(*[s.searchMany(queries, top, **kwargs) for s in self.shards])
+        return [
+            heapq.nlargest(top, [hit for shard in found for hit in shard[i]], key=lambda hit: hit["_score"])
+            for i in range(len(queries))
+        ]
+
+    async def get(self, ids: str | List[str]) -> List[dict]:
+        if isinstance(ids, str):
+            ids = [ids]
+
+        routes = list(self._route(ids).items())
+        results = await asyncio.gather(*[self.shards[shard].get(shardIds) for shard, shardIds in routes])
+
+        # Back in the order asked
+        documents = {docId: d for (_, shardIds), r in zip(routes, results) for docId, d in zip(shardIds, r)}
+        return [documents[docId] for docId in ids]
+
+    async def delete(self, ids: str | List[str]) -> dict:
+        if isinstance(ids, str):
+            ids = [ids]
+
+        statuses = await asyncio.gather(*[
+            self.shards[shard].delete(shardIds) for shard, shardIds in self._route(ids).items()
+        ])
+        return self._merge(statuses)
+
+    async def kill(self) -> List[Any]:
+        return list(await asyncio.gather(*[s.kill() for s in self.shards]))
+
+    async def size(self) -> int:
+        return sum(await asyncio.gather(*[s.size() for s in self.shards]))
@@ -1,6 +1,11 @@
+from cjw.knowledgeqa.indexers.CachedIndexer import CachedIndexer
 from cjw.knowledgeqa.indexers.Indexer import Indexer
+from cjw.knowledgeqa.indexers.IvfIndexer import IvfIndexer
+from cjw.knowledgeqa.indexers.LocalIndexer import LocalIndexer
 from cjw.knowledgeqa.indexers.MarqoIndexer import MarqoIndexer
 from cjw.knowledgeqa.indexers.PineconeIndexer import PineconeIndexer
+from cjw.knowledgeqa.indexers.ProcessIndexer import ProcessIndexer
+from cjw.knowledgeqa.indexers.ShardedIndexer import ShardedIndexer
 
 
 def index(method: str, new=False, **kwargs) -> Indexer:
@@ -13,8 +18,23 @@ def index(method: str, new=False, **kwargs) -> Indexer:
                 pass
         return MarqoIndexer(**kwargs)
 
+    elif method.lower() in ["local", "ivf"]:
+        indexerClass = LocalIndexer if method.lower() == "local" else IvfIndexer
+        if new and kwargs.get("path"):
+            try:
+                return indexerClass.new(**kwargs)
+            except Indexer.IndexExistError:
+                # Exists, but OK, we will open the existing one
+                pass
+        return indexerClass(**kwargs)
+
     elif method.lower() == "pinecone":
-        return PineconeIndexer(**kwargs)
+        # The index is created on first use if new and not existing
+        return PineconeIndexer(create=new, **kwargs)
+
+    elif method.lower() == "sharded":
+        # The shards are given already opened or created
+        return ShardedIndexer(**kwargs)
 
     else:
         raise NotImplementedError(f"Indexer {method} not supported")
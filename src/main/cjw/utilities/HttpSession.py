@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import threading
+from typing import Optional, Dict
+
+import aiohttp
+
+
+class HttpSession:
+    """A long-lived, pooled aiohttp session.
+
+    The :class:`aiohttp.ClientSession` is created on first use and reused afterward, so that connections are kept
+    alive across requests instead of paying a TCP and TLS handshake every time.  A session belongs to the event loop
+    that created it; it is recreated if used from another loop, and the old one is closed.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    DEFAULT_LIMIT = 100             # Max connections in the pool
+    DEFAULT_LIMIT_PER_HOST = 0      # Max connections to a host.  0 is unlimited (up to DEFAULT_LIMIT)
+    DEFAULT_TIMEOUT = 60            # Total seconds allowed for a request
+    DEFAULT_CONNECT_TIMEOUT = 10    # Seconds allowed to get a connection
+    DEFAULT_KEEPALIVE = 30          # Seconds an idle connection is kept in the pool
+
+    def __init__(
+            self,
+            headers: Dict[str, str] = None,
+            limit: int = DEFAULT_LIMIT,
+            limitPerHost: int = DEFAULT_LIMIT_PER_HOST,
+            timeout: float = DEFAULT_TIMEOUT,
+            connectTimeout: float = DEFAULT_CONNECT_TIMEOUT,
+            keepalive: float = DEFAULT_KEEPALIVE,
+    ):
+        """ The constructor.  No connection is made until the session is used.
+
+        Args:
+            headers (Dict[str, str]): Headers sent with every request
+            limit (int): Max connections in the pool (default 100)
+            limitPerHost (int): Max connections to a single host.  0 for no limit. (default 0)
+            timeout (float): Total seconds allowed for a request (default 60)
+            connectTimeout (float): Seconds allowed to get a connection from the pool or the server (default 10)
+            keepalive (float): Seconds an idle connection is kept alive (default 30)
+        """
+        self.headers = headers or dict()
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.timeout = timeout
+        self.connectTimeout = connectTimeout
+        self.keepalive = keepalive
+
+        self.__session: Optional[aiohttp.ClientSession] = None
+        self.__loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def session(self) -> aiohttp.ClientSession:
+        """Returns the pooled session, creating it if necessary.  Must be called within a running event loop."""
+        loop = asyncio.get_running_loop()
+
+        if self.__session is None or self.__session.closed or self.__loop is not loop:
+            if self.__session is not None and not self.__session.closed:
+                if not self.__loop.is_closed():
+                    self.logger.warning("HTTP session used across event loops.  Creating a new one.")
+                self._discard(self.__session, self.__loop)
+
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limitPerHost,
+                keepalive_timeout=self.keepalive,
+            )
+            self.__session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connectTimeout),
+            )
+            self.__loop = loop
+
+        return self.__session
+
+    @classmethod
+    def _discard(cls, session: aiohttp.ClientSession, loop: asyncio.AbstractEventLoop):
+        """Closes a session left by another event loop, in that loop if it is still running."""
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+
+        # Otherwise its connector is closed in a thread, as this one is running the current loop
+        def close():
+            target = asyncio.new_event_loop() if loop.is_closed() else loop
+            try:
+                target.run_until_complete(session.close())
+            finally:
+                if target is not loop:
+                    target.close()
+
+        thread = threading.Thread(target=close)
+        thread.start()
+        thread.join()
+
+    async def close(self):
+        """Closes the session and all its pooled connections."""
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+        self.__session = None
+        self.__loop = None
@@ -1,12 +1,9 @@
 import re
 import string
 
-import nltk
-from typing import Tuple, Generator
+from typing import Tuple, Generator, List
 from zhon import zhuyin, hanzi
 
-nltk.download('punkt')
-
 
 class Languages:
     _quoteStart = r"\[({'\"«‹“‘（［｛｟｢〈《「『【"
@@ -210,6 +207,30 @@ class Languages:
             # End of the text reached and there are still things left over in the sentence
             yield sentenceBegin, sentence
 
+    _word = re.compile(r"\w+(?:[-.'’]\w+)*")
+
+    @staticmethod
+    def words(text: str) -> List[str]:
+        """
+        Breaks a text into lowercase words for keyword matching.
+        English words are kept whole, including hyphenated or dotted ones like "M-137" or "U.S".  Chinese has no
+        spaces between words, so each Hanzi character and each pair of adjacent characters are words.  Pairs never
+        cross sentences.
+        :param text: The text
+        :return: The words in the order of their appearance
+        """
+        result = []
+        for _, sentence in Languages.sentences(text or ""):
+            ideographic, alphabetical = Languages.separateIdeograph(sentence)
+
+            characters = [c for c in ideographic if Languages.isIdeography(c)]
+            result += characters
+            result += [characters[i] + characters[i + 1] for i in range(len(characters) - 1)]
+
+            result += [w.lower() for w in Languages._word.findall(alphabetical)]
+
+        return result
+
     @staticmethod
     def implySentences(text):
         text = Languages._fixText(text)
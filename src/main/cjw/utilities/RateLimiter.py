@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+
+class RateLimiter:
+    """Keeps requests within budgets of requests and tokens per minute, like those of the LLM APIs.
+
+    The budgets are token buckets, refilled continuously, that can be spent up to a minute's worth at once.  Callers
+    wait in line for their turn rather than sending requests bound to be refused.  Tokens are reserved by estimate
+    before a request, and settled with the actual usage after it.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    __limiters: Dict[str, "RateLimiter"] = dict()
+
+    @classmethod
+    def of(cls, name: str, requestsPerMinute: int = None, tokensPerMinute: int = None) -> "RateLimiter":
+        """ Returns the limiter of a name, e.g. of an API key and a model, creating it if necessary
+
+        Args:
+            name (str): Name of the limiter
+            requestsPerMinute (int): Requests allowed a minute, for a new limiter.  None for no limit.
+            tokensPerMinute (int): Tokens allowed a minute, for a new limiter.  None for no limit.
+
+        Returns:
+            The limiter
+        """
+        if name not in cls.__limiters:
+            cls.__limiters[name] = RateLimiter(requestsPerMinute, tokensPerMinute)
+        return cls.__limiters[name]
+
+    def __init__(self, requestsPerMinute: int = None, tokensPerMinute: int = None):
+        """ The constructor
+
+        Args:
+            requestsPerMinute (int): Requests allowed a minute.  None for no limit.
+            tokensPerMinute (int): Tokens allowed a minute.  None for no limit.
+        """
+        self.requestsPerMinute = requestsPerMinute
+        self.tokensPerMinute = tokensPerMinute
+
+        self.__requests = float(requestsPerMinute or 0)     # Available in the buckets
+        self.__tokens = float(tokensPerMinute or 0)
+        self.__updated = time.monotonic()
+        self.__lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.__updated
+        self.__updated = now
+
+        if self.requestsPerMinute:
+            self.__requests = min(self.__requests + elapsed * self.requestsPerMinute / 60, self.requestsPerMinute)
+        if self.tokensPerMinute:
+            self.__tokens = min(self.__tokens + elapsed * self.tokensPerMinute / 60, self.tokensPerMinute)
+
+    def _wait(self, tokens: int) -> float:
+        """Seconds until the buckets have enough for a request"""
+        wait = 0.0
+        if self.requestsPerMinute and self.__requests < 1:
+            wait = (1 - self.__requests) * 60 / self.requestsPerMinute
+        if self.tokensPerMinute and self.__tokens < tokens:
+            wait = max(wait, (tokens - self.__tokens) * 60 / self.tokensPerMinute)
+        return wait
+
+    async def acquire(self, tokens: int = 0) -> int:
+        """ Waits until a request can be sent, and takes it out of the budgets.  Callers are served in order.
+
+        Args:
+            tokens (int): Tokens estimated for the request, including those of the completion
+
+        Returns:
+            The tokens taken, to be given to settle()
+        """
+        if not self.requestsPerMinute and not self.tokensPerMinute:
+            return 0
+
+        # A request larger than the budget of a minute is let through when the bucket is full
+        tokens = min(tokens, self.tokensPerMinute) if self.tokensPerMinute else 0
+
+        if not self.__lock:
+            self.__lock = asyncio.Lock()
+
+        async with self.__lock:     # The lock queues the waiters fairly
+            self._refill()
+            wait = self._wait(tokens)
+            while wait > 0:
+                self.logger.info(f"Waiting {wait:.2f} seconds for the rate limit")
+                await asyncio.sleep(wait)
+                self._refill()
+                wait = self._wait(tokens)
+
+            self.__requests -= 1
+            self.__tokens -= tokens
+
+        return tokens
+
+    def settle(self, reserved: int, used: int):
+        """ Corrects the tokens taken by acquire() with those actually used
+
+        Args:
+            reserved (int): The tokens taken
+            used (int): The tokens used, as reported by the API
+        """
+        if self.tokensPerMinute and used is not None:
+            self._refill()
+            self.__tokens = min(self.__tokens + reserved - used, self.tokensPerMinute)
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import random
+from typing import Callable, Awaitable, Dict, Tuple, Type, TypeVar, Optional
+
+T = TypeVar("T")
+
+
+class RetryPolicy:
+    """Retries an async operation with exponential backoff and jitter, without blocking the event loop.
+
+    An operation is retried when it raises a :class:`RetryPolicy.RetryableError`, or an exception of the classes
+    configured as retryable.  The wait before a retry grows exponentially from an interval that can be set per
+    exception class, e.g. longer for rate limits than for connection errors.  A "Retry-After" given by the server,
+    as the "retryAfter" of the exception or in its "headers", is followed instead.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    class RetryableError(Exception):
+        """Raised by an operation to be retried"""
+        def __init__(self, message: str, retryAfter: float | str = None):
+            super().__init__(message)
+            self.retryAfter = retryAfter
+
+    DEFAULT_RETRIES = 1
+    DEFAULT_INTERVAL = 1.0      # Seconds before the first retry
+    DEFAULT_MULTIPLIER = 2.0    # Growth of the interval at every retry
+    DEFAULT_MAX_INTERVAL = 30.0
+    DEFAULT_JITTER = 0.5        # Fraction of an interval taken off at random, so that clients do not retry in sync
+
+    def __init__(
+            self,
+            retries: int = DEFAULT_RETRIES,
+            interval: float = DEFAULT_INTERVAL,
+            multiplier: float = DEFAULT_MULTIPLIER,
+            maxInterval: float = DEFAULT_MAX_INTERVAL,
+            jitter: float = DEFAULT_JITTER,
+            retryOn: Tuple[Type[Exception], ...] = (),
+            intervals: Dict[Type[Exception], float] = None,
+    ):
+        """ The constructor
+
+        Args:
+            retries (int): Retries after the first try, unless given at run() (default 1)
+            interval (float): Seconds before the first retry (default 1)
+            multiplier (float): Growth of the interval at every retry (default 2)
+            maxInterval (float): Max seconds between tries, including a "Retry-After" (default 30)
+            jitter (float): Fraction of an interval taken off at random, from 0 to 1 (default 0.5)
+            retryOn (Tuple[Type[Exception], ...]): Exception classes retried, besides :class:`RetryableError`
+            intervals (Dict[Type[Exception], float]): Seconds before the first retry for the exception classes,
+                instead of interval
+        """
+        self.retries = retries
+        self.interval = interval
+        self.multiplier = multiplier
+        self.maxInterval = maxInterval
+        self.jitter = jitter
+        self.retryOn = (self.RetryableError,) + tuple(retryOn)
+        self.intervals = intervals or dict()
+
+    @classmethod
+    def retryAfter(cls, error: Exception) -> Optional[float]:
+        """Finds the seconds to wait asked by the server, if any."""
+        retryAfter = getattr(error, "retryAfter", None)
+        if retryAfter is None:
+            headers = getattr(error, "headers", None) or dict()
+            retryAfter = headers.get("Retry-After", headers.get("retry-after"))
+
+        try:
+            return float(retryAfter) if retryAfter is not None else None
+        except ValueError:
+            return None     # An HTTP date.  The APIs used do not send them.
+
+    def delay(self, error: Exception, tries: int) -> float:
+        """ Seconds to wait before a retry
+
+        Args:
+            error (Exception): The error to retry
+            tries (int): Tries so far, from 1
+
+        Returns:
+            The seconds
+        """
+        retryAfter = self.retryAfter(error)
+        if retryAfter is not None:
+            return min(max(retryAfter, 0.0), self.maxInterval)
+
+        interval = next((i for c, i in self.intervals.items() if isinstance(error, c)), self.interval)
+        interval = min(interval * self.multiplier ** (tries - 1), self.maxInterval)
+        return interval * (1 - self.jitter * random.random())
+
+    async def run(
+            self,
+            operation: Callable[[], Awaitable[T]],
+            retries: int = None,
+            exhausted: Callable[[Exception, int], Exception] = None,
+    ) -> T:
+        """ Runs an operation, retrying it on retryable errors
+
+        Args:
+            operation (Callable[[], Awaitable[T]]): Makes a coroutine of the operation, a new one for every try
+            retries (int): Retries after the first try (default the retries of the policy)
+            exhausted (Callable[[Exception, int], Exception]): Makes the exception raised when all the tries failed,
+                from the last error and the number of tries.  (default raising the last error)
+
+        Returns:
+            The return of the operation
+        """
+        retries = self.retries if retries is None else retries
+        tries = 0
+
+        while True:
+            try:
+                return await operation()
+
+            except self.retryOn as e:
+                tries += 1
+                if tries > retries:
+                    error = exhausted(e, tries) if exhausted else e
+                    if error is e:
+                        raise
+                    raise error from e
+
+                delay = self.delay(e, tries)
+                self.logger.warning(f"Try {tries} failed: {e}.  Retrying in {delay:.1f} seconds.")
+                await asyncio.sleep(delay)
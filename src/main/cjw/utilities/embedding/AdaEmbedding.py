@@ -1,14 +1,148 @@
-from typing import Optional
+import asyncio
+import logging
+import os
+from typing import Optional, List, Callable
 
+import aiohttp
 import numpy as np
-import torch
 
+from cjw.utilities.HttpSession import HttpSession
+from cjw.utilities.RetryPolicy import RetryPolicy
 from cjw.utilities.embedding.Embedding import Embedding
+from cjw.utilities.llm.TokenCounter import TokenCounter
 
 
 class AdaEmbedding(Embedding):
-    async def embed1(self, text: str) -> Optional[np.ndarray]:
-        pass
+    """Embeds texts with the OpenAI embeddings API, or a service compatible with it.
+
+    Texts are packed into requests of many inputs, limited in number and in tokens, and the requests are sent
+    concurrently over a pooled session.  Failed requests are retried by a :class:`RetryPolicy`.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    DEFAULT_SERVER_URL = "https://api.openai.com/v1"
+    DEFAULT_MODEL = "text-embedding-ada-002"
+
+    __DEFAULT_BATCH_SIZE = 2048     # Max texts in a request
+    __DEFAULT_BATCH_TOKENS = 100000 # Max tokens in a request
+    __DEFAULT_CONCURRENCY = 4       # Requests sent in parallel
+    __DEFAULT_RETRIES = 3
+
+    __RETRIED_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+    def __init__(
+            self,
+            key: str = None,
+            model: str = DEFAULT_MODEL,
+            serverUrl: str = DEFAULT_SERVER_URL,
+            batchSize: int = __DEFAULT_BATCH_SIZE,
+            batchTokens: int = __DEFAULT_BATCH_TOKENS,
+            concurrency: int = __DEFAULT_CONCURRENCY,
+            retries: int = __DEFAULT_RETRIES,
+            retryPolicy: RetryPolicy = None,
+            countTokens: Callable[[str], int] = None,
+            **kwargs
+    ):
+        """ The constructor.  No connection is made until the first text is embedded.
+
+        Args:
+            key (str): The API key (default the environment variable OPENAI_API_KEY)
+            model (str): The embedding model (default "text-embedding-ada-002")
+            serverUrl (str): URL of the API, up to before "/embeddings" (default DEFAULT_SERVER_URL)
+            batchSize (int): Max texts in a request (default 2048)
+            batchTokens (int): Max tokens in a request.  A longer text is sent by itself. (default 100000)
+            concurrency (int): Requests sent in parallel (default 4)
+            retries (int): Retries of a failed request (default 3)
+            retryPolicy (RetryPolicy): How failed requests are retried.  (default backing off exponentially for the
+                retries)
+            countTokens (Callable[[str], int]): Counts the tokens of a text.  (default the :class:`TokenCounter` of the
+                model, loaded at the first use)
+            **kwargs: Connection pool arguments.  See :class:`HttpSession`.
+        """
+        key = key if key else os.environ.get("OPENAI_API_KEY")
+
+        self.model = model
+        self.modelName = model
+        self.serverUrl = serverUrl.rstrip("/")
+        self.batchSize = batchSize
+        self.batchTokens = batchTokens
+        self.concurrency = concurrency
+        self.retryPolicy = retryPolicy or RetryPolicy(
+            retries=retries,
+            retryOn=(aiohttp.ClientConnectionError, asyncio.TimeoutError),
+        )
+        self.countTokens = countTokens
+
+        self.http = HttpSession(headers={"Authorization": f"Bearer {key}", "Content-Type": "application/json"}, **kwargs)
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        """Packs texts into requests.  Returns the indices of the texts in each request."""
+        counter = self.countTokens or TokenCounter.of(self.model)
+        counts = counter.countBatch(texts) if isinstance(counter, TokenCounter) else [counter(t) for t in texts]
+
+        batches = []
+        batch = []
+        tokens = 0
+        for i, count in enumerate(counts):
+            if batch and (len(batch) >= self.batchSize or tokens + count > self.batchTokens):
+                batches.append(batch)
+                batch = []
+                tokens = 0
+            batch.append(i)
+            tokens += count
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    async def _request(self, texts: List[str]) -> List[np.ndarray]:
+        """Embeds texts in one request, retrying on failures."""
+        async def attempt() -> List[np.ndarray]:
+            async with self.http.session().post(
+                    f"{self.serverUrl}/embeddings",
+                    json={"model": self.model, "input": texts},
+            ) as response:
+                if response.status != 200:
+                    self.logger.warning(f"Embedding failed: {response.status} {await response.text()}")
+                try:
+                    response.raise_for_status()
+                except aiohttp.ClientResponseError as e:
+                    if e.status in self.__RETRIED_STATUSES:
+                        raise RetryPolicy.RetryableError(str(e), response.headers.get("Retry-After")) from e
+                    raise
+
+                results = (await response.json())["data"]
+                results.sort(key=lambda r: r["index"])
+                return [np.array(r["embedding"], dtype=np.float32) for r in results]
+
+        # Failing after the retries, the error of the response is raised
+        return await self.retryPolicy.run(attempt, exhausted=lambda e, tries: e.__cause__ or e)
 
     async def embed(self, text: str) -> Optional[np.ndarray]:
-        ...
+        return (await self.embedBatch([text]))[0]
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        return await self.embed(text)
+
+    async def embedBatch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        # The API refuses empty texts
+        nonEmpty = [i for i, t in enumerate(texts) if t and t.strip()]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def request(batch: List[int]) -> List[np.ndarray]:
+            async with semaphore:
+                return await self._request([texts[nonEmpty[i]] for i in batch])
+
+        batches = self._batches([texts[i] for i in nonEmpty])
+        results = await asyncio.gather(*[request(b) for b in batches])
+
+        vectors: List[Optional[np.ndarray]] = [None] * len(texts)
+        for batch, result in zip(batches, results):
+            for i, vector in zip(batch, result):
+                vectors[nonEmpty[i]] = vector
+        return vectors
+
+    async def close(self):
+        """Closes the connections."""
+        await self.http.close()
@@ -1,7 +1,13 @@
+import inspect
 import logging
+import os
+import tempfile
+import threading
+
 import numpy as np
+import torch
 import transformers as tf
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, Callable
 
 from cjw.utilities.Languages import Languages
 from cjw.utilities.embedding.Embedding import Embedding
@@ -16,10 +22,20 @@ from cjw.utilities.embedding.Embedding import Embedding
 class BertEmbedding(Embedding):
     """
     Uses BERT to encode a passage of text into vectors.
+
+    The model can run on one of these backends:
+    - "torch": The model as it is
+    - "int8": The linear layers dynamically quantized to int8 by torch.  Faster on CPU, at a small loss of precision.
+    - "onnx": The model exported to ONNX, and run by ONNX Runtime on CPU.  It needs the onnxruntime package.
     """
 
     # TODO: Set HF_HOME to specify model location
 
+    DEFAULT_BATCH_SIZE = 32
+    BACKENDS = ["torch", "int8", "onnx"]
+    __MAX_LENGTH = 512
+    __ONNX_OPSET = 14
+
     modelSpec = {
         # [ tokenizer class, model class, path to model in HuggingFace, languages applied ]
         "bert-base-chinese":
@@ -48,53 +64,211 @@ class BertEmbedding(Embedding):
             [tf.AutoTokenizer, tf.AutoModel, "microsoft", ["en"]],
     }
 
-    def __init__(self, modelName):
+    def __init__(self, modelName, backend: str = "torch", onnxDir: str = None):
+        """
+        Sets up a model.  The model is loaded at the first use, or by warmup().
+        :param modelName: One in modelSpec
+        :param backend: One in BACKENDS (default "torch")
+        :param onnxDir: Where the models exported to ONNX are kept (default a directory in the temp directory)
+        """
         if modelName not in self.modelSpec:
             raise ValueError(f"unsupported model name {modelName}")
+        if backend not in self.BACKENDS:
+            raise ValueError(f"unsupported backend {backend}")
 
-        tokenizer, model, path, self.languages = self.modelSpec[modelName]
-        if path:
-            modelName = path + "/" + modelName
+        self.modelName = modelName
+        self.backend = backend
+        self.onnxDir = onnxDir or os.path.join(tempfile.gettempdir(), "cjw-onnx")
+        self.languages = self.modelSpec[modelName][3]
+        self.padToken = modelName in ["DialoGPT-large", "DialoGPT-small"]
 
-        self.tokenizer = tokenizer.from_pretrained(modelName)
+        self.__tokenizer = None
+        self.__model = None
+        self.__loaded = False
+        self.session = None     # The ONNX Runtime session, for the "onnx" backend
+        self.__lock = threading.RLock()
 
-        self.padToken = modelName in ["DialoGPT-large", "DialoGPT-small"]
-        if self.padToken:
-            self.tokenizer.pad_token = self.tokenizer.eos_token
+    def __getstate__(self):
+        """
+        Pickles the settings only, e.g. for worker processes.  The model is loaded again where unpickled.
+        """
+        state = self.__dict__.copy()
+        del state["_BertEmbedding__lock"]
+        state["_BertEmbedding__tokenizer"] = None
+        state["_BertEmbedding__model"] = None
+        state["_BertEmbedding__loaded"] = False
+        state["session"] = None
+        return state
 
-        self.model = model.from_pretrained(modelName)
-        logging.info(f"BERT model {modelName} loaded")
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock = threading.RLock()
 
-    def embedSentences(self, text: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+    @property
+    def tokenizer(self):
+        if not self.__loaded:
+            self._load()
+        return self.__tokenizer
+
+    @property
+    def model(self):
+        """The torch model.  None for the "onnx" backend, which runs the exported model only."""
+        if not self.__loaded:
+            self._load()
+        return self.__model
+
+    @classmethod
+    def _pretrained(cls, model, modelName: str):
+        loaded = model.from_pretrained(modelName)
+        loaded.eval()
+        return loaded
+
+    def _load(self):
         """
-        Breaks the text into sentences, and encodes each one into a vector with BERT.
-        It also separates English sentences from Chinese, and apply appropriately to the BERT model that support
-        the language.  If a model only supports English, all Chinese sentences are ignored, and vise versa.
-        :param text: The text to be encoded
-        :return: A numpy array of sentence vectors
+        Loads the tokenizer and the model, unless loaded.
+        """
+        with self.__lock:
+            if self.__loaded:
+                return
+
+            tokenizer, model, path, _ = self.modelSpec[self.modelName]
+            modelName = path + "/" + self.modelName if path else self.modelName
+
+            self.__tokenizer = tokenizer.from_pretrained(modelName)
+            if self.padToken:
+                self.__tokenizer.pad_token = self.__tokenizer.eos_token
+
+            if self.backend == "onnx":
+                # The torch model is loaded only to be exported, and is not kept
+                self.session = self._onnxSession(self.onnxDir, lambda: self._pretrained(model, modelName))
+            else:
+                loaded = self._pretrained(model, modelName)
+                if self.backend == "int8":
+                    loaded = torch.ao.quantization.quantize_dynamic(loaded, {torch.nn.Linear}, dtype=torch.qint8)
+                self.__model = loaded
+
+            self.__loaded = True
+            logging.info(f"BERT model {modelName} loaded for {self.backend}")
+
+    def load(self):
+        """
+        Loads the tokenizer and the model, without running them, e.g. before forking processes that share them.
+        """
+        self._load()
+
+    def warmup(self):
+        """
+        Loads the model, and runs it once so that it is fast from the first request on.
+        It blocks.  A server would run it in the background, e.g. in a thread, after binding its port.
+        """
+        self._load()
+        self._encode(["Warm up."], specialTokens=True)
+
+    def _onnxSession(self, onnxDir: str, pretrained: Callable):
+        """
+        Exports the model to ONNX, unless exported before, and opens it with ONNX Runtime.
+        :param onnxDir: Where the exported models are kept
+        :param pretrained: Loads the torch model, to be exported
+        :return: The ONNX Runtime session
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend needs the onnxruntime package")
+
+        file = os.path.join(onnxDir, f"{self.modelName}-opset{self.__ONNX_OPSET}.onnx")
+        if not os.path.exists(file):
+            os.makedirs(onnxDir, exist_ok=True)
+            model = pretrained()
+
+            # Named in the order of the arguments of the model, which is that of the inputs exported
+            sample = self.__tokenizer(["An example"], return_tensors='pt')
+            names = [name for name in inspect.signature(model.forward).parameters if name in sample]
+            axes = {name: {0: "batch", 1: "tokens"} for name in names}
+
+            # Exported under a temporary name, so that a failed export is not taken for a model
+            with torch.inference_mode():
+                torch.onnx.export(
+                    model, ({name: sample[name] for name in names},), file + ".tmp",
+                    input_names=names, output_names=["output"],
+                    dynamic_axes={**axes, "output": {0: "batch", 1: "tokens"}},
+                    opset_version=self.__ONNX_OPSET,
+                )
+            os.replace(file + ".tmp", file)
+            logging.info(f"BERT model {self.modelName} exported to {file}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        return ort.InferenceSession(file, options, providers=["CPUExecutionProvider"])
+
+    def _run(self, padded: dict) -> np.ndarray:
+        """
+        Runs the model on a padded batch of tokens.
+        :param padded: The tokens, as tensors
+        :return: The vectors of the first tokens
         """
+        if self.session:
+            inputs = {i.name: padded[i.name].numpy() for i in self.session.get_inputs()}
+            return self.session.run(None, inputs)[0][:, 0, :]
+
+        return self.model(**padded)[0][:, 0, :].numpy()
+
+    def _sentences(self, text: str) -> List[str]:
+        """Breaks the text into sentences of the languages supported by the model."""
         ideoText, alphaText = Languages.separateIdeograph(text)
         hanSent = Languages.hanziSentences(ideoText)
         engSent = Languages.englishSentences(alphaText)
 
-        sentences = (hanSent if "zh" in self.languages else []) + \
-                    (engSent if "en" in self.languages else [])
-
-        if len(sentences) == 0:
-            return None, None
+        return (hanSent if "zh" in self.languages else []) + \
+            (engSent if "en" in self.languages else [])
 
+    def _encode(self, texts: List[str], specialTokens: bool, batchSize: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """
+        Encodes texts into vectors with BERT, a micro-batch at a time.
+        The texts are sorted by length, so that those in a micro-batch are padded to about the same length.
+        :param texts: The texts to be encoded
+        :param specialTokens: Whether to add the special tokens of the model
+        :param batchSize: Max texts in a micro-batch
+        :return: A numpy array of the vectors, in the order of the texts
+        """
         tokenized = self.tokenizer(
-            sentences,
-            padding=True, max_length=512, truncation=True,
-            add_special_tokens=self.padToken,
-            return_tensors='pt'
+            texts,
+            max_length=self.__MAX_LENGTH, truncation=True,
+            add_special_tokens=specialTokens,
         )
+        tokens = tokenized["input_ids"]
+        order = sorted(range(len(texts)), key=lambda i: len(tokens[i]))
+
+        vectors = None
+        with torch.inference_mode():
+            for start in range(0, len(order), batchSize):
+                batch = order[start:start + batchSize]
+                padded = self.tokenizer.pad(
+                    {key: [values[i] for i in batch] for key, values in tokenized.items()},
+                    padding=True, return_tensors='pt'
+                )
+                lastHiddenStates = self._run(padded)
+
+                if vectors is None:
+                    vectors = np.empty((len(texts), lastHiddenStates.shape[1]), dtype=lastHiddenStates.dtype)
+                vectors[batch] = lastHiddenStates
+
+        return vectors
+
+    def embedSentences(self, text: str) -> Tuple[Optional[List[str]], Optional[np.ndarray]]:
+        """
+        Breaks the text into sentences, and encodes each one into a vector with BERT.
+        It also separates English sentences from Chinese, and apply appropriately to the BERT model that support
+        the language.  If a model only supports English, all Chinese sentences are ignored, and vise versa.
+        :param text: The text to be encoded
+        :return: A numpy array of sentence vectors
+        """
+        sentences = self._sentences(text)
 
-        # with torch.no_grad():
-        #     lastHiddenStates = self.model(**tokenized)
-        lastHiddenStates = self.model(**tokenized)
+        if len(sentences) == 0:
+            return None, None
 
-        return sentences, lastHiddenStates[0][:, 0, :].detach().numpy()
+        return sentences, self._encode(sentences, specialTokens=self.padToken)
 
     async def embed(self, text: str) -> Optional[np.ndarray]:
         """
@@ -103,8 +277,34 @@ class BertEmbedding(Embedding):
         :param text: The text to be encoded.
         :return: A vector representing the text.  None for if the text is empty.
         """
-        sentences, vectors = self.embedSentences(text)
-        return np.mean(vectors, axis=0) if sentences else None
+        return (await self.embedBatch([text]))[0]
+
+    async def embedBatch(self, texts: List[str], batchSize: int = DEFAULT_BATCH_SIZE) -> List[Optional[np.ndarray]]:
+        """
+        Encode many texts into vectors, as of embed().
+        The sentences of all the texts are encoded together in micro-batches, and then averaged per text.  This is
+        much faster than encoding the texts one by one.
+        :param texts: The texts to be encoded.
+        :param batchSize: Max sentences in a micro-batch
+        :return: A vector for each text.  None for an empty text.
+        """
+        sentences = []
+        owners = []
+        for i, text in enumerate(texts):
+            s = self._sentences(text)
+            sentences += s
+            owners += [i] * len(s)
+
+        if not sentences:
+            return [None] * len(texts)
+
+        # Average the sentence vectors of each text
+        vectors = self._encode(sentences, specialTokens=self.padToken, batchSize=batchSize)
+        counts = np.bincount(owners, minlength=len(texts))
+        sums = np.zeros((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+        np.add.at(sums, owners, vectors)
+
+        return [sums[i] / counts[i] if counts[i] else None for i in range(len(texts))]
 
     def embed1(self, text: str) -> Optional[np.ndarray]:
         """
@@ -113,14 +313,4 @@ class BertEmbedding(Embedding):
         :param text: The text to be encoded.
         :return: A vector representing the text.
         """
-        tokenized = self.tokenizer(
-            [text],
-            padding=True, max_length=512, truncation=True,
-            add_special_tokens=True,
-            return_tensors='pt'
-        )
-
-        lastHiddenStates = self.model(**tokenized)
-
-        return lastHiddenStates[0][:, 0, :].detach().numpy()[0]
-
+        return self._encode([text], specialTokens=True)[0]
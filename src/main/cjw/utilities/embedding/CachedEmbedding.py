@@ -0,0 +1,186 @@
+import hashlib
+import inspect
+import logging
+import re
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, List, Tuple, Dict
+
+import numpy as np
+
+from cjw.utilities.embedding.Embedding import Embedding
+
+
+class CachedEmbedding(Embedding):
+    """Caches the vectors of another :class:`Embedding`.
+
+    Vectors are kept in an LRU cache in the memory, and optionally in a SQLite file so that they survive restarts.
+    They are keyed by the model name and the hash of the text, with its spaces normalized.  A file can be shared by
+    several models.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    __DEFAULT_CAPACITY = 10000  # Number of vectors cached in the memory
+    __QUERY_BATCH_SIZE = 500    # Hashes looked up in the file at a time
+
+    __spaces = re.compile(r"\s+")
+
+    def __init__(
+            self,
+            embedding: Embedding,
+            path: str = None,
+            modelName: str = None,
+            capacity: int = __DEFAULT_CAPACITY,
+    ):
+        """ The constructor
+
+        Args:
+            embedding (Embedding): The embedding to cache
+            path (str): The SQLite file.  (default None for caching only in the memory)
+            modelName (str): Name of the model in the keys.  It shall be changed when the model changes.
+                (default the "modelName" of the embedding, or its class name)
+            capacity (int): Max number of vectors cached in the memory (default 10000)
+        """
+        self.embedding = embedding
+        self.modelName = modelName or getattr(embedding, "modelName", None) or type(embedding).__name__
+        self.capacity = capacity
+        self.path = path
+
+        self.hits = 0           # Number of texts found in the memory or the file
+        self.misses = 0         # Number of texts passed to the wrapped embedding
+
+        self.__cache: OrderedDict[Tuple[str, str], Optional[np.ndarray]] = OrderedDict()
+        self.__db: Optional[sqlite3.Connection] = None
+        if path:
+            self.__db = sqlite3.connect(path, check_same_thread=False)
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, dtype TEXT, vector BLOB, PRIMARY KEY (model, hash))"
+            )
+            self.__db.commit()
+
+    @classmethod
+    def hash(cls, text: str) -> str:
+        normalized = cls.__spaces.sub(" ", (text or "").strip())
+        return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+    def _remember(self, key: Tuple[str, str], vector: Optional[np.ndarray]):
+        self.__cache[key] = vector
+        self.__cache.move_to_end(key)
+        while len(self.__cache) > self.capacity:
+            self.__cache.popitem(last=False)
+
+    def _load(self, model: str, hashes: List[str]) -> Dict[str, Optional[np.ndarray]]:
+        """Looks up vectors in the file."""
+        found = dict()
+        if not self.__db:
+            return found
+
+        for start in range(0, len(hashes), self.__QUERY_BATCH_SIZE):
+            batch = hashes[start:start + self.__QUERY_BATCH_SIZE]
+            rows = self.__db.execute(
+                f"SELECT hash, dtype, vector FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                [model] + batch
+            )
+            for h, dtype, vector in rows:
+                found[h] = np.frombuffer(vector, dtype=dtype).copy() if vector is not None else None
+
+        return found
+
+    def _save(self, model: str, vectors: Dict[str, Optional[np.ndarray]]):
+        """Writes vectors to the file."""
+        if not self.__db or not vectors:
+            return
+
+        self.__db.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, hash, dtype, vector) VALUES (?, ?, ?, ?)",
+            [
+                (model, h, v.dtype.str if v is not None else None, v.tobytes() if v is not None else None)
+                for h, v in vectors.items()
+            ]
+        )
+        self.__db.commit()
+
+    async def _cached(self, method: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """ Gets the vectors of texts from the cache, or from the wrapped embedding if not cached
+
+        Args:
+            method (str): "embed" or "embed1", as they give different vectors
+            texts (List[str]): The texts
+
+        Returns:
+            The vectors
+        """
+        model = f"{self.modelName}:{method}"
+        hashes = [self.hash(t) for t in texts]
+
+        vectors: Dict[str, Optional[np.ndarray]] = dict()
+        for h in hashes:
+            if (model, h) in self.__cache:
+                self.__cache.move_to_end((model, h))
+                vectors[h] = self.__cache[(model, h)]
+
+        missed = [h for h in dict.fromkeys(hashes) if h not in vectors]
+        if missed:
+            loaded = self._load(model, missed)
+            for h, v in loaded.items():
+                self._remember((model, h), v)
+            vectors.update(loaded)
+
+        # Embed the rest, each distinct text once
+        pending: Dict[str, str] = dict()
+        for h, t in zip(hashes, texts):
+            if h not in vectors:
+                pending.setdefault(h, t)
+        self.misses += len(pending)
+        self.hits += len(texts) - len(pending)
+        if pending:
+            if method == "embed":
+                embedded = await self.embedding.embedBatch(list(pending.values()))
+            else:
+                embedded = []
+                for t in pending.values():
+                    vector = self.embedding.embed1(t)   # Not a coroutine with some models
+                    embedded.append(await vector if inspect.isawaitable(vector) else vector)
+
+            new = {h: np.asarray(v) if v is not None else None for h, v in zip(pending, embedded)}
+            for h, v in new.items():
+                self._remember((model, h), v)
+            self._save(model, new)
+            vectors.update(new)
+
+        # Copies, so that the caller cannot modify the cache
+        return [vectors[h].copy() if vectors[h] is not None else None for h in hashes]
+
+    def load(self):
+        self.embedding.load()
+
+    def warmup(self):
+        self.embedding.warmup()
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        return (await self._cached("embed", [text]))[0]
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        return (await self._cached("embed1", [text]))[0]
+
+    async def embedBatch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        return await self._cached("embed", texts)
+
+    def stats(self) -> dict:
+        """Returns the cache counters for tuning."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / total if total else 0.0,
+            "size": len(self.__cache),
+            "capacity": self.capacity,
+        }
+
+    def close(self):
+        """Closes the file."""
+        if self.__db:
+            self.__db.close()
+            self.__db = None
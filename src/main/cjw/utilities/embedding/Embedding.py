@@ -1,5 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, List
 
 import numpy as np
 
@@ -13,3 +14,23 @@ class Embedding(ABC):
     @abstractmethod
     async def embed1(self, text: str) -> Optional[np.ndarray]:
         pass
+
+    def load(self):
+        """Loads the weights of the model ahead of the first use, without running it.  Models loaded lazily shall
+        override this."""
+        pass
+
+    def warmup(self):
+        """Loads the model ahead of the first use, and runs it once.  Models loaded lazily shall override this."""
+        self.load()
+
+    async def embedBatch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """ Embeds many texts.  Models that can do better than one text at a time shall override this.
+
+        Args:
+            texts (List[str]): The texts
+
+        Returns:
+            The vector of each text, as of :meth:`embed`.  None for an empty text.
+        """
+        return list(await asyncio.gather(*[self.embed(t) for t in texts]))
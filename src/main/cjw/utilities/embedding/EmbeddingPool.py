@@ -0,0 +1,147 @@
+import asyncio
+import inspect
+import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, Tuple, Any, Set
+
+import numpy as np
+
+from cjw.utilities.embedding.Embedding import Embedding
+
+# The embedding served by a worker process, and the event loop running its coroutines
+_embedding: Optional[Embedding] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _start(embedding: Embedding, threads: Optional[int]):
+    global _embedding, _loop
+    _loop = asyncio.new_event_loop()
+    _embedding = embedding
+
+    if threads and "torch" in sys.modules:
+        # Workers sharing the cores shall not each run as many threads as there are cores
+        sys.modules["torch"].set_num_threads(threads)
+
+    # Run in the worker, as the thread pools of a model run before forking can deadlock the forked processes
+    _embedding.warmup()
+
+
+def _run(method: str, args: tuple) -> Any:
+    result = getattr(_embedding, method)(*args)
+    return _loop.run_until_complete(result) if inspect.isawaitable(result) else result
+
+
+class EmbeddingPool(Embedding):
+    """Runs an embedding in a pool of worker processes, batching the texts of concurrent callers.
+
+    Models like :class:`BertEmbedding` compute synchronously, blocking the event loop, and are bound to one core by
+    the GIL.  In the pool, the texts are embedded in the workers while the caller awaits.  Texts embedded
+    concurrently by different callers are gathered into batches, up to a size or for a short delay, so that the model
+    runs on batches rather than on single texts.
+
+    By default, the worker processes are spawned, and each loads the model of the embedding pickled to it.  With the
+    "fork" start method, the weights are loaded once before the pool is created, so that the workers share them with
+    the parent rather than each having a copy.  The model is not run before forking, as the thread pools it would
+    start do not survive a fork.  Forking is not safe on macOS.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    DEFAULT_BATCH_SIZE = 32
+    DEFAULT_DELAY = 0.005   # Seconds to wait for more texts before embedding a batch smaller than the size
+
+    def __init__(
+            self,
+            embedding: Embedding,
+            workers: int = None,
+            batchSize: int = DEFAULT_BATCH_SIZE,
+            delay: float = DEFAULT_DELAY,
+            context: str = "spawn",
+    ):
+        """ Starts the worker processes
+
+        Args:
+            embedding (Embedding): The embedding.  Its weights are loaded here if forking.
+            workers (int): Number of worker processes (default the number of cores)
+            batchSize (int): Max texts embedded at a time by a worker (default 32)
+            delay (float): Seconds to wait for more texts to fill up a batch (default 0.005)
+            context (str): Multiprocessing start method, "spawn", "forkserver" or "fork".  (default "spawn")
+        """
+        self.embedding = embedding
+        self.modelName = getattr(embedding, "modelName", None) or type(embedding).__name__
+        self.workers = workers or os.cpu_count()
+        self.batchSize = batchSize
+        self.delay = delay
+
+        if context == "fork":
+            # Loaded before the workers are forked, so that they share it.  They warm it up by themselves.
+            embedding.load()
+        self.__executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(context),
+            initializer=_start,
+            initargs=(embedding, max(1, os.cpu_count() // self.workers)),
+        )
+
+        self.__pending: List[Tuple[str, asyncio.Future]] = []   # Texts waiting for a batch, with their callers
+        self.__timer: Optional[asyncio.TimerHandle] = None
+        self.__batches: Set[asyncio.Task] = set()               # Batches being embedded
+
+    async def _call(self, method: str, *args) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.__executor, _run, method, args)
+
+    def _flush(self):
+        """Sends the pending texts to a worker as a batch."""
+        if self.__timer:
+            self.__timer.cancel()
+            self.__timer = None
+
+        batch, self.__pending = self.__pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._embedPending(batch))
+            self.__batches.add(task)
+            task.add_done_callback(self.__batches.discard)
+
+    async def _embedPending(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            vectors = await self._call("embedBatch", [text for text, _ in batch])
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.__pending.append((text, future))
+
+        if len(self.__pending) >= self.batchSize:
+            self._flush()
+        elif not self.__timer:
+            self.__timer = loop.call_later(self.delay, self._flush)
+
+        return await future
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        return await self._call("embed1", text)
+
+    async def embedBatch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        # Already a batch.  It is split across the workers.
+        batches = await asyncio.gather(*[
+            self._call("embedBatch", texts[start:start + self.batchSize])
+            for start in range(0, len(texts), self.batchSize)
+        ])
+        return [vector for batch in batches for vector in batch]
+
+    async def close(self):
+        """Stops the worker processes."""
+        if self.__batches:
+            await asyncio.gather(*self.__batches, return_exceptions=True)
+        await asyncio.get_running_loop().run_in_executor(None, self.__executor.shutdown)
@@ -1,11 +1,16 @@
+import asyncio
 import copy
+import json
 import logging
-import time
-from typing import List, Dict, Callable
+from typing import List, Dict, Callable, Tuple, Awaitable, Optional, AsyncIterator
 
 import aiohttp
 import openai
-from transformers import GPT2TokenizerFast
+
+from cjw.utilities.HttpSession import HttpSession
+from cjw.utilities.RateLimiter import RateLimiter
+from cjw.utilities.RetryPolicy import RetryPolicy
+from cjw.utilities.llm.TokenCounter import TokenCounter
 
 
 class GptPortal:
@@ -25,19 +30,25 @@ class GptPortal:
         def __init__(self, message):
             super().__init__(message)
 
+    class RateLimitError(RetryPolicy.RetryableError):  # Rate limit exceeded, to be retried more slowly
+        pass
+
     __instances: Dict[str, "GptPortal"] = dict()  # Dictionary to store instances of GptPortal
-    __tokenizer = None  # Tokenizer instance
 
     __DEFAULT_MODELS = {  # Dictionary of default models
         "completion": "text-davinci-003",
         "chatCompletion": "gpt-4",
     }
 
-    __RETRY_INTERVAL = 1  # Retry interval in seconds
-    __SLOW_RETRY_INTERVAL = 5  # Slow retry interval in seconds
+    DEFAULT_SERVER_URL = "https://api.openai.com/v1"
+
+    __DEFAULT_COMPLETION_TOKENS = 256  # Tokens reserved for a completion without max_tokens
+
+    RETRY_INTERVAL = 1  # Retry interval in seconds
+    SLOW_RETRY_INTERVAL = 5  # Retry interval in seconds when the rate limit is exceeded
 
     @classmethod
-    def of(cls, key: str, organization: str = None) -> "GptPortal":
+    def of(cls, key: str, organization: str = None, **kwargs) -> "GptPortal":
         """
         Returns an instance of GptPortal based on the provided key and organization.
         If an instance with the same key already exists, returns the existing instance.
@@ -45,27 +56,123 @@ class GptPortal:
         Args:
             key (str): API key
             organization (str): Organization (optional)
+            **kwargs: Other arguments of the constructor, for a new instance
 
         Returns:
             GptPortal: Instance of GptPortal
         """
         if key not in cls.__instances:
-            cls.__instances[key] = GptPortal(key, organization)
+            cls.__instances[key] = GptPortal(key, organization, **kwargs)
 
         return cls.__instances[key]
 
-    def __init__(self, key: str, organization=None, access="openai"):
+    @classmethod
+    async def closeAll(cls):
         """
-        Initializes an instance of GptPortal.
+        Closes the connections of all the instances from of(), e.g. when the server shuts down.
+        """
+        for portal in cls.__instances.values():
+            await portal.close()
+
+    def __init__(
+            self,
+            key: str,
+            organization=None,
+            access="openai",
+            serverUrl: str = DEFAULT_SERVER_URL,
+            retryPolicy: RetryPolicy = None,
+            rateLimits: Dict[str, Tuple[int, int]] = None,
+            **kwargs
+    ):
+        """
+        Initializes an instance of GptPortal.  Its connections are pooled and kept alive across requests.
 
         Args:
             key (str): API key
             organization (str): Organization (optional)
             access (str): Access mode (openai or http)
+            serverUrl (str): URL of the API for the http access (default DEFAULT_SERVER_URL)
+            retryPolicy (RetryPolicy): How failed requests are retried.  (default backing off exponentially, and
+                more slowly when rate limited)
+            rateLimits (Dict[str, Tuple[int, int]]): Requests and tokens per minute allowed for the key, by model.
+                The limits of "default" apply to the models not listed.  (default no limits)
+            **kwargs: Connection pool arguments, like limit and timeout.  See :class:`HttpSession`.
         """
         self.key = key
         self.organization = organization
         self.access = access
+        self.serverUrl = serverUrl.rstrip("/")
+
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.key}",
+        }
+        if organization:
+            headers["OpenAI-Organization"] = organization
+        self.http = HttpSession(headers=headers, **kwargs)
+        self.rateLimits = rateLimits or dict()
+
+        self.retryPolicy = retryPolicy or RetryPolicy(
+            interval=self.RETRY_INTERVAL,
+            retryOn=(
+                openai.error.Timeout,
+                openai.error.APIError,
+                openai.error.APIConnectionError,
+                openai.error.ServiceUnavailableError,
+                openai.error.RateLimitError,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ),
+            intervals={
+                self.RateLimitError: self.SLOW_RETRY_INTERVAL,
+                openai.error.RateLimitError: self.SLOW_RETRY_INTERVAL,
+            },
+        )
+
+    async def close(self):
+        """
+        Closes the pooled connections.  They are opened again if the portal is used afterward.
+        """
+        await self.http.close()
+
+    def _limiter(self, model: str) -> Optional[RateLimiter]:
+        """Returns the rate limiter of the key and a model, if limited"""
+        limits = self.rateLimits.get(model, self.rateLimits.get("default"))
+        return RateLimiter.of(f"openai:{self.key}:{model}", *limits) if limits else None
+
+    @classmethod
+    def _requestTokens(cls, request: dict) -> int:
+        """Estimates the tokens of a request, of both the prompt and the completions"""
+        counter = TokenCounter.of(request.get("model"))
+        if "messages" in request:
+            prompt = counter.countMessages(request["messages"])
+        else:
+            prompt = counter.count(request.get("prompt"))
+
+        completion = request.get("max_tokens") or cls.__DEFAULT_COMPLETION_TOKENS
+        return prompt + completion * request.get("n", 1)
+
+    async def __limited(self, request: dict, send: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Sends a request once the rate limits allow.
+
+        Args:
+            request (dict): API request payload
+            send (Callable[[], Awaitable[dict]]): Sends the request
+
+        Returns:
+            dict: API response
+        """
+        limiter = self._limiter(request.get("model"))
+        if not limiter:
+            return await send()
+
+        reserved = await limiter.acquire(self._requestTokens(request))
+        response = await send()
+
+        usage = response.get("usage") if isinstance(response, dict) else None
+        limiter.settle(reserved, usage.get("total_tokens") if usage else None)
+        return response
 
     async def __usingOpenAI(self, function: Callable, request: dict, retries: int = 1) -> dict:
         """
@@ -80,21 +187,11 @@ class GptPortal:
             dict: API response
         """
         openai.api_key = self.key
-        response = None
-        tries = 0
 
-        while not response:
+        async def attempt() -> dict:
             try:
                 return await function(**request)
 
-            except (
-                openai.error.Timeout,
-                openai.error.APIError,
-                openai.error.APIConnectionError,
-                openai.error.ServiceUnavailableError,
-            ) as e:
-                self.logger.warning(f"Server connection error: {e}. Retry {tries + 1}")
-
             except openai.error.AuthenticationError as e:
                 message = f"Authentication failed: Unauthorized. {e}"
                 self.logger.error(message)
@@ -105,16 +202,12 @@ class GptPortal:
                 self.logger.info(message)
                 raise self.TooManyTokensError(message)
 
-            except openai.error.RateLimitError as e:
-                self.logger.warning(f"OpenAI rate exceeds limit. Slowing down retries. {e}")
-                time.sleep(self.__SLOW_RETRY_INTERVAL - self.__RETRY_INTERVAL)
-
-            tries += 1
-            if tries > retries:
-                raise self.ServiceNotAvailableError(f"OpenAI accesses failed after {tries} tries. Please try later")
-
-            self.logger.warning(f"OpenAI access failure (try {tries}).")
-            time.sleep(self.__RETRY_INTERVAL)
+        # The OpenAI library sends its requests in the pooled session, rather than one of its own per request
+        sessionToken = openai.aiosession.set(self.http.session())
+        try:
+            return await self.retryPolicy.run(lambda: self.__limited(request, attempt), retries, self.__exhausted)
+        finally:
+            openai.aiosession.reset(sessionToken)
 
     async def __usingHttp(self, function: str, request: dict, retries: int = 1) -> dict:
         """
@@ -128,63 +221,125 @@ class GptPortal:
         Returns:
             dict: API response
         """
-        url = f"https://api.openai.com/v1/{function}"
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.key}",
-        }
+        url = f"{self.serverUrl}/{function}"
 
-        response = None
-        tries = 0
+        async def attempt() -> dict:
+            self.logger.info(f"Sending OpenAI API POST {request}")
+            async with self.http.session().post(url, json=request) as response:
+                results = await response.json(content_type=None)
 
-        while not response:
-            try:
-                async with aiohttp.ClientSession() as session:
-                    self.logger.info(f"Sending OpenAI API POST {request}")
-                    async with session.post(url, headers=headers, json=request) as response:
-                        results = await response.json()
-
-                        if response.status == 200:  # Successful response
-                            self.logger.info(f"Got response {results}")
-                            return results
-
-                        elif response.status == 400:  # Incorrect request
-                            self.logger.warning(f"Too many tokens: {results['message']}")
-                            raise self.TooManyTokensError(results["message"])
-
-                        elif response.status == 401:  # Unauthorized
-                            self.logger.error("Authentication failed: Unauthorized")
-                            raise self.AuthenticationError(
-                                f"OpenAI authentication failed (incorrect or missing API keys)."
-                            )
-
-                        elif response.status == 403:  # Forbidden
-                            self.logger.error("Authentication failed: Forbidden")
-                            raise self.AuthenticationError(f"OpenAI operation not allowed.")
-
-                        elif response.status == 429:
-                            if "rate limit" in response.reason:
-                                self.logger.warning(f"OpenAI rate exceeds limit. Slowing down retries.")
-                                time.sleep(self.__SLOW_RETRY_INTERVAL - self.__RETRY_INTERVAL)
-                            else:
-                                # Quota exceeded or the server is not available.
-                                reason = response.reason.lower()
-                                raise self.ServiceNotAvailableError(reason)
-
-                        else:
-                            self.logger.warning(
-                                f"Unexpected error: {response.status} - {response.reason}. Retry {tries + 1}"
-                            )
-
-            except (aiohttp.ClientError, aiohttp.ServerConnectionError) as e:
-                self.logger.warning(f"Server connection error: {e}. Retry {tries + 1}")
-
-            tries += 1
-            if tries > retries:
-                raise self.ServiceNotAvailableError(f"GPT-3 access failed after {tries - 1} tries. Please try later")
-
-            self.logger.warning(f"GPT-3 access failure (try {tries}).")
-            time.sleep(1)
+                if response.status != 200:
+                    raise self.__httpError(response, results)
+
+                self.logger.info(f"Got response {results}")
+                return results
+
+        return await self.retryPolicy.run(lambda: self.__limited(request, attempt), retries, self.__exhausted)
+
+    def __httpError(self, response: aiohttp.ClientResponse, results: Optional[dict]) -> Exception:
+        """
+        Makes the exception of a failed HTTP response.
+
+        Args:
+            response (aiohttp.ClientResponse): The response
+            results (dict): The JSON body of the response
+
+        Returns:
+            Exception: The exception to raise
+        """
+        error = (results or dict()).get("error") or results or dict()
+
+        if response.status == 400:  # Incorrect request
+            self.logger.warning(f"Too many tokens: {error.get('message')}")
+            return self.TooManyTokensError(error.get("message"))
+
+        elif response.status == 401:  # Unauthorized
+            self.logger.error("Authentication failed: Unauthorized")
+            return self.AuthenticationError(f"OpenAI authentication failed (incorrect or missing API keys).")
+
+        elif response.status == 403:  # Forbidden
+            self.logger.error("Authentication failed: Forbidden")
+            return self.AuthenticationError(f"OpenAI operation not allowed.")
+
+        elif response.status == 429:
+            if error.get("code") == "insufficient_quota":
+                # Retrying will not help
+                return self.ServiceNotAvailableError(error.get("message", "quota exceeded"))
+
+            self.logger.warning(f"OpenAI rate exceeds limit. Slowing down retries.")
+            return self.RateLimitError(f"OpenAI rate limit: {error.get('message')}", response.headers.get("Retry-After"))
+
+        else:
+            return RetryPolicy.RetryableError(
+                f"Unexpected error: {response.status} - {response.reason}",
+                response.headers.get("Retry-After"),
+            )
+
+    async def __streamUsingHttp(self, function: str, request: dict, retries: int = 1) -> AsyncIterator[dict]:
+        """
+        Makes a streaming API request using HTTP.  Only opening the stream is retried.
+
+        Args:
+            function (str): API function to call
+            request (dict): API request payload
+            retries (int): Number of retries (default: 1)
+
+        Returns:
+            The chunks of the response, as they come
+        """
+        url = f"{self.serverUrl}/{function}"
+
+        async def attempt() -> aiohttp.ClientResponse:
+            self.logger.info(f"Sending OpenAI API POST {request} for streaming")
+            response = await self.http.session().post(url, json={**request, "stream": True})
+            if response.status != 200:
+                try:
+                    raise self.__httpError(response, await response.json(content_type=None))
+                finally:
+                    response.release()
+            return response
+
+        response = await self.retryPolicy.run(lambda: self.__limited(request, attempt), retries, self.__exhausted)
+
+        # Server-sent events, one chunk of JSON per event
+        async with response:
+            async for line in response.content:
+                line = line.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                yield json.loads(data)
+
+    async def __streamUsingOpenAI(self, request: dict, retries: int = 1) -> AsyncIterator[dict]:
+        """
+        Makes a streaming chat completion request using the OpenAI library.  Only opening the stream is retried.
+
+        Args:
+            request (dict): API request payload
+            retries (int): Number of retries (default: 1)
+
+        Returns:
+            The chunks of the response, as they come
+        """
+        openai.api_key = self.key
+
+        async def attempt():
+            return await openai.ChatCompletion.acreate(**request, stream=True)
+
+        sessionToken = openai.aiosession.set(self.http.session())
+        try:
+            chunks = await self.retryPolicy.run(lambda: self.__limited(request, attempt), retries, self.__exhausted)
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            openai.aiosession.reset(sessionToken)
+
+    def __exhausted(self, error: Exception, tries: int) -> Exception:
+        self.logger.warning(f"OpenAI access failure after {tries} tries: {error}")
+        return self.ServiceNotAvailableError(f"OpenAI accesses failed after {tries} tries. Please try later")
 
     async def completion(self, prompt: str, retries: int = 1, **kwargs) -> List[str] | str:
         """
@@ -260,7 +415,7 @@ class GptPortal:
             }
 
             if access == "http":
-                return await self.__usingHttp("chatCompletions", request, retries=retries)
+                return await self.__usingHttp("chat/completions", request, retries=retries)
             elif access == "openai":
                 return await self.__usingOpenAI(openai.ChatCompletion.acreate, request, retries=retries)
             else:
@@ -297,20 +452,87 @@ class GptPortal:
 
         return completions if multiple else completions[0]
 
+    async def streamChatCompletion(
+            self,
+            messages: List[dict],
+            retries: int = 1,
+            maxCompletion: int = 5,
+            **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Performs chat-based text completion like chatCompletion(), but gives the content as it is generated.
+        If GPT returns an incomplete response, it is continued in the same stream.
+
+        Args:
+            messages (List[dict]): List of messages in chat conversation
+            retries (int): Number of retries of opening a stream (default: 1)
+            maxCompletion (int): If GPT responds incompletely due to length, try at most this to complete (default: 5)
+            **kwargs: Additional keyword arguments, but "n" as only one completion is streamed
+
+        Returns:
+            The pieces of the content of the completion
+        """
+        if kwargs.get("model", "default") == "default":
+            kwargs["model"] = self.__DEFAULT_MODELS["chatCompletion"]
+
+        if kwargs.get("n", 1) != 1:
+            raise self.InvalidRequest("Only one completion can be streamed")
+        kwargs.pop("n", None)
+
+        access = kwargs.pop("access", self.access)
+        if access not in ["http", "openai"]:
+            message = f"Unknown access {access}"
+            self.logger.error(message)
+            raise self.InvalidRequest(message)
+
+        content = ""
+        conversation = messages
+        for pieces in range(maxCompletion + 1):
+            request = {
+                "messages": conversation,
+                **kwargs,
+            }
+            if access == "http":
+                chunks = self.__streamUsingHttp("chat/completions", request, retries=retries)
+            else:
+                chunks = self.__streamUsingOpenAI(request, retries=retries)
+
+            if pieces > 0:
+                content += " "
+                yield " "
+
+            finishReason = None
+            async for chunk in chunks:
+                if not chunk["choices"]:
+                    continue
+                choice = chunk["choices"][0]
+                delta = (choice.get("delta") or dict()).get("content")
+                if delta:
+                    content += delta
+                    yield delta
+                finishReason = choice.get("finish_reason") or finishReason
+
+            if finishReason != "length":
+                break
+
+            # Incomplete.  Call GPT again to continue the conversation.
+            conversation = messages + [
+                {"role": "assistant", "content": content},
+                {"role": "user", "content": "[continue, but with limits]"},
+            ]
+
     @classmethod
-    def estimateTokens(cls, text: str) -> int:
+    def estimateTokens(cls, text: str, model: str = None) -> int:
         """
-        Estimates the number of tokens in a given text.
+        Counts the number of tokens in a given text, with the encoding of a model.
 
         Args:
             text (str): Input text
+            model (str): The model (default that of chatCompletion)
 
         Returns:
             int: Number of tokens
         """
-        if not text:
-            return 0
-        if not cls.__tokenizer:
-            cls.__tokenizer = GPT2TokenizerFast.from_pretrained("gpt2")
-
-        return len(cls.__tokenizer(text)["input_ids"])
+        if model is None or model == "default":
+            model = cls.__DEFAULT_MODELS["chatCompletion"]
+        return TokenCounter.of(model).count(text)
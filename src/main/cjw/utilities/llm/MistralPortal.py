@@ -1,32 +1,82 @@
 import logging
-from typing import List
+from typing import List, Dict, Tuple
 
-from mistralai.client import MistralClient
+from mistralai.async_client import MistralAsyncClient
+from mistralai.exceptions import MistralAPIStatusException, MistralConnectionException
 from mistralai.models.chat_completion import ChatMessage
 
+from cjw.utilities.RateLimiter import RateLimiter
+from cjw.utilities.RetryPolicy import RetryPolicy
+
 
 class MistralPortal:
     logger = logging.getLogger(__qualname__)  # Logger for logging messages
 
     __DEFAULT_MODEL = "mistral-tiny"
+    __DEFAULT_RETRIES = 5
+    __DEFAULT_COMPLETION_TOKENS = 256  # Tokens reserved for a completion without max_tokens
 
     @classmethod
     def of(cls, key: str, **kwargs) -> "MistralPortal":
         return MistralPortal(key, **kwargs)
 
-    def __init__(self, key: str = None, model: str = None, **kwargs):
-        self.mistral = MistralClient(api_key=key, **kwargs)
+    def __init__(
+            self,
+            key: str = None,
+            model: str = None,
+            retryPolicy: RetryPolicy = None,
+            rateLimits: Dict[str, Tuple[int, int]] = None,
+            **kwargs
+    ):
+        """
+        Initializes an instance of MistralPortal.
+
+        Args:
+            key (str): API key
+            model (str): The default model (default "mistral-tiny")
+            retryPolicy (RetryPolicy): How failed requests are retried.  (default backing off exponentially for up
+                to 5 retries)
+            rateLimits (Dict[str, Tuple[int, int]]): Requests and tokens per minute allowed for the key, by model.
+                The limits of "default" apply to the models not listed.  (default no limits)
+            **kwargs: Other arguments of the Mistral client
+        """
+        # The client would retry by sleeping, blocking the event loop.  The retries are left to the policy.
+        self.mistral = MistralAsyncClient(api_key=key, **{"max_retries": 0, **kwargs})
+        self.key = key
         self.model = model or self.__DEFAULT_MODEL
+        self.rateLimits = rateLimits or dict()
+        self.retryPolicy = retryPolicy or RetryPolicy(
+            retries=self.__DEFAULT_RETRIES,
+            retryOn=(MistralAPIStatusException, MistralConnectionException),
+        )
+
+    @classmethod
+    def estimateTokens(cls, text: str) -> int:
+        """Estimates the tokens of a text without a tokenizer: about 4 characters a token."""
+        return len(text) // 4 + 1 if text else 0
 
     async def chatCompletion(self, messages: List[dict], model=None, **kwargs) -> List[dict] | dict:
+        model = model or self.model
+        limits = self.rateLimits.get(model, self.rateLimits.get("default"))
+        limiter = RateLimiter.of(f"mistral:{self.key}:{model}", *limits) if limits else None
+
+        tokens = sum([self.estimateTokens(m["content"]) for m in messages]) + \
+            (kwargs.get("max_tokens") or self.__DEFAULT_COMPLETION_TOKENS)
         messages = [ChatMessage(role=m["role"], content=m["content"]) for m in messages]
         multiple = kwargs.get("top_p", 1) > 1
 
-        chat_response = self.mistral.chat(
-            model=model or self.model,
-            messages=messages,
-            **kwargs
-        )
+        async def send():
+            reserved = await limiter.acquire(tokens) if limiter else 0
+            response = await self.mistral.chat(
+                model=model,
+                messages=messages,
+                **kwargs
+            )
+            if limiter:
+                limiter.settle(reserved, response.usage.total_tokens if response.usage else None)
+            return response
+
+        chat_response = await self.retryPolicy.run(send)
 
         results = []
         for choice in chat_response.choices:
@@ -38,4 +88,5 @@ class MistralPortal:
 
         return results if multiple else results[0]
 
-
+    async def close(self):
+        await self.mistral.close()
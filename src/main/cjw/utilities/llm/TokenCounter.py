@@ -0,0 +1,141 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import tiktoken
+
+
+class TokenCounter:
+    """Counts the tokens of texts as an OpenAI model does, with the BPE encoding of the model.
+
+    The encoding is native, and only the number of tokens is kept.  Counts are memorized, as the same texts, like the
+    facts of an index, are counted again and again.
+    """
+
+    logger = logging.getLogger(__qualname__)
+
+    DEFAULT_ENCODING = "cl100k_base"    # Of gpt-3.5, gpt-4 and text-embedding-ada-002, for the models unknown
+
+    __DEFAULT_CAPACITY = 10000  # Number of counts memorized
+
+    # Tokens added to every message of a chat, and to prime the reply.  See the OpenAI cookbook.
+    __TOKENS_PER_MESSAGE = 3
+    __TOKENS_PER_NAME = 1
+    __TOKENS_PER_REPLY = 3
+
+    __counters: Dict[str, "TokenCounter"] = dict()
+    __lock = threading.Lock()
+
+    @classmethod
+    def of(cls, model: str = None) -> "TokenCounter":
+        """ Returns the counter of a model, shared by its users
+
+        Args:
+            model (str): The model name.  (default the encoding DEFAULT_ENCODING)
+
+        Returns:
+            The counter
+        """
+        model = model or cls.DEFAULT_ENCODING
+        with cls.__lock:
+            if model not in cls.__counters:
+                cls.__counters[model] = TokenCounter(model)
+            return cls.__counters[model]
+
+    def __init__(self, model: str = None, encoding: tiktoken.Encoding = None, capacity: int = __DEFAULT_CAPACITY):
+        """ The constructor
+
+        Args:
+            model (str): The model name, or the name of an encoding.  (default the encoding DEFAULT_ENCODING)
+            encoding (tiktoken.Encoding): The encoding, instead of that of the model
+            capacity (int): Max number of counts memorized (default 10000)
+        """
+        self.model = model or self.DEFAULT_ENCODING
+        self.capacity = capacity
+
+        if encoding is None:
+            try:
+                encoding = tiktoken.encoding_for_model(self.model)
+            except KeyError:
+                try:
+                    encoding = tiktoken.get_encoding(self.model)
+                except ValueError:
+                    self.logger.info(f"Unknown model {self.model}.  Counting tokens by {self.DEFAULT_ENCODING}.")
+                    encoding = tiktoken.get_encoding(self.DEFAULT_ENCODING)
+        self.encoding = encoding
+
+        self.__memo: OrderedDict[str, int] = OrderedDict()
+        self.__memoLock = threading.Lock()
+
+    def _remembered(self, text: str) -> Optional[int]:
+        with self.__memoLock:
+            count = self.__memo.get(text)
+            if count is not None:
+                self.__memo.move_to_end(text)
+            return count
+
+    def _remember(self, text: str, count: int):
+        with self.__memoLock:
+            self.__memo[text] = count
+            while len(self.__memo) > self.capacity:
+                self.__memo.popitem(last=False)
+
+    def count(self, text: str) -> int:
+        """ Counts the tokens of a text
+
+        Args:
+            text (str): The text
+
+        Returns:
+            The number of tokens
+        """
+        if not text:
+            return 0
+
+        count = self._remembered(text)
+        if count is None:
+            count = len(self.encoding.encode_ordinary(text))
+            self._remember(text, count)
+        return count
+
+    def __call__(self, text: str) -> int:
+        return self.count(text)
+
+    def countBatch(self, texts: List[str]) -> List[int]:
+        """ Counts the tokens of texts.  Those not memorized are encoded together, in parallel threads.
+
+        Args:
+            texts (List[str]): The texts
+
+        Returns:
+            The numbers of tokens of the texts
+        """
+        counts = [0 if not t else self._remembered(t) for t in texts]
+
+        missed = list(dict.fromkeys(t for t, c in zip(texts, counts) if c is None))
+        if missed:
+            encoded = {t: len(tokens) for t, tokens in zip(missed, self.encoding.encode_ordinary_batch(missed))}
+            for t, c in encoded.items():
+                self._remember(t, c)
+            counts = [encoded[t] if c is None else c for t, c in zip(texts, counts)]
+
+        return counts
+
+    def countMessages(self, messages: List[dict]) -> int:
+        """ Counts the tokens of the messages of a chat, including those the API adds around them
+
+        Args:
+            messages (List[dict]): The messages, of "role", "content" and optionally "name"
+
+        Returns:
+            The number of tokens of the prompt
+        """
+        values = [v for m in messages for v in m.values() if isinstance(v, str)]    # Role, content and name
+        names = [m for m in messages if m.get("name")]
+        return (
+            sum(self.countBatch(values)) +
+            self.__TOKENS_PER_MESSAGE * len(messages) +
+            self.__TOKENS_PER_NAME * len(names) +
+            self.__TOKENS_PER_REPLY
+        )
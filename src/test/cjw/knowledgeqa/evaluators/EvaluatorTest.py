@@ -1,14 +1,19 @@
 import asyncio
 import logging
 import unittest
+from typing import Optional
+
+import numpy as np
 
 from cjw.knowledgeqa import indexers, bots
+from cjw.knowledgeqa.bots.Answer import Answer
 from cjw.knowledgeqa.bots.Bot import Bot
 from cjw.knowledgeqa.evaluators.ConsistencyEvaluator import ConsistencyEvaluator
 from cjw.knowledgeqa.evaluators.ProximityEvaluator import ProximityEvaluator
 from cjw.knowledgeqa.evaluators.QAData import QAData
 from cjw.knowledgeqa.indexers import Indexer
 from cjw.utilities.embedding.BertEmbedding import BertEmbedding
+from cjw.utilities.embedding.Embedding import Embedding
 
 
 class EvaluatorTest(unittest.TestCase):
@@ -56,5 +61,38 @@ class EvaluatorTest(unittest.TestCase):
         print(score)
 
 
+class BoundedAskTest(unittest.TestCase):
+
+    class CountingBot(Bot):
+        """Answers the questions after a while, keeping count of the questions asked at a time."""
+        def __init__(self):
+            super().__init__()
+            self.asking = 0
+            self.maxAsking = 0
+
+        async def ask(self, question: str, **kwargs) -> Answer:
+            self.asking += 1
+            self.maxAsking = max(self.maxAsking, self.asking)
+            await asyncio.sleep(0.01)
+            self.asking -= 1
+            return Answer.of(f"{question} [1]")
+
+    class LengthEmbedding(Embedding):
+        async def embed(self, text: str) -> Optional[np.ndarray]:
+            return np.array([1.0, len(text)])
+
+        async def embed1(self, text: str) -> Optional[np.ndarray]:
+            return await self.embed(text)
+
+    def test_consistency(self):
+        bot = self.CountingBot()
+        questions = [f"question {i}" for i in range(10)]
+        evaluator = ConsistencyEvaluator(questions, self.LengthEmbedding(), concurrency=3).forBot(bot)
+
+        score = asyncio.new_event_loop().run_until_complete(evaluator.evaluate(tries=3))
+        self.assertAlmostEqual(score, 1.0)
+        self.assertEqual(bot.maxAsking, 3)
+
+
 if __name__ == '__main__':
     unittest.main()
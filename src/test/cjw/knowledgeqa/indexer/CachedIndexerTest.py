@@ -0,0 +1,109 @@
+import asyncio
+import time
+import unittest
+from typing import List, Any
+
+from cjw.knowledgeqa.indexers.CachedIndexer import CachedIndexer
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+
+
+class CountingIndexer(Indexer):
+    """Answers every query with a result naming the query and the version of the data, and counts the searches."""
+    def __init__(self):
+        self.searches = 0
+        self.version = 0
+
+    async def add(self, data: List[dict], keyFields: List[str], idField: str = None, **kwargs) -> Any:
+        self.version += 1
+
+    async def search(self, query: str, top: int = 3, **kwargs) -> List[dict]:
+        self.searches += 1
+        return [{"_id": f"{query}@{self.version}", "_score": 1.0}][:top]
+
+    async def get(self, ids: str | List[str]) -> List[dict]:
+        return []
+
+    async def delete(self, ids: str | List[str]) -> Any:
+        self.version += 1
+
+    async def kill(self) -> Any:
+        self.version += 1
+
+    async def size(self) -> Any:
+        return self.version
+
+
+class CachedIndexerTest(unittest.TestCase):
+
+    def test_cache(self):
+        loop = asyncio.get_event_loop()
+        counting = CountingIndexer()
+        index = CachedIndexer(counting, capacity=2)
+
+        first = loop.run_until_complete(index.search("What is M-137?"))
+        self.assertEqual(first[0]["_id"], "What is M-137?@0")
+
+        # Queries differing in spaces hit the cache.  Different arguments don't.
+        loop.run_until_complete(index.search("  What is   M-137? "))
+        self.assertEqual(counting.searches, 1)
+        loop.run_until_complete(index.search("What is M-137?", top=5))
+        loop.run_until_complete(index.search("What is M-137?", filter={"title": "M-137"}))
+        self.assertEqual(counting.searches, 3)
+        self.assertEqual(index.stats()["hits"], 1)
+        self.assertEqual(index.stats()["misses"], 3)
+
+        # Least recently used results are evicted
+        self.assertEqual(index.stats()["size"], 2)
+        loop.run_until_complete(index.search("What is M-137?"))
+        self.assertEqual(counting.searches, 4)
+
+        # Batches only pass the missed queries to the wrapped index
+        results = loop.run_until_complete(index.searchMany(["What is M-137?", "Where is Interlochen?"]))
+        self.assertEqual([r[0]["_id"] for r in results], ["What is M-137?@0", "Where is Interlochen?@0"])
+        self.assertEqual(counting.searches, 5)
+
+        # Changes to the index empty the cache
+        for change in [
+            index.add([{"text": "new"}], keyFields=["text"]),
+            index.delete("x"),
+            index.kill(),
+        ]:
+            loop.run_until_complete(change)
+            results = loop.run_until_complete(index.search("What is M-137?"))
+            self.assertEqual(results[0]["_id"], f"What is M-137?@{counting.version}")
+
+        # Unknown attributes are the wrapped index's
+        self.assertEqual(index.version, counting.version)
+
+    def test_case(self):
+        loop = asyncio.get_event_loop()
+
+        # The case matters to some embeddings
+        counting = CountingIndexer()
+        index = CachedIndexer(counting)
+        loop.run_until_complete(index.search("What is M-137?"))
+        loop.run_until_complete(index.search("what is m-137?"))
+        self.assertEqual(counting.searches, 2)
+
+        counting = CountingIndexer()
+        index = CachedIndexer(counting, ignoreCase=True)
+        loop.run_until_complete(index.search("What is M-137?"))
+        loop.run_until_complete(index.search("what is m-137?"))
+        self.assertEqual(counting.searches, 1)
+
+    def test_ttl(self):
+        loop = asyncio.get_event_loop()
+        counting = CountingIndexer()
+        index = CachedIndexer(counting, ttl=0.05)
+
+        loop.run_until_complete(index.search("What is M-137?"))
+        loop.run_until_complete(index.search("What is M-137?"))
+        self.assertEqual(counting.searches, 1)
+
+        time.sleep(0.1)
+        loop.run_until_complete(index.search("What is M-137?"))
+        self.assertEqual(counting.searches, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
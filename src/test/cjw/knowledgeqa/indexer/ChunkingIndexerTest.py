@@ -0,0 +1,89 @@
+import asyncio
+import json
+import unittest
+
+from cjw.knowledgeqa.indexers.Chunker import Chunker
+from cjw.knowledgeqa.indexers.ChunkingIndexer import ChunkingIndexer
+from cjw.knowledgeqa.indexers.LocalIndexer import LocalIndexer
+from IndexerFixtures import HashingEmbedding, TEST_DATA_DIR
+
+
+class ChunkingIndexerTest(unittest.TestCase):
+    TEST_DATA1 = f"{TEST_DATA_DIR}/simple.json"
+
+    @classmethod
+    def loadData(cls):
+        with open(cls.TEST_DATA1, "r") as fd:
+            return json.load(fd)
+
+    def test_chunker(self):
+        chunker = Chunker(maxTokens=60, overlap=20)
+        document = self.loadData()[0]
+        text = document["text"]
+
+        passages = chunker.split(document, idField="id")
+        self.assertGreater(len(passages), 2)
+        self.assertEqual(passages[1]["_id"], "7751000#1")
+        self.assertEqual(passages[1]["_parent"], "7751000")
+        self.assertEqual(passages[1]["title"], document["title"])
+
+        for p, following in zip(passages, passages[1:] + [None]):
+            self.assertEqual(text[p["_offset"]:p["_offset"] + len(p["text"])], p["text"])
+
+            sentences = list(Chunker(1, 0).spans(p["text"]))
+            if len(sentences) > 1:
+                self.assertLessEqual(chunker.countTokens(p["text"]), 60)
+            if following:
+                # Moving on, with nothing left out in between
+                self.assertLess(p["_offset"], following["_offset"])
+                self.assertEqual(text[p["_offset"] + len(p["text"]):following["_offset"]].strip(), "")
+
+        # Some passages start with the end of the previous ones
+        self.assertTrue(any([
+            q["_offset"] < p["_offset"] + len(p["text"]) for p, q in zip(passages, passages[1:])
+        ]))
+
+        self.assertEqual(len(chunker.split({"_id": "short", "text": "Short."})), 1)
+        self.assertEqual(chunker.split({"_id": "empty", "text": ""})[0]["_id"], "empty#0")
+        self.assertRaises(ValueError, Chunker, 10, 10)
+
+    def test_chunking(self):
+        loop = asyncio.get_event_loop()
+        data = self.loadData()
+        passages = LocalIndexer(HashingEmbedding())
+        index = ChunkingIndexer(passages, Chunker(maxTokens=60, overlap=20))
+
+        loop.run_until_complete(index.add(data, keyFields=["title", "text"], idField="id"))
+        chunks = loop.run_until_complete(index.size())
+        self.assertGreater(chunks, len(data))
+
+        # Collapsed to the documents
+        results = loop.run_until_complete(index.search("M-137 highway to Interlochen", top=5))
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len({r["_id"] for r in results}), 5)
+        self.assertEqual(results[0]["_id"], "7751000")
+        self.assertTrue(all([c.startswith("7751000#") for c in results[0]["_chunks"]]))
+
+        raw = loop.run_until_complete(index.search("M-137 highway to Interlochen", top=5, collapse=False))
+        self.assertTrue(all(["#" in r["_id"] for r in raw]))
+
+        # Documents are put together from their passages
+        original = {d["id"]: d for d in data}
+        documents = loop.run_until_complete(index.get(["7751000", "not there"]))
+        self.assertEqual([True, False], [d["_found"] for d in documents])
+        self.assertEqual(documents[0]["text"], original["7751000"]["text"])
+        self.assertEqual(documents[0]["title"], original["7751000"]["title"])
+
+        # Replacing a document with a shorter one removes its extra passages
+        before = len(Chunker(60, 20).split(original["7751000"], idField="id"))
+        loop.run_until_complete(index.add([{"_id": "7751000", "text": "M-137 is gone."}], keyFields=["text"]))
+        self.assertEqual(loop.run_until_complete(index.size()), chunks - before + 1)
+        self.assertEqual(loop.run_until_complete(index.get("7751000"))[0]["text"], "M-137 is gone.")
+
+        status = loop.run_until_complete(index.delete(["7751001", "not there"]))
+        self.assertEqual(["deleted", "not_found"], [i["result"] for i in status["items"]])
+        self.assertFalse(loop.run_until_complete(passages.get("7751001#0"))[0]["_found"])
+
+
+if __name__ == '__main__':
+    unittest.main()
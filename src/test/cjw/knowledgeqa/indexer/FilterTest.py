@@ -0,0 +1,54 @@
+import unittest
+
+from cjw.knowledgeqa.indexers.AttributeColumns import AttributeColumns
+from cjw.knowledgeqa.indexers.Filter import Filter
+
+
+class FilterTest(unittest.TestCase):
+
+    def test_matches(self):
+        f = Filter({"category": "park", "year": {"$gte": 1950, "$lt": 2000}, "_id": {"$nin": ["x"]}})
+        self.assertTrue(f.matches({"_id": "a", "category": "park", "year": 1950}))
+        self.assertFalse(f.matches({"_id": "a", "category": "park", "year": 2000}))
+        self.assertFalse(f.matches({"_id": "x", "category": "park", "year": 1960}))
+        self.assertFalse(f.matches({"_id": "a", "category": "park"}))
+        self.assertFalse(Filter({"year": {"$gt": 1}}).matches({"year": "2"}))
+
+        self.assertTrue(Filter({"_id": {"$in": []}}).void)
+        self.assertFalse(f.void)
+
+        self.assertRaises(ValueError, Filter, {"$or": [{"a": 1}]})
+        self.assertRaises(ValueError, Filter, {"a": {"$gt": "1"}})
+        self.assertRaises(ValueError, Filter, {"a": {"$in": "abc"}})
+        self.assertRaises(ValueError, Filter, {"a": [1, 2]})
+
+    def test_booleans(self):
+        # Booleans are not numbers, as in Pinecone, whether a document is matched by itself or by columns
+        documents = [{"a": True}, {"a": 1}, {"a": 1.0}, {"a": False}, {"a": 0}, {"a": "1"}, {"a": [1]}, {}]
+        cases = [
+            ("$eq", True, [True, False, False, False, False, False, False, False]),
+            ("$eq", 1, [False, True, True, False, False, False, False, False]),
+            ("$ne", 1, [True, False, False, True, True, True, True, True]),
+            ("$in", [True, 0], [True, False, False, False, True, False, False, False]),
+            ("$in", [1, False], [False, True, True, True, False, False, False, False]),
+            ("$nin", [1, False], [True, False, False, False, True, True, True, True]),
+        ]
+        columns = AttributeColumns()
+        for operator, value, expected in cases:
+            f = Filter({"a": {operator: value}})
+            self.assertEqual([f.matches(d) for d in documents], expected, f)
+            self.assertEqual(list(columns.mask("a", operator, value, documents)), expected, f)
+
+    def test_marqo(self):
+        self.assertEqual(
+            Filter({"category": "state park", "open": True, "year": {"$gt": 1950, "$lte": 2000}}).toMarqo(),
+            r"category:state\ park AND open:true AND year:[1950 TO *] AND NOT year:1950 AND year:[* TO 2000]"
+        )
+        self.assertEqual(
+            Filter({"_id": {"$in": ["M-137", "b"]}, "tag": {"$nin": ["x"]}, "kind": {"$ne": "road"}}).toMarqo(),
+            r"(_id:M\-137 OR _id:b) AND NOT (tag:x) AND NOT kind:road"
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
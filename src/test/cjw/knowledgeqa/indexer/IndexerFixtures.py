@@ -0,0 +1,28 @@
+import os
+import re
+import zlib
+from typing import Optional
+
+import numpy as np
+
+from cjw.utilities.embedding.Embedding import Embedding
+
+TEST_DATA_DIR = os.path.join(os.path.dirname(__file__), "../../../../../data")
+
+
+class HashingEmbedding(Embedding):
+    """A bag-of-words embedding that needs no model, good enough to tell the test documents apart."""
+    DIMENSION = 512
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        words = re.findall(r"[\w-]+", text.lower())
+        if not words:
+            return None
+
+        vector = np.zeros(self.DIMENSION, dtype=np.float32)
+        for w in words:
+            vector[zlib.crc32(w.encode()) % self.DIMENSION] += 1.0
+        return vector
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        return await self.embed(text)
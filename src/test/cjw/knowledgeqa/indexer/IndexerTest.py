@@ -1,7 +1,9 @@
 import asyncio
 import json
+import time
 import unittest
 from typing import List
+from unittest.mock import patch
 
 from cjw.knowledgeqa.indexers.Indexer import Indexer
 from cjw.knowledgeqa.indexers.MarqoIndexer import MarqoIndexer
@@ -82,6 +84,28 @@ class IndexerTest(unittest.TestCase):
         self.showMarqoResults(results)
         self.assertNotIn("7751062", [r["_id"] for r in results])
 
+    def test_marqo_nonblocking(self):
+        def slowSearch(q, limit, **kwargs):
+            time.sleep(0.2)
+            return {"hits": [{"_id": q, "_score": 1.0}]}
+
+        with patch("marqo.Client") as client:
+            client.return_value.get_index.return_value.search.side_effect = slowSearch
+            index = MarqoIndexer(self.MARQO_SERVER, self.TEST_INDEX_NAME, workers=4, timeout=1)
+
+        async def searchConcurrently():
+            return await asyncio.gather(*[index.search(str(i)) for i in range(4)])
+
+        # The searches overlap each other instead of blocking the event loop
+        loop = asyncio.get_event_loop()
+        start = time.time()
+        results = loop.run_until_complete(searchConcurrently())
+        self.assertLess(time.time() - start, 0.6)
+        self.assertEqual([r[0]["_id"] for r in results], ["0", "1", "2", "3"])
+
+        with self.assertRaises(asyncio.TimeoutError):
+            loop.run_until_complete(index.search("too slow", timeout=0.05))
+
 
 if __name__ == '__main__':
     unittest.main()
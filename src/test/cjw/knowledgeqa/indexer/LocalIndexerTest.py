@@ -0,0 +1,466 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from typing import Optional
+
+import numpy as np
+
+from cjw.knowledgeqa import indexers
+from cjw.knowledgeqa.indexers.Filter import Filter
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+from cjw.knowledgeqa.indexers.Ingestion import readJsonl, IngestReport
+from cjw.knowledgeqa.indexers.IvfIndexer import IvfIndexer
+from cjw.knowledgeqa.indexers.LocalIndexer import LocalIndexer
+from cjw.knowledgeqa.indexers.ProductQuantizer import ProductQuantizer
+from cjw.knowledgeqa.indexers.ScalarQuantizer import ScalarQuantizer
+from cjw.utilities.embedding.Embedding import Embedding
+from IndexerFixtures import HashingEmbedding, TEST_DATA_DIR
+
+
+class TableEmbedding(Embedding):
+    """Looks up the vectors of texts like "17" from a table, so that tests can control the embedding space."""
+    def __init__(self, table: np.ndarray):
+        self.table = table
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        return self.table[int(text)]
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        return await self.embed(text)
+
+
+class LocalIndexerTest(unittest.TestCase):
+    TEST_DATA1 = f"{TEST_DATA_DIR}/simple.json"
+
+    @classmethod
+    def loadData(cls):
+        with open(cls.TEST_DATA1, "r") as fd:
+            return json.load(fd)
+
+    def populate(self, **kwargs) -> LocalIndexer:
+        loop = asyncio.get_event_loop()
+        index = indexers.index("local", embedding=HashingEmbedding(), **kwargs)
+        status = loop.run_until_complete(index.add(self.loadData(), keyFields=["title", "text"], idField="id"))
+        self.assertFalse(status["errors"])
+        return index
+
+    def test_populate(self):
+        loop = asyncio.get_event_loop()
+        data = self.loadData()
+        index = self.populate()
+
+        self.assertEqual(loop.run_until_complete(index.size()), len(data))
+        self.assertNotIn("_id", data[0])    # The caller's data are left untouched
+
+        results = loop.run_until_complete(index.search("M-137 highway to Interlochen"))
+        self.assertEqual(len(results), 3)
+        self.assertIn("M-137 (Michigan highway)", [r["title"] for r in results])
+        self.assertEqual([r["_score"] for r in results], sorted([r["_score"] for r in results], reverse=True))
+
+        everything = loop.run_until_complete(index.search("Michigan", top=100))
+        self.assertEqual(len(everything), len(data))
+
+    def test_documents(self):
+        loop = asyncio.get_event_loop()
+        index = self.populate()
+        size = loop.run_until_complete(index.size())
+
+        m137 = loop.run_until_complete(index.get(["7751000", "not there"]))
+        self.assertEqual([True, False], [r["_found"] for r in m137])
+
+        deleteStatus = loop.run_until_complete(index.delete("7751000"))
+        self.assertEqual(len(deleteStatus["items"]), 1)
+        self.assertEqual(loop.run_until_complete(index.size()), size - 1)
+
+        deleted = loop.run_until_complete(index.get("7751000"))
+        self.assertEqual([False], [r["_found"] for r in deleted])
+
+        results = loop.run_until_complete(index.search("M-137 highway to Interlochen"))
+        self.assertNotIn("7751000", [r["_id"] for r in results])
+
+        # Adding an existing ID replaces the document
+        loop.run_until_complete(index.add([{"_id": "7751062", "text": "Replaced"}], keyFields=["text"]))
+        self.assertEqual(loop.run_until_complete(index.size()), size - 1)
+        replaced = loop.run_until_complete(index.get("7751062"))
+        self.assertEqual(replaced[0]["text"], "Replaced")
+
+        loop.run_until_complete(index.kill())
+        self.assertEqual(loop.run_until_complete(index.size()), 0)
+        self.assertEqual(loop.run_until_complete(index.search("M-137 highway to Interlochen")), [])
+
+    def test_searchMany(self):
+        loop = asyncio.get_event_loop()
+        index = self.populate()
+        queries = ["M-137 highway to Interlochen", "", "Michigan state park", "history of the county"]
+
+        def ids(results):
+            return [[r["_id"] for r in rs] for rs in results]
+
+        batched = loop.run_until_complete(index.searchMany(queries, top=5))
+        self.assertEqual(len(batched), len(queries))
+        self.assertEqual(batched[1], [])
+        for query, results in zip(queries, batched):
+            single = loop.run_until_complete(index.search(query, top=5))
+            self.assertEqual(ids([results]), ids([single]))
+            np.testing.assert_allclose([r["_score"] for r in results], [r["_score"] for r in single], rtol=1e-5)
+
+        # The default implementation of the base class searches one by one
+        self.assertEqual(ids(batched), ids(loop.run_until_complete(Indexer.searchMany(index, queries, top=5))))
+
+    def test_hybrid(self):
+        loop = asyncio.get_event_loop()
+        index = self.populate(lexical=True)
+        query = "M-137 Interlochen"
+
+        lexical = loop.run_until_complete(index.search(query, mode="lexical"))
+        self.assertEqual(lexical[0]["_id"], "7751000")
+        self.assertEqual(loop.run_until_complete(index.search("xyzzy", mode="lexical")), [])
+
+        hybrid = loop.run_until_complete(index.search(query, top=5, mode="hybrid"))
+        self.assertEqual(len(hybrid), 5)
+        self.assertEqual(hybrid[0]["_id"], "7751000")
+
+        # Only the lexical candidates are scored by their embeddings
+        prefiltered = loop.run_until_complete(index.search(query, top=5, prefilter=2))
+        self.assertLessEqual(len(prefiltered), 2)
+        self.assertTrue({r["_id"] for r in prefiltered} <= {r["_id"] for r in lexical[:2]})
+
+        loop.run_until_complete(index.delete("7751000"))
+        self.assertNotIn("7751000", [r["_id"] for r in loop.run_until_complete(index.search(query, mode="lexical"))])
+
+        # Without the lexical index, only the vector search is possible
+        self.assertRaises(ValueError, loop.run_until_complete, self.populate().search(query, mode="lexical"))
+
+    def test_filter(self):
+        loop = asyncio.get_event_loop()
+        data = [{**d, "rank": i, "even": i % 2 == 0} for i, d in enumerate(self.loadData())]
+        query = "M-137 highway to Interlochen"
+
+        for index in [LocalIndexer(HashingEmbedding(), lexical=True), IvfIndexer(HashingEmbedding(), trainingSize=10)]:
+            loop.run_until_complete(index.add(data, keyFields=["title", "text"], idField="id"))
+
+            def search(filter, top=100, **kwargs):
+                return loop.run_until_complete(index.search(query, top=top, filter=filter, **kwargs))
+
+            def expected(filter):
+                return {d["id"] for d in data if Filter(filter).matches({**d, "_id": d["id"]})}
+
+            for filter in [
+                {"even": True},
+                {"rank": {"$gte": 5, "$lt": 12}},
+                {"rank": {"$in": [1, 2, 3]}, "title": {"$ne": data[2]["title"]}},
+                {"_id": {"$in": ["7751000", "7751136", "not there"]}},
+                {"_id": {"$nin": ["7751000"]}, "rank": {"$lte": 3}},
+                {"_id": {"$in": []}},
+            ]:
+                # Probing all the clusters is exact.  Probing fewer may miss some, but never breaks the filter.
+                self.assertEqual({r["_id"] for r in search(filter, probes=100)}, expected(filter))
+                self.assertLessEqual({r["_id"] for r in search(filter, probes=1)}, expected(filter))
+
+            # The filtered out documents do not take the top slots
+            results = search({"rank": {"$gt": 0}}, top=3)
+            self.assertEqual(len(results), 3)
+            self.assertNotIn("7751000", [r["_id"] for r in results])
+
+            # Columns follow the changes of the documents
+            loop.run_until_complete(index.delete("7751001"))
+            loop.run_until_complete(index.add([{"_id": "7751042", "text": "Replaced", "rank": 100}], ["text"]))
+            self.assertEqual({r["_id"] for r in search({"rank": {"$gte": 1, "$lte": 2}})}, set())
+            self.assertEqual({r["_id"] for r in search({"rank": 100})}, {"7751042"})
+
+            if isinstance(index, IvfIndexer):
+                self.assertIsNotNone(index._centroids)
+            else:
+                lexical = search({"even": False}, mode="lexical")
+                self.assertTrue(all([not r["even"] for r in lexical]))
+
+        self.assertRaises(ValueError, loop.run_until_complete, index.search(query, filter={"rank": {"$near": 1}}))
+
+    def test_ingest(self):
+        loop = asyncio.get_event_loop()
+        data = self.loadData() + [{"id": "empty", "title": "", "text": ""}]
+
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl = os.path.join(directory, "simple.jsonl")
+            with open(jsonl, "w") as fd:
+                for d in data:
+                    fd.write(json.dumps(d) + "\n")
+
+            progress = []
+            index = LocalIndexer(HashingEmbedding())
+            report = loop.run_until_complete(index.ingest(
+                readJsonl(jsonl), keyFields=["title", "text"], idField="id", batchSize=2, concurrency=2,
+                onProgress=lambda r: progress.append(r.documents)
+            ))
+
+        self.assertIsInstance(report, IngestReport)
+        self.assertEqual(report.documents, len(data))
+        self.assertEqual(report.succeeded, len(data) - 1)
+        self.assertEqual(report.failures[0]["_id"], "empty")
+        self.assertEqual(progress[-1], len(data))
+        self.assertLess(report.batches, len(data) / 2)     # The index is fast, so the batches grew
+        self.assertEqual(loop.run_until_complete(index.size()), len(data) - 1)
+
+        # Asynchronous sources are read no faster than the batches are taken
+        read = []
+        added = []
+
+        async def source():
+            for d in self.loadData():
+                read.append(d["id"])
+                yield d
+
+        async def slowAdd(batch, *args, **kwargs):
+            self.assertLessEqual(len(read) - len(added), 2 * 3 + 3)    # Two batches in flight, one waiting
+            await asyncio.sleep(0.01)
+            added.extend(batch)
+            return {"errors": False, "items": [{"_id": d["id"], "status": 200} for d in batch]}
+
+        index.add = slowAdd
+        report = loop.run_until_complete(index.ingest(
+            source(), keyFields=["text"], idField="id", batchSize=3, concurrency=2, targetLatency=0.015
+        ))
+        self.assertEqual(report.succeeded, len(self.loadData()))
+
+    def test_sync(self):
+        loop = asyncio.get_event_loop()
+        data = self.loadData()
+
+        class CountingEmbedding(HashingEmbedding):
+            embedded = 0
+
+            async def embed(self, text: str) -> Optional[np.ndarray]:
+                CountingEmbedding.embedded += 1
+                return await super().embed(text)
+
+        index = LocalIndexer(CountingEmbedding())
+
+        with tempfile.TemporaryDirectory() as directory:
+            manifest = os.path.join(directory, "manifest.json")
+
+            report = loop.run_until_complete(index.sync(data, ["title", "text"], manifest, idField="id"))
+            self.assertEqual((report.added, report.updated, report.unchanged, report.deleted), (len(data), 0, 0, 0))
+            self.assertEqual(CountingEmbedding.embedded, len(data))
+
+            # Nothing changed, nothing embedded
+            report = loop.run_until_complete(index.sync(data, ["title", "text"], manifest, idField="id"))
+            self.assertEqual((report.added, report.updated, report.unchanged, report.deleted), (0, 0, len(data), 0))
+            self.assertEqual(CountingEmbedding.embedded, len(data))
+
+            changed = [{**data[0], "text": "M-137 is no more"}] + data[2:] + [{"id": "new", "title": "New", "text": "New"}]
+            report = loop.run_until_complete(index.sync(changed, ["title", "text"], manifest, idField="id"))
+            self.assertEqual((report.added, report.updated, report.unchanged, report.deleted), (1, 1, len(data) - 2, 1))
+            self.assertEqual(CountingEmbedding.embedded, len(data) + 2)
+
+            self.assertEqual(loop.run_until_complete(index.size()), len(data))
+            self.assertEqual(loop.run_until_complete(index.get(data[0]["id"]))[0]["text"], "M-137 is no more")
+            self.assertFalse(loop.run_until_complete(index.get(data[1]["id"]))[0]["_found"])
+
+            # Failed documents are tried again the next time
+            failing = changed + [{"id": "empty", "title": "", "text": ""}]
+            report = loop.run_until_complete(index.sync(failing, ["title", "text"], manifest, idField="id"))
+            self.assertEqual([f["_id"] for f in report.failures], ["empty"])
+            report = loop.run_until_complete(index.sync(failing, ["title", "text"], manifest, idField="id"))
+            self.assertEqual(len(report.failures), 1)
+            self.assertEqual(report.unchanged, len(changed))
+
+    def test_persistence(self):
+        loop = asyncio.get_event_loop()
+        query = "M-137 highway to Interlochen"
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "simple")
+
+            try:
+                LocalIndexer(HashingEmbedding(), path=path)
+                self.fail("The index should not exist")
+            except Indexer.IndexNotFoundError as e:
+                print(f"Raised exception as expected: {e}")
+
+            index = self.populate(new=True, path=path)
+            expected = loop.run_until_complete(index.search(query))
+            index.save()
+
+            try:
+                LocalIndexer.new(HashingEmbedding(), path=path)
+                self.fail("Should have raised index exist exception.")
+            except Indexer.IndexExistError as e:
+                print(f"Raised exception as expected: {e}")
+
+            opened = indexers.index("local", new=True, embedding=HashingEmbedding(), path=path)
+            self.assertIsInstance(opened._vectors, np.memmap)
+            self.assertEqual(loop.run_until_complete(opened.size()), loop.run_until_complete(index.size()))
+            self.assertEqual(loop.run_until_complete(opened.search(query)), expected)
+
+            # Modifying the opened index does not touch the saved files until it is saved again
+            loop.run_until_complete(opened.delete("7751000"))
+            loop.run_until_complete(opened.add([{"_id": "new", "text": "M-137 Interlochen"}], keyFields=["text"]))
+            self.assertEqual(loop.run_until_complete(opened.search(query, top=1))[0]["_id"], "new")
+
+            # Grown in a temporary file rather than in the memory
+            self.assertIsInstance(opened._vectors, np.memmap)
+            more = [{"_id": f"more {i}", "text": f"document number {i}"} for i in range(3000)]
+            loop.run_until_complete(opened.add(more, keyFields=["text"]))
+            self.assertIsInstance(opened._vectors, np.memmap)
+            self.assertEqual(loop.run_until_complete(opened.search(query, top=1))[0]["_id"], "new")
+            last = loop.run_until_complete(HashingEmbedding().embed("document number 2999"))
+            self.assertTrue(np.allclose(opened._vectors[opened._rows["more 2999"]], last / np.linalg.norm(last)))
+            loop.run_until_complete(opened.delete([m["_id"] for m in more]))
+
+            reopened = LocalIndexer(HashingEmbedding(), path=path)
+            self.assertEqual(loop.run_until_complete(reopened.search(query)), expected)
+
+            opened.save()
+            reopened = LocalIndexer(HashingEmbedding(), path=path)
+            self.assertEqual(loop.run_until_complete(reopened.get("7751000"))[0]["_found"], False)
+            self.assertEqual(loop.run_until_complete(reopened.get("new"))[0]["_found"], True)
+
+            loop.run_until_complete(reopened.kill())
+            self.assertRaises(Indexer.IndexNotFoundError, LocalIndexer, HashingEmbedding(), path=path)
+
+    def test_approximate(self):
+        loop = asyncio.get_event_loop()
+
+        # Clustered random vectors, and queries near some of them
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 64))
+        table = np.concatenate([
+            centers[rng.integers(20, size=3000)] + 0.3 * rng.normal(size=(3000, 64)),
+            centers[rng.integers(20, size=100)] + 0.3 * rng.normal(size=(100, 64)),
+        ]).astype(np.float32)
+        data = [{"_id": str(i), "key": str(i)} for i in range(3000)]
+        queries = [str(i) for i in range(3000, 3100)]
+
+        exact = LocalIndexer(TableEmbedding(table))
+        approximate = indexers.index("ivf", embedding=TableEmbedding(table), lists=32, trainingSize=2000)
+
+        loop.run_until_complete(exact.add(data[:1000], keyFields=["key"]))
+        loop.run_until_complete(approximate.add(data[:1000], keyFields=["key"]))
+        self.assertIsNone(approximate._centroids)   # Too small to train
+        loop.run_until_complete(exact.add(data[1000:], keyFields=["key"]))
+        loop.run_until_complete(approximate.add(data[1000:], keyFields=["key"]))
+        self.assertIsNotNone(approximate._centroids)
+
+        def recall(**kwargs) -> float:
+            found = 0
+            for q in queries:
+                expected = [r["_id"] for r in loop.run_until_complete(exact.search(q, top=10))]
+                results = [r["_id"] for r in loop.run_until_complete(approximate.search(q, top=10, **kwargs))]
+                found += len(set(expected) & set(results))
+            return found / (10 * len(queries))
+
+        # Probing every cluster is exhaustive.  Probing fewer trades the recall.
+        self.assertEqual(recall(probes=32), 1.0)
+        self.assertGreater(recall(probes=8), 0.9)
+        self.assertLessEqual(recall(probes=1), recall(probes=8))
+
+        # Deleted documents are tombstones until there are too many of them
+        loop.run_until_complete(approximate.delete(["0", "1"]))
+        self.assertEqual(loop.run_until_complete(approximate.size()), 2998)
+        self.assertEqual(len(approximate._tombstones), 2)
+        self.assertNotIn("0", [r["_id"] for r in loop.run_until_complete(approximate.search("0", probes=32))])
+
+        loop.run_until_complete(approximate.delete([str(i) for i in range(2, 1000)]))
+        self.assertEqual(loop.run_until_complete(approximate.size()), 2000)
+        self.assertEqual(len(approximate._tombstones), 0)
+
+        # Incremental inserts and replacements are searchable
+        loop.run_until_complete(approximate.add([{"_id": "x", "key": "5"}, {"_id": "1500", "key": "7"}], keyFields=["key"]))
+        self.assertEqual(loop.run_until_complete(approximate.search("5", top=1, probes=32))[0]["_id"], "x")
+        self.assertEqual(loop.run_until_complete(approximate.search("7", top=1, probes=32))[0]["_id"], "1500")
+
+        with tempfile.TemporaryDirectory() as directory:
+            approximate.save(directory)
+            opened = IvfIndexer(TableEmbedding(table), path=directory)
+            self.assertEqual(len(opened._centroids), 32)
+            for q in queries[:10]:
+                self.assertEqual(
+                    loop.run_until_complete(opened.search(q, probes=4)),
+                    loop.run_until_complete(approximate.search(q, probes=4))
+                )
+
+    def test_reopenUntrained(self):
+        loop = asyncio.get_event_loop()
+        table = np.random.default_rng(2).normal(size=(10, 16)).astype(np.float32)
+        index = IvfIndexer(TableEmbedding(table), trainingSize=100)
+        loop.run_until_complete(index.add([{"_id": str(i), "key": str(i)} for i in range(10)], keyFields=["key"]))
+
+        with tempfile.TemporaryDirectory() as directory:
+            index.save(directory)
+            opened = IvfIndexer(TableEmbedding(table), path=directory, trainingSize=100)
+            self.assertIsNone(opened._centroids)
+
+            # Enough deletions to purge the tombstones
+            loop.run_until_complete(opened.delete([str(i) for i in range(5)]))
+            self.assertEqual(loop.run_until_complete(opened.size()), 5)
+            self.assertIsInstance(opened._vectors, np.memmap)   # Compacted in place
+            self.assertTrue(np.allclose(opened._vectors[0], table[5] / np.linalg.norm(table[5])))
+            self.assertEqual(loop.run_until_complete(opened.search("7", top=1))[0]["_id"], "7")
+            opened.save(directory)
+
+    def test_quantization(self):
+        loop = asyncio.get_event_loop()
+
+        rng = np.random.default_rng(2)
+        centers = rng.normal(size=(20, 64))
+        table = (centers[rng.integers(20, size=2100)] + 0.5 * rng.normal(size=(2100, 64))).astype(np.float32)
+        data = [{"_id": str(i), "key": str(i)} for i in range(2000)]
+        queries = [str(i) for i in range(2000, 2100)]
+
+        exact = LocalIndexer(TableEmbedding(table))
+        loop.run_until_complete(exact.add(data, keyFields=["key"]))
+
+        def recall(index: LocalIndexer, **kwargs) -> float:
+            found = 0
+            for q in queries:
+                expected = [r["_id"] for r in loop.run_until_complete(exact.search(q, top=10))]
+                results = [r["_id"] for r in loop.run_until_complete(index.search(q, top=10, **kwargs))]
+                found += len(set(expected) & set(results))
+            return found / (10 * len(queries))
+
+        int8 = LocalIndexer(TableEmbedding(table), quantizer=ScalarQuantizer(trainingSize=1000))
+        pq = indexers.index("local", embedding=TableEmbedding(table), quantizer=ProductQuantizer(16, trainingSize=1000))
+        for index in [int8, pq]:
+            loop.run_until_complete(index.add(data[:500], keyFields=["key"]))
+            self.assertIsNone(index._codes)     # Too few to train
+            loop.run_until_complete(index.add(data[500:], keyFields=["key"]))
+            self.assertIsNotNone(index._codes)
+
+        self.assertEqual(int8._codes.nbytes * 4, exact._vectors[:2000].nbytes)
+        self.assertEqual(pq._codes[:2000].nbytes * 16, exact._vectors[:2000].nbytes)
+
+        # Re-ranking the candidates with the exact embeddings recovers the recall lost by the compression
+        self.assertGreater(recall(int8, rerank=0), 0.9)
+        self.assertGreater(recall(pq, rerank=0), 0.3)
+        self.assertGreater(recall(pq), recall(pq, rerank=0))
+        self.assertGreater(recall(pq, rerank=10), 0.95)
+
+        # Added and deleted documents are encoded along
+        loop.run_until_complete(pq.delete(["0", "1"]))
+        loop.run_until_complete(pq.add([{"_id": "x", "key": "5"}], keyFields=["key"]))
+        self.assertEqual({r["_id"] for r in loop.run_until_complete(pq.search("5", top=2))}, {"5", "x"})
+        self.assertNotIn("0", [r["_id"] for r in loop.run_until_complete(pq.search("0"))])
+
+        with tempfile.TemporaryDirectory() as directory:
+            pq.save(directory)
+            opened = LocalIndexer(TableEmbedding(table), path=directory)
+            self.assertIsInstance(opened.quantizer, ProductQuantizer)
+            self.assertIsInstance(opened._vectors, np.memmap)
+            for q in queries[:10]:
+                self.assertEqual(
+                    loop.run_until_complete(opened.search(q)), loop.run_until_complete(pq.search(q))
+                )
+
+        # The clusters of an inverted file can be quantized as well
+        ivf = IvfIndexer(TableEmbedding(table), lists=16, trainingSize=1000, quantizer=ScalarQuantizer(trainingSize=1000))
+        loop.run_until_complete(ivf.add(data, keyFields=["key"]))
+        loop.run_until_complete(ivf.delete([str(i) for i in range(500)]))
+        self.assertIsNotNone(ivf._codes)
+        self.assertEqual(len(ivf._codes), 1500)
+        self.assertEqual(loop.run_until_complete(ivf.search("600", top=1, probes=16))[0]["_id"], "600")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+import asyncio
+import json
+import unittest
+from typing import Optional, Dict
+
+import numpy as np
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from cjw.knowledgeqa import indexers
+from cjw.knowledgeqa.indexers.Indexer import Indexer
+from cjw.knowledgeqa.indexers.PineconeIndexer import PineconeIndexer
+from IndexerFixtures import HashingEmbedding, TEST_DATA_DIR
+
+
+class FakePinecone:
+    """An in-memory imitation of the Pinecone control and data plane HTTP APIs."""
+
+    def __init__(self):
+        self.indexes: Dict[str, dict] = dict()
+        self.vectors: Dict[str, Dict[str, dict]] = dict()   # Namespace -> ID -> vector
+        self.upserts = 0
+        self.deletes = 0
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.connections = set()
+        self.server: Optional[TestServer] = None
+
+        self.app = web.Application()
+        self.app.add_routes([
+            web.get("/indexes/{name}", self.describeIndex),
+            web.post("/indexes", self.createIndex),
+            web.delete("/indexes/{name}", self.deleteIndex),
+            web.post("/vectors/upsert", self.upsert),
+            web.post("/query", self.query),
+            web.get("/vectors/fetch", self.fetch),
+            web.post("/vectors/delete", self.delete),
+            web.post("/describe_index_stats", self.stats),
+        ])
+
+    async def start(self) -> str:
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+        return str(self.server.make_url("")).rstrip("/")
+
+    def track(self, request: web.Request):
+        self.connections.add(request.transport.get_extra_info("peername"))
+        assert request.headers["Api-Key"] == "test key"
+
+    async def describeIndex(self, request: web.Request) -> web.Response:
+        self.track(request)
+        name = request.match_info["name"]
+        if name not in self.indexes:
+            return web.json_response({"error": "not found"}, status=404)
+        return web.json_response(self.indexes[name])
+
+    async def createIndex(self, request: web.Request) -> web.Response:
+        self.track(request)
+        body = await request.json()
+        self.indexes[body["name"]] = {**body, "host": str(self.server.make_url("")).rstrip("/")}
+        return web.json_response(self.indexes[body["name"]], status=201)
+
+    async def deleteIndex(self, request: web.Request) -> web.Response:
+        self.track(request)
+        self.indexes.pop(request.match_info["name"])
+        self.vectors = dict()
+        return web.Response(status=202)
+
+    async def upsert(self, request: web.Request) -> web.Response:
+        self.track(request)
+        body = await request.json()
+        self.upserts += 1
+        self.inFlight += 1
+        self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        await asyncio.sleep(0.01)
+        self.inFlight -= 1
+
+        namespace = self.vectors.setdefault(body.get("namespace", ""), dict())
+        for v in body["vectors"]:
+            namespace[v["id"]] = v
+        return web.json_response({"upsertedCount": len(body["vectors"])})
+
+    async def query(self, request: web.Request) -> web.Response:
+        self.track(request)
+        body = await request.json()
+        namespace = self.vectors.get(body.get("namespace", ""), dict())
+        query = np.array(body["vector"])
+
+        def score(v: dict) -> float:
+            values = np.array(v["values"])
+            return float(values @ query / np.linalg.norm(values) / np.linalg.norm(query))
+
+        matches = sorted(
+            [{"id": i, "score": score(v), "metadata": v["metadata"]} for i, v in namespace.items()],
+            key=lambda m: -m["score"]
+        )
+        return web.json_response({"matches": matches[:body["topK"]], "namespace": body.get("namespace", "")})
+
+    async def fetch(self, request: web.Request) -> web.Response:
+        self.track(request)
+        namespace = self.vectors.get(request.query.get("namespace", ""), dict())
+        ids = request.query.getall("ids")
+        return web.json_response({"vectors": {i: namespace[i] for i in ids if i in namespace}})
+
+    async def delete(self, request: web.Request) -> web.Response:
+        self.track(request)
+        body = await request.json()
+        if len(body.get("ids", [])) > 1000:
+            return web.json_response({"message": "too many ids"}, status=400)
+        self.deletes += 1
+
+        namespace = self.vectors.get(body.get("namespace", ""), dict())
+        if body.get("deleteAll"):
+            namespace.clear()
+        for i in body.get("ids", []):
+            namespace.pop(i, None)
+        return web.json_response({})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        self.track(request)
+        return web.json_response({
+            "namespaces": {ns: {"vectorCount": len(vs)} for ns, vs in self.vectors.items()},
+        })
+
+
+class PineconeIndexerTest(unittest.TestCase):
+    TEST_DATA1 = f"{TEST_DATA_DIR}/simple.json"
+    TEST_INDEX_NAME = "test_indexer"
+
+    def setUp(self):
+        self.loop = asyncio.get_event_loop()
+        self.fake = FakePinecone()
+        self.serverUrl = self.loop.run_until_complete(self.fake.start())
+        self.indexers = []
+
+    def tearDown(self):
+        for index in self.indexers:
+            self.loop.run_until_complete(index.close())
+        self.loop.run_until_complete(self.fake.server.close())
+
+    def pinecone(self, **kwargs) -> PineconeIndexer:
+        index = indexers.index(
+            "pinecone", serverUrl=self.serverUrl, indexName=self.TEST_INDEX_NAME, embedding=HashingEmbedding(),
+            apiKey="test key", **kwargs
+        )
+        self.indexers.append(index)
+        return index
+
+    def test_pinecone(self):
+        loop = self.loop
+        fake = self.fake
+
+        with open(self.TEST_DATA1, "r") as fd:
+            data = json.load(fd)
+
+        try:
+            # Shouldn't exist
+            index = self.pinecone()
+            loop.run_until_complete(index.size())
+            self.fail("The index should not exist")
+        except Indexer.IndexNotFoundError as e:
+            print(f"Raised exception as expected: {e}")
+
+        index = self.pinecone(new=True, namespace="simple", batchSize=3, concurrency=2)
+
+        status = loop.run_until_complete(index.add(data, keyFields=["title", "text"], idField="id"))
+        self.assertFalse(status["errors"])
+        self.assertEqual(fake.indexes[self.TEST_INDEX_NAME]["dimension"], HashingEmbedding.DIMENSION)
+        self.assertEqual(loop.run_until_complete(index.size()), len(data))
+
+        # Uploaded in batches, in parallel up to the concurrency, through a small pool of connections
+        self.assertEqual(fake.upserts, (len(data) + 2) // 3)
+        self.assertEqual(fake.maxInFlight, 2)
+        self.assertLessEqual(len(fake.connections), 3)
+
+        results = loop.run_until_complete(index.search("M-137 highway to Interlochen"))
+        self.assertEqual(len(results), 3)
+        self.assertIn("M-137 (Michigan highway)", [r["title"] for r in results])
+
+        m137 = loop.run_until_complete(index.get(["7751000", "not there"]))
+        self.assertEqual([True, False], [r["_found"] for r in m137])
+        self.assertEqual(m137[0]["title"], "M-137 (Michigan highway)")
+
+        loop.run_until_complete(index.delete("7751000"))
+        self.assertEqual([False], [r["_found"] for r in loop.run_until_complete(index.get("7751000"))])
+        self.assertEqual(loop.run_until_complete(index.size()), len(data) - 1)
+
+        # Other namespaces are not affected
+        other = self.pinecone()
+        self.assertEqual(loop.run_until_complete(other.size()), 0)
+
+        loop.run_until_complete(index.kill())
+        self.assertEqual(loop.run_until_complete(index.size()), 0)
+
+        loop.run_until_complete(other.kill())
+        self.assertNotIn(self.TEST_INDEX_NAME, fake.indexes)
+
+    def test_deleteMany(self):
+        index = self.pinecone(new=True)
+        data = [{"_id": str(i), "text": f"document {i}"} for i in range(2500)]
+        self.loop.run_until_complete(index.add(data, keyFields=["text"]))
+        self.assertEqual(self.loop.run_until_complete(index.size()), 2500)
+
+        # Pinecone takes up to 1000 IDs a request
+        status = self.loop.run_until_complete(index.delete([str(i) for i in range(2400)]))
+        self.assertEqual(len(status["items"]), 2400)
+        self.assertEqual(self.fake.deletes, 3)
+        self.assertEqual(self.loop.run_until_complete(index.size()), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import unittest
+
+from cjw.knowledgeqa import indexers
+from cjw.knowledgeqa.indexers.LocalIndexer import LocalIndexer
+from cjw.knowledgeqa.indexers.ProcessIndexer import ProcessIndexer
+from cjw.knowledgeqa.indexers.ShardedIndexer import ShardedIndexer
+from IndexerFixtures import HashingEmbedding, TEST_DATA_DIR
+
+
+class WarmedEmbedding(HashingEmbedding):
+    """Writes the process ID where it is warmed up."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def warmup(self):
+        with open(self.path, "w") as fd:
+            fd.write(str(os.getpid()))
+
+
+class ShardedIndexerTest(unittest.TestCase):
+    TEST_DATA1 = f"{TEST_DATA_DIR}/simple.json"
+
+    @classmethod
+    def loadData(cls):
+        with open(cls.TEST_DATA1, "r") as fd:
+            return json.load(fd)
+
+    def check(self, sharded: ShardedIndexer):
+        loop = asyncio.get_event_loop()
+        data = self.loadData()
+        queries = ["M-137 highway to Interlochen", "Michigan state park", "history of the county"]
+
+        single = LocalIndexer(HashingEmbedding())
+        loop.run_until_complete(single.add(data, keyFields=["title", "text"], idField="id"))
+
+        status = loop.run_until_complete(sharded.add(data, keyFields=["title", "text"], idField="id"))
+        self.assertFalse(status["errors"])
+        self.assertEqual(len(status["items"]), len(data))
+        self.assertEqual(loop.run_until_complete(sharded.size()), len(data))
+
+        # Every shard has some of the documents
+        sizes = [loop.run_until_complete(s.size()) for s in sharded.shards]
+        self.assertTrue(all([0 < s < len(data) for s in sizes]))
+
+        # The merged results are those of a single index
+        expected = loop.run_until_complete(single.searchMany(queries, top=5))
+        results = loop.run_until_complete(sharded.searchMany(queries, top=5))
+        for e, r in zip(expected, results):
+            self.assertEqual([h["_id"] for h in e], [h["_id"] for h in r])
+
+        found = loop.run_until_complete(sharded.get(["7751136", "not there", "7751000"]))
+        self.assertEqual(["7751136", "not there", "7751000"], [d["_id"] for d in found])
+        self.assertEqual([True, False, True], [d["_found"] for d in found])
+
+        loop.run_until_complete(sharded.delete(["7751000", "7751062"]))
+        self.assertEqual(loop.run_until_complete(sharded.size()), len(data) - 2)
+        self.assertNotIn("7751000", [h["_id"] for h in loop.run_until_complete(sharded.search(queries[0]))])
+
+        loop.run_until_complete(sharded.kill())
+        self.assertEqual(loop.run_until_complete(sharded.size()), 0)
+
+    def test_sharded(self):
+        self.check(indexers.index("sharded", shards=[LocalIndexer(HashingEmbedding()) for _ in range(3)]))
+
+    def test_processes(self):
+        loop = asyncio.get_event_loop()
+        shards = [ProcessIndexer(functools.partial(LocalIndexer, HashingEmbedding())) for _ in range(2)]
+        try:
+            self.check(ShardedIndexer(shards))
+
+            # Other methods of the indexers run in the workers too
+            self.assertEqual(loop.run_until_complete(shards[0].call("size")), 0)
+        finally:
+            for s in shards:
+                loop.run_until_complete(s.close())
+
+    def test_processWarmup(self):
+        loop = asyncio.get_event_loop()
+        with tempfile.TemporaryDirectory() as path:
+            file = os.path.join(path, "pid")
+            shard = ProcessIndexer(functools.partial(LocalIndexer, WarmedEmbedding(file)))
+            try:
+                ShardedIndexer([shard]).warmup()
+                with open(file) as fd:
+                    pid = int(fd.read())
+                self.assertNotEqual(pid, os.getpid())    # Warmed up in the worker, where the model is used
+            finally:
+                loop.run_until_complete(shard.close())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+import unittest
+
+from cjw.utilities.HttpSession import HttpSession
+
+
+class HttpSessionTest(unittest.TestCase):
+
+    def test_idleLoop(self):
+        http = HttpSession()
+
+        async def session():
+            return http.session()
+
+        old = asyncio.new_event_loop()
+        first = old.run_until_complete(session())
+
+        loop = asyncio.new_event_loop()
+        second = loop.run_until_complete(session())
+        self.assertIsNot(first, second)
+        self.assertTrue(first.closed)    # Closed, though its loop is not running
+
+        old.close()
+        loop.close()
+        last = asyncio.new_event_loop()
+        third = last.run_until_complete(session())
+        self.assertTrue(second.closed)  # Closed, though its loop is closed
+        self.assertIsNot(second, third)
+
+        last.run_until_complete(http.close())
+        last.close()
+
+    def test_runningLoop(self):
+        http = HttpSession()
+
+        old = asyncio.new_event_loop()
+        thread = threading.Thread(target=old.run_forever)
+        thread.start()
+        try:
+            async def session():
+                return http.session()
+
+            first = asyncio.run_coroutine_threadsafe(session(), old).result()
+
+            loop = asyncio.new_event_loop()
+            second = loop.run_until_complete(session())
+            self.assertIsNot(first, second)
+
+            # Closed in its own loop
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0.1), old).result()
+            self.assertTrue(first.closed)
+
+            loop.run_until_complete(http.close())
+            loop.close()
+        finally:
+            old.call_soon_threadsafe(old.stop)
+            thread.join()
+            old.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import unittest
+
+from cjw.utilities.RateLimiter import RateLimiter
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_tokens(self):
+        loop = asyncio.get_event_loop()
+        limiter = RateLimiter(tokensPerMinute=600)   # 10 tokens a second
+
+        async def run():
+            start = time.monotonic()
+            done = []
+
+            async def request(name: str, tokens: int):
+                await limiter.acquire(tokens)
+                done.append((name, time.monotonic() - start))
+
+            # The budget of a minute at once, and then the others wait for it to refill, in order
+            await request("burst", 600)
+            await asyncio.gather(request("a", 3), request("b", 1), request("c", 1))
+            return done
+
+        done = loop.run_until_complete(run())
+        self.assertEqual(["burst", "a", "b", "c"], [name for name, _ in done])
+        self.assertLess(done[0][1], 0.05)
+        self.assertAlmostEqual(done[1][1], 0.3, delta=0.1)
+        self.assertAlmostEqual(done[3][1], 0.5, delta=0.1)
+
+        # Unused tokens are given back
+        limiter = RateLimiter(tokensPerMinute=600)
+
+        async def settled():
+            reserved = await limiter.acquire(600)
+            limiter.settle(reserved, 100)
+            start = time.monotonic()
+            await limiter.acquire(500)
+            return time.monotonic() - start
+
+        self.assertLess(loop.run_until_complete(settled()), 0.05)
+
+    def test_requests(self):
+        loop = asyncio.get_event_loop()
+        limiter = RateLimiter.of("test", requestsPerMinute=1200)   # 20 requests a second
+        self.assertIs(limiter, RateLimiter.of("test"))
+
+        async def run():
+            start = time.monotonic()
+            await asyncio.gather(*[limiter.acquire(1000) for _ in range(1210)])
+            return time.monotonic() - start
+
+        self.assertAlmostEqual(loop.run_until_complete(run()), 0.5, delta=0.15)
+        self.assertEqual(loop.run_until_complete(RateLimiter().acquire(1000)), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
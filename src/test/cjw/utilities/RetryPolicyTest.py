@@ -0,0 +1,82 @@
+import asyncio
+import time
+import unittest
+
+from cjw.utilities.RetryPolicy import RetryPolicy
+
+
+class RateLimited(RetryPolicy.RetryableError):
+    pass
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_delay(self):
+        policy = RetryPolicy(interval=1, multiplier=2, maxInterval=10, jitter=0.5, intervals={RateLimited: 4})
+
+        for tries, interval in [(1, 1), (2, 2), (3, 4), (5, 10)]:
+            delay = policy.delay(RetryPolicy.RetryableError("failed"), tries)
+            self.assertTrue(interval / 2 <= delay <= interval)
+
+        self.assertTrue(4 <= policy.delay(RateLimited("slow down"), 2) <= 8)
+        self.assertEqual(policy.delay(RateLimited("slow down", retryAfter="3"), 2), 3)
+        self.assertEqual(policy.delay(RateLimited("slow down", retryAfter=60), 1), 10)
+
+        class HttpError(Exception):
+            headers = {"retry-after": "2"}
+        self.assertEqual(policy.delay(HttpError(), 1), 2)
+
+    def test_run(self):
+        loop = asyncio.get_event_loop()
+        policy = RetryPolicy(retries=2, interval=0.05, jitter=0, retryOn=(ConnectionError,))
+        tries = 0
+
+        def failing(errors):
+            async def operation():
+                nonlocal tries
+                tries += 1
+                if errors:
+                    raise errors.pop(0)
+                return "done"
+            return operation
+
+        self.assertEqual(loop.run_until_complete(policy.run(failing([ConnectionError(), RateLimited("")]))), "done")
+        self.assertEqual(tries, 3)
+
+        # Not retried
+        tries = 0
+        self.assertRaises(ValueError, loop.run_until_complete, policy.run(failing([ValueError()])))
+        self.assertEqual(tries, 1)
+
+        # Too many failures
+        tries = 0
+        self.assertRaises(ConnectionError, loop.run_until_complete, policy.run(failing([ConnectionError()] * 3)))
+        self.assertEqual(tries, 3)
+
+        tries = 0
+        run = policy.run(failing([ConnectionError()] * 2), retries=1, exhausted=lambda e, n: RuntimeError(f"{n}"))
+        self.assertRaisesRegex(RuntimeError, "2", loop.run_until_complete, run)
+
+        # Waiting does not block others
+        async def concurrently():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            start = time.monotonic()
+            await policy.run(failing([ConnectionError(), ConnectionError()]))
+            ticker.cancel()
+            return ticks, time.monotonic() - start
+
+        ticks, seconds = loop.run_until_complete(concurrently())
+        self.assertGreaterEqual(seconds, 0.15)
+        self.assertGreater(ticks, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from typing import Optional, List
+from unittest.mock import patch
+
+import aiohttp
+import tiktoken
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from cjw.utilities.embedding.AdaEmbedding import AdaEmbedding
+from cjw.utilities.llm.TokenCounter import TokenCounter
+
+
+class FakeOpenAI:
+    """An imitation of the OpenAI embeddings API, embedding a text into its length.  It fails as asked."""
+
+    def __init__(self):
+        self.requests: List[List[str]] = []
+        self.failures: List[int] = []   # Statuses to answer the next requests with
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.server: Optional[TestServer] = None
+
+        self.app = web.Application()
+        self.app.add_routes([web.post("/v1/embeddings", self.embeddings)])
+
+    async def start(self) -> str:
+        self.server = TestServer(self.app)
+        await self.server.start_server()
+        return str(self.server.make_url("/v1"))
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        assert request.headers["Authorization"] == "Bearer test key"
+        if self.failures:
+            return web.json_response({"error": "failed"}, status=self.failures.pop(0), headers={"Retry-After": "0"})
+
+        body = await request.json()
+        self.requests.append(body["input"])
+
+        self.inFlight += 1
+        self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        await asyncio.sleep(0.01)
+        self.inFlight -= 1
+
+        # In reverse, as the order is given by the index
+        data = [{"index": i, "embedding": [len(t), 1.0]} for i, t in enumerate(body["input"])]
+        return web.json_response({"data": data[::-1], "model": body["model"]})
+
+
+class AdaEmbeddingTest(unittest.TestCase):
+
+    def test_embed(self):
+        loop = asyncio.get_event_loop()
+        fake = FakeOpenAI()
+        serverUrl = loop.run_until_complete(fake.start())
+
+        embedding = AdaEmbedding(
+            "test key", serverUrl=serverUrl, batchSize=10, batchTokens=100, concurrency=2, countTokens=len
+        )
+        try:
+            texts = ["x" * (i % 30) for i in range(100)]
+            vectors = loop.run_until_complete(embedding.embedBatch(texts))
+
+            self.assertEqual([len(t) or None for t in texts], [v[0] if v is not None else None for v in vectors])
+
+            # Packed under the limits, and sent concurrently under the limit
+            self.assertEqual(sum([len(r) for r in fake.requests]), 96)
+            self.assertTrue(all([len(r) <= 10 and sum(map(len, r)) <= 100 for r in fake.requests]))
+            self.assertEqual(fake.maxInFlight, 2)
+
+            # Retried
+            fake.failures = [429, 503]
+            self.assertEqual(loop.run_until_complete(embedding.embed("abc"))[0], 3)
+
+            fake.failures = [400]
+            self.assertRaises(aiohttp.ClientResponseError, loop.run_until_complete, embedding.embed("abc"))
+
+            fake.failures = [503] * 4
+            self.assertRaises(aiohttp.ClientResponseError, loop.run_until_complete, embedding.embed("abc"))
+
+        finally:
+            loop.run_until_complete(embedding.close())
+            loop.run_until_complete(fake.server.close())
+
+    def test_batches(self):
+        # An encoding of a token a byte, that needs no download
+        encoding = tiktoken.Encoding(
+            name="bytes", pat_str=r"\S+|\s+", mergeable_ranks={bytes([i]): i for i in range(256)}, special_tokens={}
+        )
+        counter = TokenCounter(encoding=encoding)
+        embedding = AdaEmbedding("test key", batchSize=10, batchTokens=100, countTokens=counter)
+
+        texts = ["x" * (i % 30) for i in range(100)]
+        with patch.object(counter, "countBatch", wraps=counter.countBatch) as countBatch:
+            batches = embedding._batches(texts)
+            countBatch.assert_called_once_with(texts)   # Counted together
+
+        self.assertEqual(sorted([i for b in batches for i in b]), list(range(100)))
+        self.assertTrue(all([len(b) <= 10 and sum([len(texts[i]) for i in b]) <= 100 for b in batches]))
+
+
+if __name__ == '__main__':
+    unittest.main()
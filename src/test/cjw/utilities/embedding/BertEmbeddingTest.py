@@ -1,5 +1,10 @@
+import asyncio
+import importlib.util
+import pickle
 import unittest
 
+import numpy as np
+
 from cjw.utilities.Languages import Languages
 from cjw.utilities.embedding.BertEmbedding import BertEmbedding
 
@@ -43,6 +48,73 @@ class BertEmbeddingTest(unittest.TestCase):
 
         print(vector)
 
+    def test_embedBatch(self):
+        articles = [
+            "M-137 is a state trunkline highway in Michigan.  It runs to Interlochen.",
+            "",
+            "预告：27日15时《李献计历险记》首映发布会。点击进入电影《李献计》首映发布会直播间。",
+        ]
+        bert = BertEmbedding("distilbert-multilingual-nli-stsb-quora-ranking")
+        loop = asyncio.get_event_loop()
+
+        vectors = loop.run_until_complete(bert.embedBatch(articles, batchSize=2))
+        self.assertIsNone(vectors[1])
+
+        for article, vector in zip(articles, vectors):
+            if vector is not None:
+                _, sentenceVectors = bert.embedSentences(article)
+                self.assertTrue(np.allclose(vector, np.mean(sentenceVectors, axis=0), atol=1e-4))
+
+    def test_warmup(self):
+        bert = BertEmbedding("distilbert-multilingual-nli-stsb-quora-ranking")
+        bert.warmup()
+        vector = asyncio.get_event_loop().run_until_complete(bert.embed("M-137 is a highway."))
+        self.assertEqual(len(vector), bert.model.config.hidden_size)
+
+    def test_pickle(self):
+        bert = BertEmbedding("distilbert-multilingual-nli-stsb-quora-ranking", backend="int8")
+        bert.warmup()
+        copied = pickle.loads(pickle.dumps(bert))
+        self.assertEqual((copied.modelName, copied.backend), (bert.modelName, bert.backend))
+
+        # The model is loaded again in the copy
+        loop = asyncio.get_event_loop()
+        self.assertTrue(np.allclose(
+            loop.run_until_complete(copied.embed("M-137 is a highway.")),
+            loop.run_until_complete(bert.embed("M-137 is a highway.")),
+            atol=1e-5
+        ))
+
+    def _parity(self, backend: str) -> float:
+        articles = [
+            "M-137 is a state trunkline highway in Michigan.  It runs to Interlochen.",
+            "预告：27日15时《李献计历险记》首映发布会。点击进入电影《李献计》首映发布会直播间。",
+        ]
+        loop = asyncio.get_event_loop()
+        reference = loop.run_until_complete(
+            BertEmbedding("distilbert-multilingual-nli-stsb-quora-ranking").embedBatch(articles)
+        )
+        vectors = loop.run_until_complete(
+            BertEmbedding("distilbert-multilingual-nli-stsb-quora-ranking", backend=backend).embedBatch(articles)
+        )
+
+        return min([
+            np.dot(r, v) / (np.linalg.norm(r) * np.linalg.norm(v)) for r, v in zip(reference, vectors)
+        ])
+
+    def test_int8(self):
+        self.assertGreater(self._parity("int8"), 0.98)
+
+    @unittest.skipUnless(importlib.util.find_spec("onnxruntime"), "onnxruntime not installed")
+    def test_onnx(self):
+        self.assertGreater(self._parity("onnx"), 0.9999)
+
+        # Only the session is kept, not the torch model exported
+        bert = BertEmbedding("distilbert-multilingual-nli-stsb-quora-ranking", backend="onnx")
+        bert.warmup()
+        self.assertIsNotNone(bert.session)
+        self.assertIsNone(bert.model)
+
 
 if __name__ == '__main__':
     unittest.main()
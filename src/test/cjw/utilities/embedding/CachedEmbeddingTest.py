@@ -0,0 +1,68 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from typing import Optional
+
+import numpy as np
+
+from cjw.utilities.embedding.CachedEmbedding import CachedEmbedding
+from cjw.utilities.embedding.Embedding import Embedding
+
+
+class CountingEmbedding(Embedding):
+    """Embeds a text by its length, and counts the texts embedded."""
+    def __init__(self):
+        self.embedded = 0
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        self.embedded += 1
+        return np.array([len(text), 1.0], dtype=np.float32) if text.strip() else None
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        self.embedded += 1
+        return np.array([len(text), 2.0], dtype=np.float32)
+
+
+class CachedEmbeddingTest(unittest.TestCase):
+
+    def test_cache(self):
+        loop = asyncio.get_event_loop()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "embeddings.db")
+            counting = CountingEmbedding()
+            embedding = CachedEmbedding(counting, path=path, capacity=2)
+
+            vectors = loop.run_until_complete(embedding.embedBatch(["one", "three", "one", "", "one "]))
+            self.assertEqual(counting.embedded, 3)
+            self.assertEqual([3, 5, 3], [v[0] for v in vectors[:3]])
+            self.assertIsNone(vectors[3])
+            self.assertEqual(vectors[4][0], 3)  # Same as "one" after normalizing the spaces
+
+            # embed and embed1 are cached separately
+            self.assertEqual(loop.run_until_complete(embedding.embed1("one"))[1], 2.0)
+            self.assertEqual(loop.run_until_complete(embedding.embed("one"))[1], 1.0)
+            self.assertEqual(counting.embedded, 4)
+
+            # Evicted from the memory, but still in the file
+            loop.run_until_complete(embedding.embedBatch(["a", "bb", "three"]))
+            self.assertEqual(counting.embedded, 6)
+            self.assertEqual(embedding.stats()["size"], 2)
+            embedding.close()
+
+            # Survives a restart, but not a change of the model
+            counting = CountingEmbedding()
+            embedding = CachedEmbedding(counting, path=path)
+            self.assertEqual(loop.run_until_complete(embedding.embed("three"))[0], 5)
+            self.assertIsNone(loop.run_until_complete(embedding.embed("  ")))
+            self.assertEqual(counting.embedded, 0)
+            embedding.close()
+
+            embedding = CachedEmbedding(counting, path=path, modelName="other")
+            loop.run_until_complete(embedding.embed("three"))
+            self.assertEqual(counting.embedded, 1)
+            embedding.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
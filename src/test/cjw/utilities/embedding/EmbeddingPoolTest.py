@@ -0,0 +1,50 @@
+import asyncio
+import os
+import unittest
+from typing import Optional, List
+
+import numpy as np
+
+from cjw.utilities.embedding.Embedding import Embedding
+from cjw.utilities.embedding.EmbeddingPool import EmbeddingPool
+
+
+class ProcessEmbedding(Embedding):
+    """Embeds a text into its length, the process embedding it, and the size of its batch."""
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        return (await self.embedBatch([text]))[0]
+
+    async def embed1(self, text: str) -> Optional[np.ndarray]:
+        return np.array([len(text), os.getpid(), 0])
+
+    async def embedBatch(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        return [np.array([len(t), os.getpid(), len(texts)]) if t else None for t in texts]
+
+
+class EmbeddingPoolTest(unittest.TestCase):
+
+    def test_pool(self):
+        loop = asyncio.get_event_loop()
+        pool = EmbeddingPool(ProcessEmbedding(), workers=2, batchSize=8, delay=0.05)
+        try:
+            texts = [("x" * i) for i in range(20)]
+
+            # Concurrent callers are batched together
+            vectors = loop.run_until_complete(asyncio.gather(*[pool.embed(t) for t in texts]))
+            self.assertIsNone(vectors[0])
+            self.assertEqual(list(range(1, 20)), [v[0] for v in vectors[1:]])
+            self.assertTrue(all([v[1] != os.getpid() for v in vectors[1:]]))
+            self.assertEqual({8, 4}, {v[2] for v in vectors[1:]})
+
+            vectors = loop.run_until_complete(pool.embedBatch(texts))
+            self.assertEqual(list(range(1, 20)), [v[0] for v in vectors[1:]])
+            self.assertEqual({8, 4}, {v[2] for v in vectors[1:]})
+
+            self.assertEqual(loop.run_until_complete(pool.embed1("abc"))[0], 3)
+        finally:
+            loop.run_until_complete(pool.close())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,8 @@ import unittest
 from unittest.mock import patch, AsyncMock
 
 import requests
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
 from cjw.utilities.llm.GptPortal import GptPortal
 
@@ -143,6 +145,110 @@ The Kagas: Kaga is an intelligent species who lived on Luytan b.  A Kaga looks l
             self.assertEqual(result[4]["content"], 'patch 0/4 patch 1/4 patch 2/4 patch 3/4 patch 4/4')
             loop.close()
 
+    def test_pooledHttp(self):
+        connections = set()
+
+        async def completions(request: web.Request) -> web.Response:
+            connections.add(request.transport.get_extra_info("peername"))
+            self.assertEqual(request.headers["Authorization"], "Bearer test key")
+            body = await request.json()
+            return web.json_response({"choices": [{"text": f" {body['prompt']} done "}]})
+
+        async def run():
+            app = web.Application()
+            app.add_routes([web.post("/v1/completions", completions)])
+            server = TestServer(app)
+            await server.start_server()
+
+            gpt = GptPortal("test key", access="http", serverUrl=str(server.make_url("/v1")), limit=1)
+            try:
+                results = [await gpt.completion(f"prompt {i}") for i in range(3)]
+                results += await asyncio.gather(*[gpt.completion(f"prompt {i}") for i in range(3, 6)])
+            finally:
+                await gpt.close()
+                await server.close()
+            return results
+
+        results = asyncio.new_event_loop().run_until_complete(run())
+        self.assertEqual([f"prompt {i} done" for i in range(6)], results)
+        self.assertEqual(len(connections), 1)   # Kept alive, and reused
+
+    def test_httpRetry(self):
+        failures = []
+
+        async def completions(request: web.Request) -> web.Response:
+            if failures:
+                status, code = failures.pop(0)
+                return web.json_response({"error": {"message": "failed", "code": code}}, status=status,
+                                         headers={"Retry-After": "0"})
+            return web.json_response({"choices": [{"text": "done"}]})
+
+        async def run():
+            app = web.Application()
+            app.add_routes([web.post("/v1/completions", completions)])
+            server = TestServer(app)
+            await server.start_server()
+
+            gpt = GptPortal("test key", access="http", serverUrl=str(server.make_url("/v1")))
+            try:
+                failures.extend([(429, "rate_limit_exceeded"), (503, None)])
+                self.assertEqual(await gpt.completion("prompt", retries=2), "done")
+
+                failures.extend([(503, None)] * 2)
+                with self.assertRaises(GptPortal.ServiceNotAvailableError):
+                    await gpt.completion("prompt", retries=1)
+
+                failures.extend([(429, "insufficient_quota"), (503, None)])
+                with self.assertRaises(GptPortal.ServiceNotAvailableError):
+                    await gpt.completion("prompt", retries=2)
+                self.assertEqual(len(failures), 1)   # Not retried
+            finally:
+                await gpt.close()
+                await server.close()
+
+        asyncio.new_event_loop().run_until_complete(run())
+
+    def test_streamChatCompletion(self):
+        requests = []
+
+        async def completions(request: web.Request) -> web.StreamResponse:
+            body = await request.json()
+            requests.append(body)
+            self.assertTrue(body["stream"])
+
+            # Cut off by length twice before completing
+            piece = len(requests)
+            finishReason = "length" if piece < 3 else "stop"
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+            for delta in [{"role": "assistant"}, {"content": f"piece {piece}"}, {"content": "."}]:
+                chunk = {"choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            chunk = {"choices": [{"index": 0, "delta": {}, "finish_reason": finishReason}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+            await response.write_eof()
+            return response
+
+        async def run():
+            app = web.Application()
+            app.add_routes([web.post("/v1/chat/completions", completions)])
+            server = TestServer(app)
+            await server.start_server()
+
+            gpt = GptPortal("test key", access="http", serverUrl=str(server.make_url("/v1")))
+            try:
+                messages = [{"role": "user", "content": "Tell me"}]
+                return [delta async for delta in gpt.streamChatCompletion(messages, model="gpt-4")]
+            finally:
+                await gpt.close()
+                await server.close()
+
+        deltas = asyncio.new_event_loop().run_until_complete(run())
+        self.assertEqual(deltas, ["piece 1", ".", " ", "piece 2", ".", " ", "piece 3", "."])
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(requests[2]["messages"][1], {"role": "assistant", "content": "piece 1. piece 2."})
+
     def test_httpAccess(self):
         url = "https://api.openai.com/v1/chat/completions"
         key = os.environ['OPENAI_KEY']
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import patch
+
+import tiktoken
+
+from cjw.utilities.llm.TokenCounter import TokenCounter
+
+
+class TokenCounterTest(unittest.TestCase):
+    # An encoding of a token a byte, that needs no download
+    encoding = tiktoken.Encoding(
+        name="bytes",
+        pat_str=r"\S+|\s+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+
+    def test_count(self):
+        counter = TokenCounter(encoding=self.encoding, capacity=2)
+        self.assertEqual(counter.count("hello"), 5)
+        self.assertEqual(counter("hi there"), 8)
+        self.assertEqual(counter.count(""), 0)
+        self.assertEqual(counter.count(None), 0)
+
+        texts = ["abc", "", "hello", "abc", "de"]
+        with patch.object(self.encoding, "encode_ordinary_batch", wraps=self.encoding.encode_ordinary_batch) as batch:
+            self.assertEqual(counter.countBatch(texts), [3, 0, 5, 3, 2])
+            batch.assert_called_once_with(["abc", "de"])     # Memorized and repeated texts encoded once
+
+        # Only the latest counts memorized
+        with patch.object(self.encoding, "encode_ordinary_batch", wraps=self.encoding.encode_ordinary_batch) as batch:
+            self.assertEqual(counter.countBatch(texts), [3, 0, 5, 3, 2])
+            batch.assert_called_once_with(["hello"])
+
+    def test_countMessages(self):
+        counter = TokenCounter(encoding=self.encoding)
+        messages = [
+            {"role": "system", "content": "Be brief."},
+            {"role": "user", "content": "Hello", "name": "Max"},
+        ]
+        # Roles 6 + 4, contents 9 + 5, name 3, then 3 a message, 1 a name, and 3 for the reply
+        self.assertEqual(counter.countMessages(messages), 27 + 6 + 1 + 3)
+
+    def test_models(self):
+        try:
+            counter = TokenCounter.of("gpt-4")
+        except Exception as e:
+            self.skipTest(f"The encoding cannot be loaded: {e}")
+
+        self.assertEqual(counter.encoding.name, "cl100k_base")
+        self.assertIs(TokenCounter.of("gpt-4"), counter)
+        self.assertEqual(TokenCounter.of("unknown-model").encoding.name, "cl100k_base")
+        self.assertEqual(counter.count("hello world"), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()